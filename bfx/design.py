@@ -34,8 +34,9 @@ class Contrast:
 
     def __init__(self, name):
         self._name = name
-        self._controls = []
-        self._treatments = []
+        # Sample registries keep sample order and check sample membership in constant time
+        self._controls = SampleRegistry()
+        self._treatments = SampleRegistry()
 
     @property
     def name(self):
@@ -53,6 +54,7 @@ class Contrast:
 def parse_new_design_file(design_file, samples):
 
     log.info("Parse design file " + design_file + " ...")
+    samples_by_name = sample_registry(samples).samples_by_name
     design_csv = csv.DictReader(open(design_file, 'rb'), delimiter='\t')
 
     # Skip first column which is Sample
@@ -61,10 +63,8 @@ def parse_new_design_file(design_file, samples):
     for line in design_csv:
 
         sample_name = line['Sample']
-        matching_samples = [sample for sample in samples if sample.name == sample_name]
-        if matching_samples:
-            # There should be only one matching sample
-            sample = matching_samples[0]
+        if sample_name in samples_by_name:
+            sample = samples_by_name[sample_name]
         else:
             raise Exception("Error: sample " + sample_name + " in design file " + design_file + " not found in pipeline samples!")
 
@@ -88,6 +88,7 @@ def parse_new_design_file(design_file, samples):
 
 def parse_design_file(design_file, samples):
 
+    samples_by_name = sample_registry(samples).samples_by_name
     design_csv = csv.DictReader(open(design_file, 'rb'), delimiter='\t')
 
     # Skip first column which is Sample
@@ -96,10 +97,8 @@ def parse_design_file(design_file, samples):
     for line in design_csv:
 
         sample_name = line['Sample']
-        matching_samples = [sample for sample in samples if sample.name == sample_name]
-        if matching_samples:
-            # There should be only one matching sample
-            sample = matching_samples[0]
+        if sample_name in samples_by_name:
+            sample = samples_by_name[sample_name]
         else:
             raise Exception("Error: sample " + sample_name + " in design file " + design_file + " not found in pipeline samples!")
 
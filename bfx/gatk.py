@@ -25,7 +25,7 @@
 from core.config import *
 from core.job import *
 
-def base_recalibrator(input, output):
+def base_recalibrator(input, output, intervals=[]):
 
     return Job(
         [input],
@@ -41,7 +41,7 @@ java -Djava.io.tmpdir={tmp_dir} {java_other_options} -Xmx{ram} -jar $GATK_JAR \\
   --input_file {input} \\
   --reference_sequence {reference_sequence} \\
   --knownSites {known_sites} \\
-  --out {output}""".format(
+  --out {output}{intervals}""".format(
         tmp_dir=config.param('gatk_base_recalibrator', 'tmp_dir'),
         java_other_options=config.param('gatk_base_recalibrator', 'java_other_options'),
         ram=config.param('gatk_base_recalibrator', 'ram'),
@@ -49,7 +49,8 @@ java -Djava.io.tmpdir={tmp_dir} {java_other_options} -Xmx{ram} -jar $GATK_JAR \\
         input=input,
         reference_sequence=config.param('gatk_base_recalibrator', 'genome_fasta', type='filepath'),
         known_sites=config.param('gatk_base_recalibrator', 'known_variants', type='filepath'),
-        output=output
+        output=output,
+        intervals="".join(" \\\n  --intervals " + interval for interval in intervals)
         ),
         removable_files=[output]
     )
@@ -171,6 +172,29 @@ java -Djava.io.tmpdir={tmp_dir} {java_other_options} -Xmx{ram} -jar $GATK_JAR \\
         )
     )
 
+def gather_bqsr_reports(inputs, output):
+
+    return Job(
+        inputs,
+        [output],
+        [
+            ['gatk_gather_bqsr_reports', 'module_java'],
+            ['gatk_gather_bqsr_reports', 'module_gatk']
+        ],
+        command="""\
+java -Djava.io.tmpdir={tmp_dir} {java_other_options} -Xmx{ram} -cp $GATK_JAR \\
+  org.broadinstitute.gatk.tools.GatherBqsrReports \\
+  {inputs} \\
+  OUTPUT={output}""".format(
+        tmp_dir=config.param('gatk_gather_bqsr_reports', 'tmp_dir'),
+        java_other_options=config.param('gatk_gather_bqsr_reports', 'java_other_options'),
+        ram=config.param('gatk_gather_bqsr_reports', 'ram'),
+        inputs=" \\\n  ".join(["INPUT=" + input for input in inputs]),
+        output=output
+        ),
+        removable_files=[output]
+    )
+
 def genotype_gvcf(variants, output, options):
 
     return Job(
@@ -292,10 +316,10 @@ java -Djava.io.tmpdir={tmp_dir} {java_other_options} -Xmx{ram} -jar $GATK_JAR \\
         )
     )
 
-def print_reads(input, output, base_quality_score_recalibration):
+def print_reads(input, output, base_quality_score_recalibration, intervals=[]):
 
     return Job(
-        [input],
+        [input, base_quality_score_recalibration],
         [output, re.sub("\.([sb])am$", ".\\1ai", output)],
         [
             ['gatk_print_reads', 'module_java'],
@@ -308,7 +332,7 @@ java -Djava.io.tmpdir={tmp_dir} {java_other_options} -Xmx{ram} -jar $GATK_JAR \\
   --input_file {input} \\
   --reference_sequence {reference_sequence} \\
   --BQSR {base_quality_score_recalibration} \\
-  --out {output}""".format(
+  --out {output}{intervals}""".format(
         tmp_dir=config.param('gatk_print_reads', 'tmp_dir'),
         java_other_options=config.param('gatk_print_reads', 'java_other_options'),
         ram=config.param('gatk_print_reads', 'ram'),
@@ -316,7 +340,8 @@ java -Djava.io.tmpdir={tmp_dir} {java_other_options} -Xmx{ram} -jar $GATK_JAR \\
         input=input,
         reference_sequence=config.param('gatk_print_reads', 'genome_fasta', type='filepath'),
         base_quality_score_recalibration=base_quality_score_recalibration,
-        output=output
+        output=output,
+        intervals="".join(" \\\n  --intervals " + interval for interval in intervals)
         )
     )
 
@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+
+################################################################################
+# Copyright (C) 2014, 2015 GenAP, McGill University and Genome Quebec Innovation Centre
+#
+# This file is part of MUGQIC Pipelines.
+#
+# MUGQIC Pipelines is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUGQIC Pipelines is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with MUGQIC Pipelines.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+
+# Python Standard Modules
+import bisect
+import heapq
+import logging
+import math
+import os
+import re
+import struct
+
+# MUGQIC Modules
+
+log = logging.getLogger(__name__)
+
+# Genome partitioning for scatter steps.
+#
+# Sequences are first cut into chunks of at most a fraction of the target partition size, for packing granularity.
+# Cuts are made in the middle of gaps (e.g. runs of N in the reference, given as a BED file) so that no interval
+# spans across a gap boundary, or anywhere in a sequence for tools processing positions independently, such as mpileup.
+# Chunks are then packed into partitions by longest-processing-time first bin packing or, if partition outputs
+# are concatenated in genome order afterwards (e.g. CatVariants, bcftools cat), into contiguous runs of chunks
+# minimizing the largest partition. Work is estimated by the number of non-gap bases or, given a CoverageProfile,
+# by the estimated number of reads.
+#
+# Intervals are dicts {'name', 'start', 'end', 'length', 'weight'} with 1-based inclusive coordinates,
+# 'length' being the whole sequence length. Partitions are dicts {'intervals', 'weight'}.
+
+def parse_gap_bed_file(gap_bed_file):
+    gaps = {}
+
+    log.info("Parse genome gap BED file " + gap_bed_file + " ...")
+
+    nb_gaps = 0
+    with open(gap_bed_file) as gbf:
+        for line in gbf:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) >= 3 and not re.search("^(#|track|browser)", line):
+                gaps.setdefault(fields[0], []).append((int(fields[1]), int(fields[2])))
+                nb_gaps += 1
+
+    for sequence_gaps in gaps.values():
+        sequence_gaps.sort()
+
+    log.info(str(nb_gaps) + " gaps parsed\n")
+
+    return gaps
+
+# Number of bases of 1-based inclusive interval start-end not covered by 0-based half-open BED gaps
+def non_gap_length(start, end, sequence_gaps):
+    length = end - start + 1
+    for gap_start, gap_end in sequence_gaps:
+        length -= max(0, min(end, gap_end) - max(start - 1, gap_start))
+    return length
+
+def sequence_interval(sequence, start, end, sequence_gaps, profile=None):
+    return {'name': sequence['name'], 'start': start, 'end': end, 'length': sequence['length'], 'weight': profile.weight(sequence['name'], start, end) if profile else non_gap_length(start, end, sequence_gaps)}
+
+# Per-read index statistics of a BAM index (.bai) file, as a list with, for each reference in BAM header order,
+# a tuple (number of mapped reads, linear index compressed file offsets of each 16 kb tile, end compressed file offset).
+# References without any bin, as written by htslib and Picard for references with no reads, have 0 mapped reads.
+# Return None if the index has no mapped read counts, which are optional in the BAI format.
+def parse_bam_index_file(bam_index_file):
+    with open(bam_index_file, 'rb') as bif:
+        data = bif.read()
+
+    if data[0:4] != "BAI\1":
+        raise Exception("Error: " + bam_index_file + " is not a BAM index file!")
+
+    references = []
+    position = 8
+    for reference_idx in range(struct.unpack_from("<i", data, 4)[0]):
+        nb_mapped_reads = None
+        end_offset = 0
+        nb_bins = struct.unpack_from("<i", data, position)[0]
+        position += 4
+        for bin_idx in range(nb_bins):
+            bin, nb_chunks = struct.unpack_from("<Ii", data, position)
+            position += 8
+            chunks = struct.unpack_from("<" + str(2 * nb_chunks) + "Q", data, position)
+            position += 16 * nb_chunks
+            if bin == 37450:
+                # Pseudo-bin of reference statistics: unmapped reads file offsets, then mapped and unmapped read counts
+                nb_mapped_reads = chunks[2]
+            else:
+                end_offset = max([end_offset] + [chunk_end >> 16 for chunk_end in chunks[1::2]])
+        nb_tiles = struct.unpack_from("<i", data, position)[0]
+        position += 4
+        tile_offsets = [tile_offset >> 16 for tile_offset in struct.unpack_from("<" + str(nb_tiles) + "Q", data, position)]
+        position += 8 * nb_tiles
+
+        if nb_bins == 0:
+            nb_mapped_reads = 0
+        elif nb_mapped_reads is None:
+            return None
+        references.append((nb_mapped_reads, tile_offsets, end_offset))
+
+    return references
+
+# Distribution of reads along the genome, summed over BAM files and estimated from their indexes:
+# the compressed size of alignments starting in each 16 kb tile, scaled to the reference mapped read count.
+class CoverageProfile(object):
+
+    tile_size = 16384
+
+    def __init__(self, sequence_dictionary):
+        # Sequence name -> cumulative number of reads at each tile boundary
+        self._cumulative_reads = {}
+        self._sequence_lengths = dict([(sequence['name'], sequence['length']) for sequence in sequence_dictionary])
+        self._sequence_names = [sequence['name'] for sequence in sequence_dictionary]
+
+    # Add reads of a BAM index file whose references are the sequences of the dictionary, in the same order
+    def add_bam_index_file(self, bam_index_file):
+        references = parse_bam_index_file(bam_index_file)
+        if references is None:
+            raise Exception("Error: BAM index file " + bam_index_file + " has no mapped read counts!")
+        if len(references) != len(self._sequence_names):
+            raise Exception("Error: BAM index file " + bam_index_file + " has " + str(len(references)) + " references instead of the " + str(len(self._sequence_names)) + " genome dictionary sequences!")
+
+        for name, (nb_mapped_reads, tile_offsets, end_offset) in zip(self._sequence_names, references):
+            # Tiles without alignments have a 0 offset or the offset of the next non-empty tile, depending on the indexer
+            for tile_idx in reversed(range(len(tile_offsets) - 1)):
+                if tile_offsets[tile_idx] == 0:
+                    tile_offsets[tile_idx] = tile_offsets[tile_idx + 1]
+            tile_sizes = [max(next_offset - tile_offset, 0) for tile_offset, next_offset in zip(tile_offsets, tile_offsets[1:] + [max(end_offset, tile_offsets[-1] if tile_offsets else 0)])]
+
+            total_size = sum(tile_sizes)
+            cumulative_reads = self._cumulative_reads.setdefault(name, [0])
+            if len(cumulative_reads) < len(tile_sizes) + 1:
+                cumulative_reads.extend([cumulative_reads[-1]] * (len(tile_sizes) + 1 - len(cumulative_reads)))
+            reads = 0
+            for tile_idx, tile_size in enumerate(tile_sizes):
+                if total_size:
+                    reads += tile_size * nb_mapped_reads / float(total_size)
+                cumulative_reads[tile_idx + 1] += reads
+            for tile_idx in range(len(tile_sizes) + 1, len(cumulative_reads)):
+                cumulative_reads[tile_idx] += reads
+
+    # Number of bases of a tile, the last tile of a sequence being usually shorter
+    def tile_length(self, name, tile_idx):
+        return min(self.tile_size, max(self._sequence_lengths[name] - tile_idx * self.tile_size, 1))
+
+    # Number of reads on bases 1 to position of a sequence, interpolated within tiles
+    def cumulative_weight(self, name, position):
+        cumulative_reads = self._cumulative_reads.get(name, [0])
+        tile_idx = position // self.tile_size
+        if tile_idx >= len(cumulative_reads) - 1:
+            return cumulative_reads[-1]
+        else:
+            return cumulative_reads[tile_idx] + (cumulative_reads[tile_idx + 1] - cumulative_reads[tile_idx]) * min((position - tile_idx * self.tile_size) / float(self.tile_length(name, tile_idx)), 1)
+
+    def weight(self, name, start, end):
+        return self.cumulative_weight(name, end) - self.cumulative_weight(name, start - 1)
+
+    # Smallest position of a sequence whose cumulative number of reads reaches weight
+    def position(self, name, weight):
+        cumulative_reads = self._cumulative_reads.get(name, [0])
+        tile_idx = bisect.bisect_left(cumulative_reads, weight) - 1
+        if tile_idx < 0:
+            position = 1
+        elif tile_idx >= len(cumulative_reads) - 1:
+            position = self._sequence_lengths[name]
+        else:
+            position = tile_idx * self.tile_size + int(math.ceil((weight - cumulative_reads[tile_idx]) / (cumulative_reads[tile_idx + 1] - cumulative_reads[tile_idx]) * self.tile_length(name, tile_idx)))
+        return min(max(position, 1), self._sequence_lengths[name])
+
+# Return interval as a samtools/GATK region, the sequence name alone if the interval covers the whole sequence
+def interval_string(interval):
+    if interval['start'] == 1 and interval['end'] == interval['length']:
+        return interval['name']
+    else:
+        return interval['name'] + ":" + str(interval['start']) + "-" + str(interval['end'])
+
+def genome_weight(sequence_dictionary, gaps={}, profile=None):
+    return sum([sequence_interval(sequence, 1, sequence['length'], gaps.get(sequence['name'], []), profile)['weight'] for sequence in sequence_dictionary])
+
+# Cut sequences into intervals of at most chunk_size non-gap bases (or reads given a profile), in sequence dictionary order.
+# Sequences are cut in the middle of gaps only, unless split_anywhere is True.
+def genome_chunks(sequence_dictionary, chunk_size, gaps={}, split_anywhere=False, profile=None):
+    chunk_size = max(chunk_size, 1)
+    chunks = []
+
+    for sequence in sequence_dictionary:
+        sequence_gaps = gaps.get(sequence['name'], [])
+
+        # Smallest intervals between cuts, i.e. the last base of each interval, in the middle of each gap
+        cuts = sorted(set([cut for cut in [(gap_start + gap_end) // 2 for gap_start, gap_end in sequence_gaps] if 1 <= cut < sequence['length']]))
+        atoms = []
+        start = 1
+        for end in cuts + [sequence['length']]:
+            atom = sequence_interval(sequence, start, end, sequence_gaps, profile)
+            if split_anywhere and atom['weight'] > chunk_size:
+                nb_pieces = int(math.ceil(atom['weight'] / float(chunk_size)))
+                if profile:
+                    # Pieces of equal number of reads
+                    start_weight = profile.cumulative_weight(sequence['name'], start - 1)
+                    piece_ends = [profile.position(sequence['name'], start_weight + atom['weight'] * piece_idx / nb_pieces) for piece_idx in range(1, nb_pieces)]
+                else:
+                    piece_length = int(math.ceil((end - start + 1) / float(nb_pieces)))
+                    piece_ends = range(start + piece_length - 1, end, piece_length)
+                piece_start = start
+                for piece_end in sorted(set([piece_end for piece_end in piece_ends if start <= piece_end < end])) + [end]:
+                    atoms.append(sequence_interval(sequence, piece_start, piece_end, sequence_gaps, profile))
+                    piece_start = piece_end + 1
+            else:
+                atoms.append(atom)
+            start = end + 1
+
+        # Merge consecutive intervals as long as they fit in a chunk
+        chunk = None
+        for atom in atoms:
+            if chunk and chunk['weight'] + atom['weight'] <= chunk_size:
+                chunk['end'] = atom['end']
+                chunk['weight'] += atom['weight']
+            else:
+                if chunk:
+                    chunks.append(chunk)
+                chunk = atom
+        chunks.append(chunk)
+
+    return chunks
+
+# Longest-processing-time first: each chunk, from the largest, goes to the currently lightest partition.
+# Return partitions as lists of chunk indices.
+def longest_processing_time_groups(chunks, nb_groups):
+    heap = [(0, idx, []) for idx in range(nb_groups)]
+    for chunk_idx in sorted(range(len(chunks)), key=lambda chunk_idx: -chunks[chunk_idx]['weight']):
+        weight, idx, group = heapq.heappop(heap)
+        group.append(chunk_idx)
+        heapq.heappush(heap, (weight + chunks[chunk_idx]['weight'], idx, group))
+    return [group for weight, idx, group in heap]
+
+def fill_contiguous_groups(chunks, capacity):
+    groups = [[]]
+    weight = 0
+    for chunk_idx, chunk in enumerate(chunks):
+        if groups[-1] and weight + chunk['weight'] > capacity:
+            groups.append([])
+            weight = 0
+        groups[-1].append(chunk_idx)
+        weight += chunk['weight']
+    return groups
+
+# Contiguous runs of chunks in genome order, with the smallest capacity allowing at most nb_groups runs.
+# Return partitions as lists of chunk indices.
+def contiguous_groups(chunks, nb_groups):
+    low = int(math.ceil(max([chunk['weight'] for chunk in chunks])))
+    high = int(math.ceil(sum([chunk['weight'] for chunk in chunks])))
+    while low < high:
+        capacity = (low + high) // 2
+        if len(fill_contiguous_groups(chunks, capacity)) <= nb_groups:
+            high = capacity
+        else:
+            low = capacity + 1
+    return fill_contiguous_groups(chunks, low)
+
+# Return at most nb_partitions balanced partitions covering all sequences, in genome order of their first interval.
+# Adjacent intervals of a partition are merged.
+def partition_genome(sequence_dictionary, nb_partitions, gaps={}, ordered=False, split_anywhere=False, chunks_per_partition=4, profile=None):
+    chunks = genome_chunks(sequence_dictionary, int(math.ceil(genome_weight(sequence_dictionary, gaps, profile) / float(nb_partitions * chunks_per_partition))), gaps, split_anywhere, profile)
+    if not chunks:
+        return []
+
+    if ordered:
+        groups = contiguous_groups(chunks, nb_partitions)
+    else:
+        groups = longest_processing_time_groups(chunks, nb_partitions)
+
+    partitions = []
+    for group in sorted([sorted(group) for group in groups if group]):
+        intervals = []
+        for chunk_idx in group:
+            chunk = chunks[chunk_idx]
+            if intervals and intervals[-1]['name'] == chunk['name'] and intervals[-1]['end'] + 1 == chunk['start']:
+                intervals[-1] = dict(intervals[-1], end=chunk['end'], weight=intervals[-1]['weight'] + chunk['weight'])
+            else:
+                intervals.append(dict(chunk))
+        partitions.append({'intervals': intervals, 'weight': sum([interval['weight'] for interval in intervals])})
+
+    return partitions
+
+# Log the expected imbalance of partitions (or intervals) of a scatter step, i.e. largest over mean weight,
+# weights being in millions of bases, or of reads given a profile
+def log_partition_balance(step_name, partitions, profile=None):
+    if partitions:
+        weights = [partition['weight'] for partition in partitions]
+        mean_weight = sum(weights) / float(len(weights))
+        unit = " M reads" if profile else " Mb"
+        log.info(step_name + ": " + str(len(weights)) + " genome partition" + ("s" if len(weights) > 1 else "") + ", largest " + "%.1f" % (max(weights) / 1e6) + unit + ", mean " + "%.1f" % (mean_weight / 1e6) + unit + ", expected imbalance " + ("%.2f" % (max(weights) / mean_weight) if mean_weight else "n/a") + "\n")
+
+# Partitions saved by write_partition_file(), or None if they were planned with different parameters
+def parse_partition_file(partition_file, parameters):
+    partitions = []
+    with open(partition_file) as pf:
+        if pf.readline().rstrip("\n") != "#" + parameters:
+            return None
+        for line in pf:
+            partition_idx, name, start, end, length, weight = line.rstrip("\n").split("\t")
+            if int(partition_idx) == len(partitions):
+                partitions.append({'intervals': [], 'weight': 0})
+            interval = {'name': name, 'start': int(start), 'end': int(end), 'length': int(length), 'weight': float(weight)}
+            partitions[-1]['intervals'].append(interval)
+            partitions[-1]['weight'] += interval['weight']
+    return partitions
+
+# Save partitions with a description of their planning parameters
+def write_partition_file(partition_file, parameters, partitions):
+    if not os.path.isdir(os.path.dirname(partition_file)):
+        os.makedirs(os.path.dirname(partition_file))
+    with open(partition_file, 'w') as pf:
+        pf.write("#" + parameters + "\n")
+        for partition_idx, partition in enumerate(partitions):
+            for interval in partition['intervals']:
+                pf.write("\t".join([str(partition_idx), interval['name'], str(interval['start']), str(interval['end']), str(interval['length']), str(interval['weight'])]) + "\n")
@@ -151,6 +151,29 @@ java -Djava.io.tmpdir={tmp_dir} {java_other_options} -Xmx{ram} -jar $PICARD_HOME
         removable_files=[output, re.sub("\.([sb])am$", ".\\1ai", output), output + ".md5"]
     )
 
+def gather_bam_files(inputs, output):
+
+    return Job(
+        inputs,
+        [output, re.sub("\.([sb])am$", ".\\1ai", output)],
+        [
+            ['picard_gather_bam_files', 'module_java'],
+            ['picard_gather_bam_files', 'module_picard']
+        ],
+        command="""\
+java -Djava.io.tmpdir={tmp_dir} {java_other_options} -Xmx{ram} -jar $PICARD_HOME/GatherBamFiles.jar \\
+  VALIDATION_STRINGENCY=SILENT CREATE_INDEX=true \\
+  TMP_DIR={tmp_dir} \\
+  {inputs} \\
+  OUTPUT={output}""".format(
+        tmp_dir=config.param('picard_gather_bam_files', 'tmp_dir'),
+        java_other_options=config.param('picard_gather_bam_files', 'java_other_options'),
+        ram=config.param('picard_gather_bam_files', 'ram'),
+        inputs=" \\\n  ".join(["INPUT=" + input for input in inputs]),
+        output=output
+        )
+    )
+
 def mark_duplicates(inputs, output, metrics_file):
 
     return Job(
@@ -106,16 +106,15 @@ class IlluminaReadset(Readset):
 
 def parse_illumina_readset_file(illumina_readset_file):
     readsets = []
-    samples = []
+    samples = SampleRegistry()
 
     log.info("Parse Illumina readset file " + illumina_readset_file + " ...")
     readset_csv = csv.DictReader(open(illumina_readset_file, 'rb'), delimiter='\t')
     for line in readset_csv:
         sample_name = line['Sample']
-        sample_names = [sample.name for sample in samples]
-        if sample_name in sample_names:
+        if sample_name in samples.samples_by_name:
             # Sample already exists
-            sample = samples[sample_names.index(sample_name)]
+            sample = samples.samples_by_name[sample_name]
         else:
             # Create new sample
             sample = Sample(sample_name)
@@ -268,6 +267,11 @@ def parse_illumina_raw_readset_files(output_dir, run_type, nanuq_readset_file, c
         readsets.append(readset)
         sample.add_readset(readset)
 
+    # Readset name -> first readset with this name, to find Casava sheet readsets in constant time
+    readset_index = {}
+    for readset in readsets:
+        readset_index.setdefault(readset.name, readset)
+
     # Parsing Casava sheet
     log.info("Parsing Casava sample sheet " + casava_sheet_file + " ...")
     casava_csv = csv.DictReader(open(casava_sheet_file, 'rb'), delimiter=',')
@@ -275,7 +279,10 @@ def parse_illumina_raw_readset_files(output_dir, run_type, nanuq_readset_file, c
         if int(line['Lane']) != lane:
             continue
         processing_sheet_id = line['SampleID']
-        readset = [x for x in readsets if x.name == processing_sheet_id][0]
+        if processing_sheet_id not in readset_index:
+            raise Exception("Error: readset \"" + processing_sheet_id + "\" (SampleID) of Casava sheet " + casava_sheet_file +
+                " lane " + str(lane) + " not found in Nanuq readset file " + nanuq_readset_file + "!")
+        readset = readset_index[processing_sheet_id]
         readset._flow_cell = line['FCID']
         readset._index = line['Index']
         readset._description = line['Description']
@@ -365,16 +372,15 @@ class PacBioReadset(Readset):
 
 def parse_pacbio_readset_file(pacbio_readset_file):
     readsets = []
-    samples = []
+    samples = SampleRegistry()
 
     log.info("Parse PacBio readset file " + pacbio_readset_file + " ...")
     readset_csv = csv.DictReader(open(pacbio_readset_file, 'rb'), delimiter='\t')
     for line in readset_csv:
         sample_name = line['Sample']
-        sample_names = [sample.name for sample in samples]
-        if sample_name in sample_names:
+        if sample_name in samples.samples_by_name:
             # Sample already exists
-            sample = samples[sample_names.index(sample_name)]
+            sample = samples.samples_by_name[sample_name]
         else:
             # Create new sample
             sample = Sample(sample_name)
@@ -31,6 +31,8 @@ class Sample:
                 "\" is invalid (should match [a-zA-Z0-9_][a-zA-Z0-9_.-]*)!")
 
         self._readsets = []
+        # Readset name -> readset, to check readset name uniqueness in constant time
+        self._readset_index = {}
 
     def show(self):
         print("Sample -- name: " + self._name + ", readsets: " +
@@ -45,12 +47,96 @@ class Sample:
         return self._readsets
 
     def readsets_by_name(self, name):
-        return [readset for readset in self.readsets if readset.name == name]
+        return [self._readset_index[name]] if name in self._readset_index else []
 
     def add_readset(self, readset):
-        if self.readsets_by_name(readset.name):
+        if readset.name in self._readset_index:
             raise Exception("Error: readset name \"" + readset.name +
                 "\" already exists for sample \"" + self.name + "\"!")
         else:
             self.readsets.append(readset)
+            self._readset_index[readset.name] = readset
             readset._sample = self
+
+# List of samples in parsing order, indexed by name, shared by readset, design and tumor pair parsers.
+# Membership checks are made by name lookup, hence in constant time. Samples added with append() or extend()
+# are indexed incrementally, other list modifications index all samples again.
+class SampleRegistry(list):
+
+    def __init__(self, samples=None):
+        super(SampleRegistry, self).__init__()
+        # Sample name -> first sample with this name
+        self._samples_by_name = {}
+        self.extend(samples or [])
+
+    @property
+    def samples_by_name(self):
+        return self._samples_by_name
+
+    def _reindex(self):
+        self._samples_by_name = {}
+        for sample in self:
+            self._samples_by_name.setdefault(sample.name, sample)
+
+    def append(self, sample):
+        super(SampleRegistry, self).append(sample)
+        self._samples_by_name.setdefault(sample.name, sample)
+
+    def extend(self, samples):
+        for sample in samples:
+            self.append(sample)
+
+    def __iadd__(self, samples):
+        self.extend(samples)
+        return self
+
+    def insert(self, index, sample):
+        super(SampleRegistry, self).insert(index, sample)
+        self._reindex()
+
+    def remove(self, sample):
+        super(SampleRegistry, self).remove(sample)
+        self._reindex()
+
+    def pop(self, *args):
+        sample = super(SampleRegistry, self).pop(*args)
+        self._reindex()
+        return sample
+
+    def __setitem__(self, index, value):
+        super(SampleRegistry, self).__setitem__(index, value)
+        self._reindex()
+
+    def __delitem__(self, index):
+        super(SampleRegistry, self).__delitem__(index)
+        self._reindex()
+
+    # Simple slice modifications do not call __setitem__ and __delitem__ in Python 2
+    def __setslice__(self, start, end, samples):
+        super(SampleRegistry, self).__setslice__(start, end, samples)
+        self._reindex()
+
+    def __delslice__(self, start, end):
+        super(SampleRegistry, self).__delslice__(start, end)
+        self._reindex()
+
+    def __imul__(self, count):
+        super(SampleRegistry, self).__imul__(count)
+        self._reindex()
+        return self
+
+    # Reordering changes which sample is the first one with a given name
+    def sort(self, *args, **kwargs):
+        super(SampleRegistry, self).sort(*args, **kwargs)
+        self._reindex()
+
+    def reverse(self):
+        super(SampleRegistry, self).reverse()
+        self._reindex()
+
+    def __contains__(self, sample):
+        return self._samples_by_name.get(getattr(sample, "name", None)) is sample
+
+# Return samples as a sample registry, indexing them if they are not already
+def sample_registry(samples):
+    return samples if isinstance(samples, SampleRegistry) else SampleRegistry(samples)
@@ -55,7 +55,7 @@ class SampleTumorPair(object):
         return self._tumor
 
 def parse_tumor_pair_file(tumor_pair_file, samples):
-    samples_dict = dict((sample.name, sample) for sample in samples)
+    samples_dict = sample_registry(samples).samples_by_name
     tumor_pairs = dict()
 
     log.info("Parse Tumor Pair file " + tumor_pair_file + " ...")
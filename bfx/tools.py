@@ -28,6 +28,20 @@ from core.job import *
 
 ## functions for awk tools ##
 
+# Split a (gzipped) 4-line record FASTQ file into gzipped chunk files, dispatching records in turn to each chunk,
+# so that chunks of paired FASTQ files split the same way stay in sync
+def split_fastq(input, outputs):
+    return Job(
+        [input],
+        outputs,
+        command="""\
+zcat -f {input} | \\
+awk -v outputs="{outputs}" 'BEGIN {{nb_outputs = split(outputs, files, " ")}} {{print | ("gzip -1 > " files[int((NR - 1) / 4) % nb_outputs + 1])}}'""".format(
+        input=input,
+        outputs=" ".join(outputs)
+        )
+    )
+
 ## functions for python tools ##
 def py_addLengthRay (file_scaffolds_fasta, length_file, output):
     return Job(
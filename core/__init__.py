@@ -1 +1 @@
-__all__ = ["config", "job", "pipeline", "scheduler", "step"]
+__all__ = ["config", "critical_path", "disk_forecast", "early_clean", "job", "job_cache", "manifest", "pipeline", "profiler", "resource_sizing", "scatter_gather", "scheduler", "stat_cache", "step"]
@@ -21,13 +21,17 @@
 
 # Python Standard Modules
 import ConfigParser
-import glob
+import json
 import logging
+import multiprocessing.pool
 import os
 import re
 import subprocess
 import sys
 
+# MUGQIC Modules
+from stat_cache import *
+
 log = logging.getLogger(__name__)
 
 class Config(ConfigParser.SafeConfigParser):
@@ -35,18 +39,47 @@ class Config(ConfigParser.SafeConfigParser):
     def __init__(self):
         ConfigParser.SafeConfigParser.__init__(self)
 
+        # Memoized param() values by (section, option, required, type), cleared whenever config values change
+        self._param_cache = {}
+        # Section name -> section where its options are looked up, i.e. 'DEFAULT' for undefined sections,
+        # cleared whenever sections change
+        self._resolved_sections = {}
+
     @property
     def filepath(self):
         return self._filepath
 
-    def parse_files(self, config_files):
+    def parse_files(self, config_files, check_modules=True):
         # Make option names case sensitive
         self.optionxform = str
         for config_file in config_files:
             self.readfp(config_file)
-        self.check_modules()
+        self.clear_caches()
+        if check_modules:
+            self.check_modules()
+        else:
+            log.info("Module check skipped\n")
+
+    # Cache file of successful module checks, valid as long as MODULEPATH and module files do not change
+    @property
+    def module_check_cache_file(self):
+        return os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")), "mugqic_pipelines", "module_check_cache.json")
+
+    # Fingerprint of a module given MODULEPATH and the modification times of its module files,
+    # along with their parent directories which change when module versions are added or removed
+    def module_fingerprint(self, module):
+        module_path = os.environ.get("MODULEPATH", "")
+        fingerprint = [module_path]
+        for module_dir in module_path.split(":"):
+            if module_dir:
+                # Lmod module files may have a ".lua" extension
+                for path in [os.path.join(module_dir, module), os.path.join(module_dir, module) + ".lua", os.path.dirname(os.path.join(module_dir, module))]:
+                    if os.path.exists(path):
+                        fingerprint.append(path + ":" + str(os.path.getmtime(path)))
+        return "\n".join(fingerprint)
 
-    # Check by a system call if all modules defined in config files are available
+    # Check by a system call if all modules defined in config files are available.
+    # Checks are run concurrently, and modules successfully checked with the same fingerprint are not checked again.
     def check_modules(self):
         modules = []
 
@@ -58,23 +91,95 @@ class Config(ConfigParser.SafeConfigParser):
                     modules.append(value)
 
         log.info("Check modules...")
+
+        try:
+            with open(self.module_check_cache_file) as cache_file:
+                module_check_cache = json.load(cache_file)
+        except (IOError, ValueError):
+            module_check_cache = {}
+
+        fingerprints = dict([(module, self.module_fingerprint(module)) for module in modules])
+        unchecked_modules = [module for module in modules if module_check_cache.get(module) != fingerprints[module]]
+
+        if unchecked_modules:
+            nb_threads = min(self.param('DEFAULT', 'module_check_threads', required=False, type='posint') or 8, len(unchecked_modules))
+            pool = multiprocessing.pool.ThreadPool(nb_threads)
+            try:
+                # Bash shell must be invoked in order to find "module" cmd
+                module_show_outputs = dict(zip(unchecked_modules, pool.map(lambda module: subprocess.check_output(["bash", "-c", "module show " + module], stderr=subprocess.STDOUT), unchecked_modules)))
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            module_show_outputs = {}
+
         for module in modules:
-            # Bash shell must be invoked in order to find "module" cmd
-            module_show_output = subprocess.check_output(["bash", "-c", "module show " + module], stderr=subprocess.STDOUT)
-            if re.search("Error", module_show_output, re.IGNORECASE):
-                raise Exception("Error in config file(s) with " + module + ":\n" + module_show_output)
+            if module in module_show_outputs:
+                if re.search("Error", module_show_outputs[module], re.IGNORECASE):
+                    raise Exception("Error in config file(s) with " + module + ":\n" + module_show_outputs[module])
+                else:
+                    module_check_cache[module] = fingerprints[module]
+                    log.info("Module " + module + " OK")
             else:
-                log.info("Module " + module + " OK")
+                log.info("Module " + module + " OK (cached)")
+
+        if unchecked_modules:
+            try:
+                if not os.path.isdir(os.path.dirname(self.module_check_cache_file)):
+                    os.makedirs(os.path.dirname(self.module_check_cache_file))
+                # Write to a temporary file first so that concurrent pipelines never read a partial cache file
+                with open(self.module_check_cache_file + "." + str(os.getpid()), 'w') as cache_file:
+                    json.dump(module_check_cache, cache_file, indent=1, sort_keys=True)
+                os.rename(self.module_check_cache_file + "." + str(os.getpid()), self.module_check_cache_file)
+            except (IOError, OSError) as e:
+                log.warning("Module check cache file " + self.module_check_cache_file + " could not be written: " + str(e))
         log.info("Module check finished\n")
 
+    def clear_caches(self):
+        self._param_cache.clear()
+        self._resolved_sections.clear()
+
+    def set(self, section, option, value=None):
+        ConfigParser.SafeConfigParser.set(self, section, option, value)
+        self.clear_caches()
+
+    def add_section(self, section):
+        ConfigParser.SafeConfigParser.add_section(self, section)
+        self.clear_caches()
+
+    def remove_section(self, section):
+        removed = ConfigParser.SafeConfigParser.remove_section(self, section)
+        self.clear_caches()
+        return removed
+
+    def remove_option(self, section, option):
+        removed = ConfigParser.SafeConfigParser.remove_option(self, section, option)
+        self.clear_caches()
+        return removed
+
+    # Return the section where options of a section are looked up, falling back to 'DEFAULT' for undefined sections
+    def resolve_section(self, section):
+        if section not in self._resolved_sections:
+            self._resolved_sections[section] = section if self.has_section(section) else 'DEFAULT'
+        return self._resolved_sections[section]
+
     # Retrieve param in config files with optional definition check and type validation
     # By default, parameter is required to be defined in one of the config file
+    # Values are memoized since param() is called for each job with the same arguments,
+    # and evaluating them requires value interpolation and, for paths, file system checks
     def param(self, section, option, required=True, type='string'):
+        key = (section, option, required, type)
+        if key not in self._param_cache:
+            self._param_cache[key] = self.evaluate_param(section, option, required, type)
+        value = self._param_cache[key]
+        # Return a copy of list values so that callers cannot modify memoized ones
+        return list(value) if isinstance(value, list) else value
+
+    def evaluate_param(self, section, option, required=True, type='string'):
         # Store original section for future error message, in case 'DEFAULT' section is used eventually
         original_section = section
 
-        if not self.has_section(section):
-            section = 'DEFAULT'
+        section = self.resolve_section(section)
 
         if self.has_option(section, option):
             try:
@@ -92,42 +197,42 @@ class Config(ConfigParser.SafeConfigParser):
                     return self.getboolean(section, option)
                 elif type == 'filepath':
                     value = os.path.expandvars(self.get(section, option))
-                    if os.path.isfile(value):
+                    if stat_cache.isfile(value):
                         return value
                     else:
                         raise Exception("File path \"" + value + "\" does not exist or is not a valid regular file!")
                 elif type == 'filepathlist':
                     value = [ os.path.expandvars(f).strip() for f in self.get(section, option).split(":") if f ]
                     for f in value:
-                        if not os.path.isfile(f):
+                        if not stat_cache.isfile(f):
                             raise Exception("File path \"" + f + "\" does not exist or is not a valid regular file!")
                             break
                     else:
                         return value
                 elif type == 'dirpath':
                     value = os.path.expandvars(self.get(section, option))
-                    if os.path.isdir(value):
+                    if stat_cache.isdir(value):
                         return value
                     else:
                         raise Exception("Directory path \"" + value + "\" does not exist or is not a valid directory!")
                 elif type == 'dirpathlist':
                     value = [ os.path.expandvars(f).strip() for f in self.get(section, option).split(":") if f ]
                     for f in value:
-                        if not os.path.isdir(f):
+                        if not stat_cache.isdir(f):
                             raise Exception("Directory path \"" + f + "\" does not exist or is not a valid directory!")
                     else:
                         return value
                 elif type == 'prefixpath':
                     value = os.path.expandvars(self.get(section, option))
-                    if glob.glob(value + "*"):
+                    if stat_cache.glob(value + "*"):
                         return value
                     else:
                         raise Exception("Prefix path \"" + value + "\" does not match any file!")
                 elif type == 'prefixpathlist':
                     value = [ os.path.expandvars(f).strip() for f in self.get(section, option).split(":") if f ]
                     for f in value:
-                        if not glob.glob(value + "*"):
-                            raise Exception("Prefix path \"" + value + "\" does not match any file!")
+                        if not stat_cache.glob(f + "*"):
+                            raise Exception("Prefix path \"" + f + "\" does not match any file!")
                     else:
                         return value
                 elif type == 'list':
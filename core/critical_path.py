@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+################################################################################
+# Copyright (C) 2014, 2015 GenAP, McGill University and Genome Quebec Innovation Centre
+#
+# This file is part of MUGQIC Pipelines.
+#
+# MUGQIC Pipelines is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUGQIC Pipelines is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with MUGQIC Pipelines.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+# Python Standard Modules
+import logging
+
+# MUGQIC Modules
+from config import *
+from scheduler import *
+
+log = logging.getLogger(__name__)
+
+# Critical path analysis of the job graph, given estimated job runtimes.
+#
+# Job runtime is estimated, in order, from "[job name prefix] estimated_runtime" config parameter
+# e.g. "estimated_runtime=2:30:00", else from cluster_walltime config parameter as an upper bound, else 1 hour.
+# For each job, the bottom level is the estimated runtime of the longest chain of jobs starting with it,
+# i.e. the minimal time left until the end of the pipeline once the job starts: jobs with the highest
+# bottom levels are the critical ones, which should start first.
+class CriticalPath(object):
+
+    def __init__(self, jobs):
+        self._jobs = jobs
+        self._runtimes = {}
+        self._bottom_levels = {}
+        self._dependent_jobs = dict([(job, []) for job in jobs])
+
+        # Jobs are in creation order, where dependencies always come before their dependent jobs
+        for job in jobs:
+            self._runtimes[job] = job_estimated_runtime(job)
+            for dependency_job in job.dependency_jobs:
+                self._dependent_jobs[dependency_job].append(job)
+        for job in reversed(jobs):
+            self._bottom_levels[job] = self._runtimes[job] + max([self._bottom_levels[dependent_job] for dependent_job in self._dependent_jobs[job]] or [0])
+
+        self._makespan = max(self._bottom_levels.values() or [0])
+
+    # Estimated pipeline duration in seconds, assuming all jobs can run as soon as their dependencies are done
+    @property
+    def makespan(self):
+        return self._makespan
+
+    def runtime(self, job):
+        return self._runtimes[job]
+
+    def bottom_level(self, job):
+        return self._bottom_levels[job]
+
+    # Return job priority between 0 and max_priority, proportional to its bottom level
+    def priority(self, job, max_priority=1023):
+        if self.makespan:
+            return int(round(float(max_priority) * self._bottom_levels[job] / self.makespan))
+        else:
+            return max_priority
+
+    # Return the list of jobs of the longest chain in the job graph
+    def jobs(self):
+        path = []
+        candidate_jobs = [job for job in self._jobs if not job.dependency_jobs]
+        while candidate_jobs:
+            job = max(candidate_jobs, key=lambda candidate_job: self._bottom_levels[candidate_job])
+            path.append(job)
+            candidate_jobs = self._dependent_jobs[job]
+        return path
+
+    def log_summary(self):
+        path = self.jobs()
+        log.info("Critical path: " + str(len(path)) + " job" + ("s" if len(path) > 1 else "") + ": " + " -> ".join([job.name + " (" + format_duration(self._runtimes[job]) + ")" for job in path]))
+        log.info("Estimated makespan: " + format_duration(self.makespan) + "\n")
+
+# Return job estimated runtime in seconds, the sum of its jobs for a packed job
+def job_estimated_runtime(job):
+    if getattr(job, "packed_jobs", None):
+        return sum([job_estimated_runtime(job_item) for job_item in job.packed_jobs])
+
+    # Config section must match job name prefix before first "."
+    # e.g. "[trimmomatic] estimated_runtime=..." for job name "trimmomatic.readset1"
+    job_name_prefix = job.name.split(".")[0]
+    if config.param(job_name_prefix, 'estimated_runtime', required=False):
+        return parse_duration(config.param(job_name_prefix, 'estimated_runtime'))
+
+    return parse_cluster_walltime(config.param(job_name_prefix, 'cluster_walltime', required=False)) or 3600
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+
+################################################################################
+# Copyright (C) 2014, 2015 GenAP, McGill University and Genome Quebec Innovation Centre
+#
+# This file is part of MUGQIC Pipelines.
+#
+# MUGQIC Pipelines is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUGQIC Pipelines is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with MUGQIC Pipelines.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+# Python Standard Modules
+import collections
+import logging
+import os
+
+# MUGQIC Modules
+from config import *
+from resource_sizing import *
+from scheduler import *
+from stat_cache import *
+
+log = logging.getLogger(__name__)
+
+# Disk usage forecast of jobs to run, per step and per output directory, i.e. first directory of output file paths
+# relative to the pipeline output directory.
+#
+# Jobs are walked in creation order. The output size of a job is its total input file size, either existing on
+# file system or forecast for files created by previous jobs to run, multiplied by the expansion ratio of its
+# job name prefix, then split between its output files according to the average share of each output file in the job
+# resource records of the prefix having the same number of output files, or evenly if there are none.
+# The expansion ratio is, in order, "[job name prefix] disk_expansion_ratio" config parameter, else the ratio of total
+# output to input sizes of the successful job resource records of the prefix (see resource_accounting), read from
+# this output directory and "[DEFAULT] resource_sizing_history_dirs", else 1.
+#
+# Disk usage is the difference with current file sizes; files removed with --early-clean are subtracted after
+# the last job removing them. Jobs run in parallel may keep more files at the same time than this sequential
+# walk does, hence the peak usage is a lower bound in that case.
+class DiskForecast(object):
+
+    def __init__(self, output_dir, step_range, history_dirs, early_clean=None):
+        self._output_dir = output_dir
+        self._early_clean = early_clean
+
+        # Job name prefix -> (total output bytes, total input bytes) of past runs
+        learned_sizes = {}
+        # (job name prefix, number of output files) -> total bytes of each output file of past runs
+        learned_file_sizes = {}
+        for record in job_resource_records(history_dirs):
+            job_name_prefix = record['job_name'].split(".")[0]
+            if record['input_bytes'] and record.get('output_bytes') is not None:
+                output_bytes, input_bytes = learned_sizes.get(job_name_prefix, (0, 0))
+                learned_sizes[job_name_prefix] = (output_bytes + record['output_bytes'], input_bytes + record['input_bytes'])
+            if record.get('output_files_bytes'):
+                file_sizes = learned_file_sizes.setdefault((job_name_prefix, len(record['output_files_bytes'])), [0] * len(record['output_files_bytes']))
+                for index, bytes in enumerate(record['output_files_bytes']):
+                    file_sizes[index] += bytes
+        self._learned_ratios = dict([(prefix, float(output_bytes) / input_bytes) for prefix, (output_bytes, input_bytes) in learned_sizes.items()])
+        self._learned_shares = dict([(key, [float(bytes) / sum(file_sizes) for bytes in file_sizes]) for key, file_sizes in learned_file_sizes.items() if sum(file_sizes)])
+        self._ratio_sources = collections.Counter()
+
+        # Absolute path -> forecast size of output files of jobs to run
+        self._file_sizes = {}
+        # List of (step name, number of jobs, forecast output bytes)
+        self._step_sizes = []
+        # Output directory -> [current usage difference, peak usage difference]
+        self._directory_usages = collections.OrderedDict()
+        self._usage = 0
+        self._peak_usage = 0
+
+        jobs = [job for step in step_range for job in step.jobs]
+        last_removing_jobs = {}
+        for job in jobs:
+            for path, done_files in getattr(job, "early_removable_files", None) or []:
+                last_removing_jobs[path] = job
+        removed_files = collections.defaultdict(list)
+        for path, job in last_removing_jobs.items():
+            removed_files[job].append(path)
+
+        for step in step_range:
+            step_bytes = 0
+            for job in step.jobs:
+                output_files = [job.abspath(output_file) for output_file in job.output_files]
+                output_bytes = sum([self.file_size(job.abspath(input_file)) for input_file in job.input_files]) * self.expansion_ratio(job)
+                step_bytes += output_bytes
+                shares = self._learned_shares.get((job.name.split(".")[0], len(output_files)), [1.0 / len(output_files)] * len(output_files))
+                for output_file, share in zip(output_files, shares):
+                    self.add_usage(output_file, output_bytes * share - self.current_size(output_file))
+                    self._file_sizes[output_file] = output_bytes * share
+                for path in sorted(removed_files[job]):
+                    self.add_usage(path, -self.file_size(path))
+            if step.jobs:
+                self._step_sizes.append((step.name, len(step.jobs), step_bytes))
+
+    # Return forecast size of a file created by a job to run, or its current size on file system
+    def file_size(self, path):
+        if path in self._file_sizes:
+            return self._file_sizes[path]
+        else:
+            return stat_cache.stat(path).st_size if stat_cache.isfile(path) else 0
+
+    # Return size of a file actually on file system, 0 if missing or removed with --early-clean
+    def current_size(self, path):
+        if (self._early_clean and self._early_clean.removed_files([path])) or not stat_cache.isfile(path):
+            return 0
+        else:
+            return stat_cache.stat(path).st_size
+
+    def expansion_ratio(self, job):
+        # Config section must match job name prefix before first "."
+        # e.g. "[trimmomatic] disk_expansion_ratio=..." for job name "trimmomatic.readset1"
+        job_name_prefix = job.name.split(".")[0]
+        if config.param(job_name_prefix, 'disk_expansion_ratio', required=False):
+            self._ratio_sources["config"] += 1
+            return config.param(job_name_prefix, 'disk_expansion_ratio', type='float')
+        elif job_name_prefix in self._learned_ratios:
+            self._ratio_sources["history"] += 1
+            return self._learned_ratios[job_name_prefix]
+        else:
+            self._ratio_sources["default"] += 1
+            return 1.0
+
+    # Return output directory of a file, relative to pipeline output directory if it is inside
+    def output_directory(self, path):
+        relative_path = os.path.relpath(path, self._output_dir)
+        if relative_path.startswith(".." + os.sep):
+            return os.path.dirname(path)
+        else:
+            return relative_path.split(os.sep)[0] if os.sep in relative_path else "."
+
+    def add_usage(self, path, bytes):
+        usage = self._directory_usages.setdefault(self.output_directory(path), [0, 0])
+        usage[0] += bytes
+        usage[1] = max(usage[1], usage[0])
+        self._usage += bytes
+        self._peak_usage = max(self._peak_usage, self._usage)
+
+    @property
+    def usage(self):
+        return self._usage
+
+    @property
+    def peak_usage(self):
+        return self._peak_usage
+
+    # Return available bytes on the file system of the output directory, or of its closest existing parent
+    def free_space(self):
+        path = self._output_dir
+        while not os.path.exists(path):
+            path = os.path.dirname(path)
+        stat_result = os.statvfs(path)
+        return stat_result.f_bavail * stat_result.f_frsize
+
+    def log_summary(self):
+        log.info("Disk forecast: expansion ratios of " + str(self._ratio_sources["config"]) + " jobs from config, " + str(self._ratio_sources["history"]) + " from job resource records, " + str(self._ratio_sources["default"]) + " set to 1")
+        for step_name, nb_jobs, step_bytes in self._step_sizes:
+            log.info("Disk forecast: step " + step_name + ": " + str(nb_jobs) + " job" + ("s" if nb_jobs > 1 else "") + " writing " + format_size(step_bytes))
+        for directory, (usage, peak_usage) in self._directory_usages.items():
+            log.info("Disk forecast: output directory " + directory + ": peak usage " + ("+" if peak_usage >= 0 else "") + format_size(peak_usage) + ", final usage " + ("+" if usage >= 0 else "") + format_size(usage))
+        free_space = self.free_space()
+        log.info("Disk forecast: TOTAL: peak usage " + ("+" if self.peak_usage >= 0 else "") + format_size(self.peak_usage) + ", final usage " + ("+" if self.usage >= 0 else "") + format_size(self.usage) + ", free space " + format_size(free_space) + "\n")
+        if self.peak_usage > free_space:
+            log.warning("Disk forecast: peak usage " + format_size(self.peak_usage) + " > free space " + format_size(free_space) + " on output directory file system!")
+
+# Return human readable size of a number of bytes e.g. "512B", "12.3M", "1.5T", with a "-" sign if negative
+def format_size(bytes):
+    for index, unit in enumerate("BKMGT"):
+        if abs(bytes) < 1024 ** (index + 1) or unit == "T":
+            return ("-" if bytes < 0 else "") + ("%d" if unit == "B" else "%.1f") % (abs(bytes) / 1024.0 ** index) + unit
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+
+################################################################################
+# Copyright (C) 2014, 2015 GenAP, McGill University and Genome Quebec Innovation Centre
+#
+# This file is part of MUGQIC Pipelines.
+#
+# MUGQIC Pipelines is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUGQIC Pipelines is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with MUGQIC Pipelines.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+# Python Standard Modules
+import logging
+import os
+import re
+import stat
+
+# MUGQIC Modules
+from stat_cache import *
+
+log = logging.getLogger(__name__)
+
+# Early removal of job removable files, as soon as all jobs using them as input files succeeded,
+# instead of running the commands created by --clean once the whole pipeline is done.
+#
+# Removals are made by the job scripts themselves: after a job succeeds, it touches its .done file then removes
+# each removable file it uses whose other jobs using it are also done. Since each job touches its own .done file
+# before checking the other ones, the last one to finish always sees all of them.
+# Removable files which no job to run uses as input are never removed early.
+#
+# Each removed file is recorded in the early clean manifest with its modification time, size and type.
+# When jobs are created again, recorded files which do not exist are considered as still present with their
+# recorded file stats, so that jobs creating or using them stay up to date, e.g. when restarting a failed pipeline.
+class EarlyClean(object):
+
+    def __init__(self, manifest_path):
+        self._manifest_path = manifest_path
+
+        # Removed file absolute path -> recorded file stat, for files still missing on file system
+        self._removed_files = {}
+        # Absolute paths of removable files of all created jobs, either up to date or not
+        self._removable_files = set()
+        # Symbolic link absolute path -> target absolute path, for links created by jobs
+        self._symlinks = {}
+        # .done files of jobs to run using removable files, checked by job scripts before removing them
+        self._consumer_done_files = []
+
+        if os.path.isfile(manifest_path):
+            with open(manifest_path) as manifest:
+                for line in manifest:
+                    fields = line.rstrip("\n").split("\t")
+                    if len(fields) != 4:
+                        log.warning("Invalid early clean manifest line: " + line.rstrip("\n") + "... skipping")
+                        continue
+                    path, mtime, size, type = fields
+                    # Later removals of the same file override previous ones
+                    self._removed_files[path] = os.stat_result((
+                        (stat.S_IFDIR | 0755) if type == "directory" else (stat.S_IFREG | 0644),
+                        0, 0, 1, 0, 0, int(size or 0), float(mtime), float(mtime), float(mtime)
+                    ))
+            for path in self._removed_files.keys():
+                if stat_cache.lstat(path) is None:
+                    stat_cache.set(path, self._removed_files[path])
+                else:
+                    # File was created again since its removal
+                    del self._removed_files[path]
+            log.info("Early clean manifest " + manifest_path + ": " + str(len(self._removed_files)) + " removed file" + ("s" if len(self._removed_files) > 1 else "") + " considered as present\n")
+
+    @property
+    def manifest_path(self):
+        return self._manifest_path
+
+    @property
+    def consumer_done_files(self):
+        return self._consumer_done_files
+
+    # Return the paths among the given absolute paths which were removed early and are still missing
+    def removed_files(self, paths):
+        return [path for path in paths if path in self._removed_files]
+
+    # Consider removed files as missing again, so that the jobs creating them are run again
+    def restore(self, paths):
+        for path in paths:
+            if path in self._removed_files:
+                del self._removed_files[path]
+                stat_cache.set(path, None)
+
+    # Record the removable files of a created job, either up to date or not,
+    # and the symbolic links its command creates, whose users also use their targets
+    def add_job(self, job):
+        self._removable_files.update([job.abspath(removable_file) for removable_file in job.removable_files])
+        for target, link in re.findall(r"ln -s(?: -f)? (\S+) (\S+)", job.command):
+            self._symlinks[job.abspath(link)] = job.abspath(os.path.join(os.path.dirname(link), target))
+
+    # Return the removable files used by a job reading or writing an absolute path: the path itself, the removable
+    # directories containing it and the removable files inside it, following symbolic links created by jobs
+    def used_removable_files(self, path):
+        paths = [path]
+        while paths[-1] in self._symlinks and self._symlinks[paths[-1]] not in paths:
+            paths.append(self._symlinks[paths[-1]])
+
+        used_removable_files = set()
+        for path in paths:
+            used_removable_files.update(self._removable_descendants.get(path, []))
+            while True:
+                if path in self._removable_files:
+                    used_removable_files.add(path)
+                parent = os.path.dirname(path)
+                if parent == path:
+                    break
+                path = parent
+        return used_removable_files
+
+    # Set the early removable files of jobs to run, as a list of (removable file absolute path, .done files of
+    # the other jobs using it), in job attribute "early_removable_files" used by Scheduler.job_command()
+    #
+    # A removable file is used by the jobs to run having an input file, or the index of an input BAM or VCF file,
+    # equal to it or inside it when it is a directory (consumers), or such an output file (producers).
+    # It is removed by the last consumer to finish, once all other consumers and producers are done.
+    # Removable files without any consumer are only removed by --clean, since the jobs using them are unknown.
+    def plan(self, jobs):
+        # Removable directory -> removable files inside it
+        self._removable_descendants = {}
+        for path in self._removable_files:
+            parent = os.path.dirname(path)
+            while parent != os.path.dirname(parent):
+                self._removable_descendants.setdefault(parent, []).append(path)
+                parent = os.path.dirname(parent)
+
+        # Removable file -> list of (job to run, .done file of the job or packed job using it), for consumers and producers
+        consumers = {}
+        producers = {}
+        for job in jobs:
+            job.early_removable_files = []
+            for job_item in getattr(job, "packed_jobs", None) or [job]:
+                for input_file in job_item.input_files:
+                    for path in [job.abspath(input_file)] + implicit_input_files(job.abspath(input_file)):
+                        for removable_file in self.used_removable_files(path):
+                            consumers.setdefault(removable_file, []).append((job, job_item.done))
+                for output_file in job_item.output_files:
+                    for path in [job.abspath(output_file)] + implicit_input_files(job.abspath(output_file)):
+                        for removable_file in self.used_removable_files(path):
+                            producers.setdefault(removable_file, []).append((job, job_item.done))
+
+        consumer_done_files = set()
+        for path, path_consumers in consumers.items():
+            path_users = path_consumers + producers.get(path, [])
+            for job in set([consumer_job for consumer_job, done_file in path_consumers]):
+                done_files = set([done_file for user_job, done_file in path_users if user_job is not job])
+                job.early_removable_files.append((path, sorted(done_files)))
+                consumer_done_files.update(done_files)
+
+        for job in jobs:
+            job.early_removable_files.sort()
+        self._consumer_done_files = sorted(consumer_done_files)
+
+        nb_files = len(consumers)
+        nb_kept_files = len(set([job.abspath(removable_file) for job in jobs for removable_file in job.removable_files if job.abspath(removable_file) not in consumers]))
+        log.info("Early clean: " + str(nb_files) + " removable file" + ("s" if nb_files > 1 else "") + " removed by jobs to run as soon as all jobs using them are done, " + \
+            str(nb_kept_files) + " removable file" + ("s" if nb_kept_files > 1 else "") + " of jobs to run without any job using it kept until --clean\n")
+
+# Return the index files of a BAM or VCF file, read or written by tools along with it though they are not job files
+def implicit_input_files(path):
+    if path.endswith(".bam"):
+        return [re.sub("\.bam$", ".bai", path), path + ".bai"]
+    elif path.endswith(".vcf.gz") or path.endswith(".vcf.bgz"):
+        return [path + ".tbi"]
+    elif path.endswith(".vcf"):
+        return [path + ".idx"]
+    else:
+        return []
+
+# Return job command followed by the removal of its early removable files, if the job succeeded and other jobs using them are done.
+# Job exit status is kept in $PIPESTATUS for schedulers, without failing if "set -e" is enabled.
+def early_clean_command(job, command):
+    return """\
+{command}
+EARLY_CLEAN_STATE=$PIPESTATUS
+if [ $EARLY_CLEAN_STATE -eq 0 ] ; then
+touch {job.done}
+{removals}
+fi
+(exit $EARLY_CLEAN_STATE) && true""".format(
+        command=command,
+        job=job,
+        removals="\n".join(["if " + " && ".join(["[ -e " + done_file + " ]" for done_file in done_files] + ["[ -e " + path + " ]"]) + " ; then " + \
+            "printf \"%s\\t%s\\t%s\\t%s\\n\" " + path + " \"$(date -r " + path + " +%s.%N)\" \"$(stat -c %s " + path + ")\" \"$([ -d " + path + " ] && echo directory || echo file)\" >> job_output/early_clean_manifest.tsv && " + \
+            "rm -rf " + path + " || true ; fi" for path, done_files in job.early_removable_files])
+    )
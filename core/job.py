@@ -27,6 +27,7 @@ import os
 
 # MUGQIC Modules
 from config import *
+from stat_cache import *
 
 log = logging.getLogger(__name__)
 
@@ -97,13 +98,11 @@ class Job:
         return command
 
     def abspath(self, file):
-        tmp_file = os.path.expandvars(file)
-        if not os.path.isabs(tmp_file):
-            # File path is relative to the job output directory
-            tmp_file = os.path.normpath(os.path.join(self.output_dir, tmp_file))
-        return tmp_file
+        return output_dir_abspath(self.output_dir, file)
 
-    def is_up2date(self):
+    # Return whether job is up to date based on file modification times,
+    # or on file content if an up-to-date manifest is given
+    def is_up2date(self, manifest=None):
         # If job has dependencies, job is not up to date
         if self.dependency_jobs:
             log.debug("Job " + self.name + " NOT up to date")
@@ -118,19 +117,29 @@ class Job:
         # If any .done, input or output file is missing, job is not up to date
         for file in [abspath_done] + abspath_input_files + abspath_output_files:
             # Use 'exists' instead of 'isfile' since input/output files can be directories
-            if not os.path.exists(file):
+            if not stat_cache.exists(file):
                 log.debug("Job " + self.name + " NOT up to date")
                 log.debug("Input, output or .done file missing: " + file)
                 return False
 
+        if manifest:
+            if manifest.is_up2date(abspath_done, abspath_input_files + abspath_output_files, lambda: self.is_up2date_by_mtime(abspath_input_files, abspath_output_files)):
+                return True
+            else:
+                log.debug("Job " + self.name + " NOT up to date")
+                return False
+        else:
+            return self.is_up2date_by_mtime(abspath_input_files, abspath_output_files)
+
+    def is_up2date_by_mtime(self, abspath_input_files, abspath_output_files):
         # Retrieve latest input file by modification time i.e. maximum stat mtime
         # Use lstat to avoid following symbolic links
-        latest_input_file = max(abspath_input_files, key=lambda input_file: os.lstat(input_file).st_mtime)
-        latest_input_time = os.lstat(latest_input_file).st_mtime
+        latest_input_file = max(abspath_input_files, key=lambda input_file: stat_cache.lstat(input_file).st_mtime)
+        latest_input_time = stat_cache.lstat(latest_input_file).st_mtime
 
         # Same with earliest output file by modification time
-        earliest_output_file = min(abspath_output_files, key=lambda output_file:os.lstat(output_file).st_mtime)
-        earliest_output_time = os.lstat(earliest_output_file).st_mtime
+        earliest_output_file = min(abspath_output_files, key=lambda output_file: stat_cache.lstat(output_file).st_mtime)
+        earliest_output_time = stat_cache.lstat(earliest_output_file).st_mtime
 
         # If any input file is strictly more recent than all output files, job is not up to date
         if latest_input_time > earliest_output_time:
@@ -142,6 +151,15 @@ class Job:
         return True
 
 
+# Return the absolute path of a file relative to an output directory, with environment variables expanded,
+# as used for file stat lookups so that all lookups of a same file share the same stat cache entry
+def output_dir_abspath(output_dir, file):
+    tmp_file = os.path.expandvars(file)
+    if not os.path.isabs(tmp_file):
+        # File path is relative to the job output directory
+        tmp_file = os.path.normpath(os.path.join(output_dir, tmp_file))
+    return tmp_file
+
 # Create a new job by concatenating a list of jobs together
 def concat_jobs(jobs, name=""):
 
@@ -166,6 +184,17 @@ def concat_jobs(jobs, name=""):
 
     return job
 
+# Create a new job running a list of independent jobs one after the other, each of them keeping its own .done file,
+# so that only the ones which did not succeed are run again if the packed job fails
+def pack_jobs(jobs, name=""):
+    job = concat_jobs(jobs, name)
+    job.packed_jobs = jobs
+
+    # Merge commands, removing and creating each job .done file like schedulers do
+    job.command = " && \\\n".join(["rm -f " + job_item.done + " && \\\n" + job_item.command + " && \\\ntouch " + job_item.done for job_item in jobs])
+
+    return job
+
 # Create a new job by piping a list of jobs together
 def pipe_jobs(jobs, name=""):
 
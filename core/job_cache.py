@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+################################################################################
+# Copyright (C) 2014, 2015 GenAP, McGill University and Genome Quebec Innovation Centre
+#
+# This file is part of MUGQIC Pipelines.
+#
+# MUGQIC Pipelines is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUGQIC Pipelines is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with MUGQIC Pipelines.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+# Python Standard Modules
+import cPickle
+import hashlib
+import logging
+import os
+import sys
+
+# MUGQIC Modules
+from stat_cache import *
+
+log = logging.getLogger(__name__)
+
+# On-disk cache of the jobs created by each step, so that unchanged steps are loaded instead of created again.
+#
+# A step cache file is valid if its key matches, i.e. the same pipeline code, version, output directory,
+# merged config values, input files given as arguments (readset, design...) and step name.
+# Since step jobs may also depend on the file system and on previous steps jobs, the input file candidates
+# selected by Pipeline.select_input_files() and the file system lookups made through the stat cache during
+# step job creation are recorded, then verified again before cached jobs are used.
+# Files whose content is used to plan jobs, e.g. the FASTQ sizes, BAM indexes and gap BED file DnaSeq chunks and
+# genome partitions are computed from, are recorded with stat_cache.record_content() and verified by size
+# and modification time.
+# Job up-to-date status and dependencies are never cached.
+class JobCache(object):
+
+    def __init__(self, cache_dir, key):
+        self._cache_dir = cache_dir
+        self._key = key
+        self._nb_loaded_steps = 0
+        self._nb_created_steps = 0
+
+    def path(self, step):
+        return os.path.join(self._cache_dir, step.name + ".pickle")
+
+    def step_key(self, step):
+        return hashlib.md5(self._key + "\n" + step.name).hexdigest()
+
+    # Return cached step jobs if still valid, None otherwise
+    def load(self, step, pipeline):
+        try:
+            with open(self.path(step), 'rb') as cache_file:
+                cache = cPickle.load(cache_file)
+        except (IOError, EOFError, cPickle.UnpicklingError, AttributeError, ImportError) as e:
+            log.debug("No valid job cache for step " + step.name + ": " + str(e))
+            return None
+
+        if cache['key'] != self.step_key(step):
+            log.debug("Job cache key changed for step " + step.name)
+            return None
+
+        # Check file system lookups concurrently, then input file selections which depend on previous steps jobs
+        stat_cache.prefetch([lookup[1] if isinstance(lookup, tuple) else lookup for lookup in cache['lookups'] if not isinstance(lookup, tuple) or lookup[0] == 'content'])
+        for lookup, observation in cache['lookups'].items():
+            if stat_cache.observe(lookup) != observation:
+                log.debug("File system changed for step " + step.name + ": " + str(lookup))
+                return None
+        for candidate_input_files, selected_input_files in cache['input_file_selections']:
+            try:
+                if pipeline.select_input_files(candidate_input_files) != selected_input_files:
+                    log.debug("Input file selection changed for step " + step.name + ": " + str(candidate_input_files))
+                    return None
+            except Exception:
+                return None
+
+        self._nb_loaded_steps += 1
+        log.info("Jobs of step " + step.name + " loaded from cache " + self.path(step))
+        return cache['jobs']
+
+    # Save step jobs, before their .done file and dependencies are set, along with the recorded lookups and input file selections
+    def save(self, step, jobs, lookups, input_file_selections):
+        self._nb_created_steps += 1
+        if not os.path.isdir(self._cache_dir):
+            os.makedirs(self._cache_dir)
+        # Write a temporary file first so that concurrent pipeline runs never read a partial cache file
+        tmp_path = self.path(step) + "." + str(os.getpid()) + ".tmp"
+        with open(tmp_path, 'wb') as cache_file:
+            cPickle.dump({'key': self.step_key(step), 'lookups': lookups, 'input_file_selections': input_file_selections, 'jobs': jobs}, cache_file, cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, self.path(step))
+
+    def log_statistics(self):
+        log.info("Job cache: " + str(self._nb_loaded_steps) + " step" + ("s" if self._nb_loaded_steps > 1 else "") + " loaded, " + str(self._nb_created_steps) + " step" + ("s" if self._nb_created_steps > 1 else "") + " created\n")
+
+# Return a fingerprint of the source files of all loaded MUGQIC modules, so that any code change invalidates cached jobs
+def code_fingerprint():
+    mugqic_pipelines_home = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    fingerprint = []
+    for module in sys.modules.values():
+        module_file = getattr(module, '__file__', None)
+        if module_file and os.path.abspath(module_file).startswith(mugqic_pipelines_home + os.sep):
+            source_file = os.path.splitext(os.path.abspath(module_file))[0] + ".py"
+            if os.path.exists(source_file):
+                fingerprint.append(source_file + ":" + str(os.path.getsize(source_file)) + ":" + str(os.path.getmtime(source_file)))
+    return "\n".join(sorted(fingerprint))
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+
+################################################################################
+# Copyright (C) 2014, 2015 GenAP, McGill University and Genome Quebec Innovation Centre
+#
+# This file is part of MUGQIC Pipelines.
+#
+# MUGQIC Pipelines is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUGQIC Pipelines is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with MUGQIC Pipelines.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+# Python Standard Modules
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+
+# MUGQIC Modules
+from stat_cache import *
+
+log = logging.getLogger(__name__)
+
+# Content of files larger than this size is checksummed from sampled blocks by default, see content_checksum()
+FULL_CHECKSUM_MAX_SIZE = 64 * 1024 ** 2
+SAMPLE_BLOCK_SIZE = 1024 ** 2
+NB_SAMPLE_BLOCKS = 16
+
+# On-disk manifest of job input/output file contents, used by the "checksum" up-to-date mode.
+#
+# For each file, the manifest stores its size, modification time and content checksum (see content_checksum()).
+# The checksum is only computed again if the file size or modification time differ from the manifest.
+#
+# For each job, identified by its .done file, the manifest stores the .done file modification time
+# and a checksum of all its input and output file checksums, recorded when the job succeeded.
+# A job is then up to date as long as its .done file is the same and its files content did not change,
+# even if their modification times did (e.g. touched reference, restore from tape, rsync without -t).
+#
+# Jobs record their file checksums themselves when they succeed, in a checksum record next to their .done file
+# (see checksum_command()), which is imported in the manifest the next time jobs are created.
+# Jobs without checksum record, e.g. run before the "checksum" mode was used, are recorded the first time
+# they are found up to date by modification time.
+class Manifest(object):
+
+    def __init__(self, path, full_checksum_max_size=FULL_CHECKSUM_MAX_SIZE):
+        self._path = path
+        self._full_checksum_max_size = full_checksum_max_size
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        self._connection = sqlite3.connect(path)
+        self._connection.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime REAL, checksum TEXT)")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS jobs (done TEXT PRIMARY KEY, done_mtime REAL, files_checksum TEXT)")
+
+        self._nb_checksums = 0
+        self._nb_records = 0
+
+    @property
+    def path(self):
+        return self._path
+
+    # Return file content checksum, computed again only if file size or modification time changed
+    def file_checksum(self, path):
+        # Use lstat to be consistent with the modification time up-to-date mode
+        file_stat = stat_cache.lstat(path)
+        row = self._connection.execute("SELECT size, mtime, checksum FROM files WHERE path = ?", (path,)).fetchone()
+        if row and row[0] == file_stat.st_size and row[1] == file_stat.st_mtime:
+            return row[2]
+
+        # Directory content is not checksummed, only its existence matters
+        if stat_cache.isdir(path):
+            checksum = "directory"
+        else:
+            checksum = content_checksum(path, self._full_checksum_max_size)
+            self._nb_checksums += 1
+            log.debug("Checksum computed for " + path + ": " + checksum)
+
+        self._connection.execute("INSERT OR REPLACE INTO files (path, size, mtime, checksum) VALUES (?, ?, ?, ?)", (path, file_stat.st_size, file_stat.st_mtime, checksum))
+        return checksum
+
+    def files_checksum(self, paths):
+        return files_checksum(dict([(path, self.file_checksum(path)) for path in set(paths)]))
+
+    # Import the checksum record written by a job when it succeeded, i.e. after the .done file modification time
+    # recorded in the manifest if any, and return its files checksum, or None if there is no valid record of all job files
+    def import_checksum_record(self, abspath_done, abspath_files):
+        record_path = checksum_record(abspath_done)
+        record_stat = stat_cache.lstat(record_path)
+        row = self._connection.execute("SELECT done_mtime FROM jobs WHERE done = ?", (abspath_done,)).fetchone()
+        if record_stat is None or (row and record_stat.st_mtime <= row[0]):
+            return None
+
+        checksums = {}
+        with open(record_path) as record:
+            for line in record:
+                fields = line.rstrip("\n").split("\t")
+                if len(fields) != 4:
+                    log.warning("Invalid checksum record line in " + record_path + ": " + line.rstrip("\n") + "... skipping record")
+                    return None
+                path, size, mtime, checksum = fields
+                checksums[path] = checksum
+                self._connection.execute("INSERT OR REPLACE INTO files (path, size, mtime, checksum) VALUES (?, ?, ?, ?)", (path, int(size), float(mtime), checksum))
+
+        if [path for path in abspath_files if path not in checksums]:
+            log.debug("Checksum record " + record_path + " does not include all job files... skipping")
+            return None
+        self._nb_records += 1
+        return files_checksum(dict([(path, checksums[path]) for path in abspath_files]))
+
+    # Given a job .done file and its input and output files, all existing, return whether job is up to date based on files content.
+    # If the job was run again since it was last recorded, its checksum record is imported if any,
+    # otherwise fall back to the given modification time check, and record job files content as reference
+    # for the next checks if the job is up to date.
+    def is_up2date(self, abspath_done, abspath_files, is_up2date_by_mtime):
+        done_mtime = stat_cache.lstat(abspath_done).st_mtime
+        row = self._connection.execute("SELECT done_mtime, files_checksum FROM jobs WHERE done = ?", (abspath_done,)).fetchone()
+
+        if not (row and row[0] == done_mtime):
+            recorded_files_checksum = self.import_checksum_record(abspath_done, abspath_files)
+            if recorded_files_checksum:
+                self._connection.execute("INSERT OR REPLACE INTO jobs (done, done_mtime, files_checksum) VALUES (?, ?, ?)", (abspath_done, done_mtime, recorded_files_checksum))
+                row = (done_mtime, recorded_files_checksum)
+
+        if row and row[0] == done_mtime:
+            if row[1] == self.files_checksum(abspath_files):
+                return True
+            else:
+                log.debug("Input or output file content changed since job last run: " + abspath_done)
+                return False
+        elif is_up2date_by_mtime():
+            self._connection.execute("INSERT OR REPLACE INTO jobs (done, done_mtime, files_checksum) VALUES (?, ?, ?)", (abspath_done, done_mtime, self.files_checksum(abspath_files)))
+            return True
+        else:
+            return False
+
+    def close(self):
+        self._connection.commit()
+        self._connection.close()
+        log.info("Up-to-date manifest " + self.path + " saved (" + str(self._nb_records) + " job checksum record" + ("s" if self._nb_records > 1 else "") + " imported, " + str(self._nb_checksums) + " file checksum" + ("s" if self._nb_checksums > 1 else "") + " computed)\n")
+
+# Return the checksum of a file content: the MD5 of the whole file up to full_checksum_max_size bytes, otherwise the MD5
+# of the file size and of NB_SAMPLE_BLOCKS blocks of SAMPLE_BLOCK_SIZE bytes evenly spaced from the start to the end
+# of the file, i.e. 16 MB read per file instead of the whole file.
+# Sampled checksums miss changes outside sampled blocks which keep the file size, e.g. a substitution in a BAM file.
+# Since checksums are only computed when file size or modification time changed, full checksums of large files
+# are only needed if they may be modified in place and touched back, in which case full_checksum_max_size should be raised.
+def content_checksum(path, full_checksum_max_size=FULL_CHECKSUM_MAX_SIZE):
+    size = os.path.getsize(path)
+    md5 = hashlib.md5()
+    with open(path, 'rb') as file:
+        if size <= max(full_checksum_max_size, NB_SAMPLE_BLOCKS * SAMPLE_BLOCK_SIZE):
+            for block in iter(lambda: file.read(4 * 1024 * 1024), b""):
+                md5.update(block)
+        else:
+            md5.update(str(size))
+            for block_idx in range(NB_SAMPLE_BLOCKS):
+                file.seek((size - SAMPLE_BLOCK_SIZE) * block_idx // (NB_SAMPLE_BLOCKS - 1))
+                md5.update(file.read(SAMPLE_BLOCK_SIZE))
+    return md5.hexdigest()
+
+# Return the checksum of a set of files given as a dict of path -> file checksum
+def files_checksum(checksums):
+    return hashlib.md5("\n".join([path + "\t" + checksums[path] for path in sorted(checksums)])).hexdigest()
+
+# Return the checksum record file written by a job next to its .done file
+def checksum_record(done):
+    return re.sub("\.done$", ".checksums", done)
+
+# Return job command followed, if the job succeeded, by the writing of a checksum record of the input and output files
+# of each job it runs, by utils/up2date_checksums.py; job exit status is kept in $PIPESTATUS for schedulers.
+def checksum_command(job, command, python="python", full_checksum_max_size=FULL_CHECKSUM_MAX_SIZE):
+    return """\
+{command}
+CHECKSUM_STATE=$PIPESTATUS
+if [ $CHECKSUM_STATE -eq 0 ] ; then
+{records}
+fi
+(exit $CHECKSUM_STATE) && true""".format(
+        command=command,
+        records="\n".join([python + " " + os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "utils", "up2date_checksums.py") + \
+            " -r " + checksum_record(job_item.abspath(job_item.done)) + " -m " + str(full_checksum_max_size) + " " + \
+            " ".join(sorted(set([job_item.abspath(file) for file in job_item.input_files + job_item.output_files]))) + " || true" for job_item in getattr(job, "packed_jobs", None) or [job]])
+    )
@@ -32,12 +32,22 @@ import hashlib
 import logging
 import os
 import re
+import StringIO
 import textwrap
+import time
 
 # MUGQIC Modules
 from config import *
+from critical_path import *
+from disk_forecast import *
+from early_clean import *
 from job import *
+from job_cache import *
+from manifest import *
+from profiler import *
+from resource_sizing import *
 from scheduler import *
+from stat_cache import *
 from step import *
 
 log = logging.getLogger(__name__)
@@ -45,6 +55,18 @@ log = logging.getLogger(__name__)
 class Pipeline(object):
     def __init__(self):
         self._timestamp = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+
+        # Registry of all created jobs in step and job order, along with their creation rank
+        # and an index of jobs by output file, updated each time a job is added to a step
+        self._jobs = []
+        self._job_ranks = {}
+        self._output_file_jobs = {}
+        self._critical_path = None
+        self._resource_sizing = None
+        self._early_clean = None
+        # List of (candidate input files, selected input files) while recording step jobs creation for the job cache
+        self._input_file_selections = None
+
         self._args = self.argparser.parse_args()
 
         logging.basicConfig(level=getattr(logging, self.args.log.upper()))
@@ -73,8 +95,13 @@ Usage
 
         # Normal pipeline execution
         else:
+            if self.args.profile is not None:
+                profiler.start(self.args.profile)
+
             if self.args.config:
-                config.parse_files(self.args.config)
+                # Modules are not used by 'rm' commands created by --clean
+                with profiler.timer("parse_config"):
+                    config.parse_files(self.args.config, check_modules=not (self.args.skip_module_check or self.args.clean))
             else:
                 self.argparser.error("argument -c/--config is required!")
 
@@ -92,6 +119,8 @@ Usage
                 config.filepath = os.path.abspath(config_trace.name)
 
             self._output_dir = os.path.abspath(self.args.output_dir)
+            # Files removed by --early-clean in previous runs are considered as present, whether --early-clean is set or not
+            self._early_clean = EarlyClean(os.path.join(self.output_dir, "job_output", "early_clean_manifest.tsv"))
             self._scheduler = create_scheduler(self.args.job_scheduler)
 
             step_counter = collections.Counter(self.steps)
@@ -113,17 +142,57 @@ Usage
             # For job reporting, all jobs must be created first, no matter whether they are up to date or not
             if self.args.report:
                 self._force_jobs = True
-                self.create_jobs()
-                self.report_jobs()
+                with profiler.timer("create_jobs"):
+                    self.create_jobs()
+                with profiler.timer("report_jobs"):
+                    self.report_jobs()
             # For job cleaning, all jobs must be created first, no matter whether they are up to date or not
             elif self.args.clean:
                 self._force_jobs = True
-                self.create_jobs()
-                self.clean_jobs()
+                with profiler.timer("create_jobs"):
+                    self.create_jobs()
+                with profiler.timer("clean_jobs"):
+                    self.clean_jobs()
             else:
+                # Jobs using early removed files of steps outside the step range would not find them anymore
+                if self.args.early_clean and self.step_range != self.step_list[self.step_list.index(self.step_range[0]):]:
+                    raise Exception("Error: --early-clean requires a step range including all steps from its first one to the last pipeline step!")
                 self._force_jobs = self.args.force
-                self.create_jobs()
-                self.submit_jobs()
+                with profiler.timer("create_jobs"):
+                    self.create_jobs()
+                if self.args.reduce_dependencies:
+                    with profiler.timer("reduce_dependencies"):
+                        self.reduce_dependencies()
+                if self.args.critical_path:
+                    with profiler.timer("critical_path"):
+                        self._critical_path = CriticalPath(self.jobs)
+                        self.critical_path.log_summary()
+                if self.args.resource_sizing:
+                    with profiler.timer("resource_sizing"):
+                        self._resource_sizing = ResourceSizing(
+                            [self.output_dir] + (config.param('DEFAULT', 'resource_sizing_history_dirs', required=False, type='dirpathlist') or []),
+                            config.param('DEFAULT', 'resource_sizing_quantile', required=False, type='float') or 0.95,
+                            config.param('DEFAULT', 'resource_sizing_min_history', required=False, type='posint') or 3
+                        )
+                        self.resource_sizing.log_summary(self.jobs)
+                # Jobs record their file checksums when they succeed, even if forced
+                if self.args.up2date == "checksum":
+                    for job in self.jobs:
+                        job.up2date_checksum = True
+                if self.args.early_clean:
+                    self._early_clean.plan(self.jobs)
+                if self.args.disk_forecast:
+                    with profiler.timer("disk_forecast"):
+                        DiskForecast(
+                            self.output_dir,
+                            self.step_range,
+                            [self.output_dir] + (config.param('DEFAULT', 'resource_sizing_history_dirs', required=False, type='dirpathlist') or []),
+                            self.early_clean
+                        ).log_summary()
+                with profiler.timer("submit_jobs"):
+                    self.submit_jobs()
+
+            profiler.stop()
 
     # Pipeline command line arguments parser
     @property
@@ -145,10 +214,19 @@ Steps:
             self._argparser.add_argument("-c", "--config", help="config INI-style list of files; config parameters are overwritten based on files order", nargs="+", type=file)
             self._argparser.add_argument("-s", "--steps", help="step range e.g. '1-5', '3,6,7', '2,4-8'")
             self._argparser.add_argument("-o", "--output-dir", help="output directory (default: current)", default=os.getcwd())
-            self._argparser.add_argument("-j", "--job-scheduler", help="job scheduler type (default: pbs)", choices=["pbs", "batch"], default="pbs")
+            self._argparser.add_argument("-j", "--job-scheduler", help="job scheduler type; 'local' runs jobs on the current host, using all its cores; 'slurm' groups similar jobs of each step in job arrays (default: pbs)", choices=["pbs", "batch", "local", "slurm"], default="pbs")
             self._argparser.add_argument("-f", "--force", help="force creation of jobs even if up to date (default: false)", action="store_true")
+            self._argparser.add_argument("--up2date", help="job up-to-date check mode: 'mtime' compares input and output file modification times; 'checksum' compares input and output file contents with the ones recorded in job_output/up2date_manifest.sqlite when jobs last succeeded, so that jobs are not run again if only modification times changed; files larger than 'up2date_full_checksum_max_size' config parameter (default: 64M) are checksummed from sampled blocks (default: mtime)", choices=["mtime", "checksum"], default="mtime")
+            self._argparser.add_argument("--reduce-dependencies", help="remove job dependencies already implied by other dependencies, i.e. keep the transitive reduction of the job graph, to submit shorter dependency lists (default: false)", action="store_true")
+            self._argparser.add_argument("--critical-path", help="estimate job runtimes from 'estimated_runtime' or 'cluster_walltime' config parameters, log the critical path and estimated makespan, and give priority to jobs on the longest remaining paths: PBS jobs are submitted with 'cluster_priority_arg' priority option if set, SLURM jobs with nice values, local jobs are started first (default: false)", action="store_true")
+            self._argparser.add_argument("--resource-sizing", help="request job memory and walltime predicted from the resource usage records of past runs of jobs with the same name prefix, scaled by job input file size when available; records are written with 'resource_accounting=true' config parameter; jobs without enough history keep their 'cluster_mem' and 'cluster_walltime' config values; PBS and SLURM jobs are submitted with predicted values, local jobs use predicted memory (default: false)", action="store_true")
+            self._argparser.add_argument("--early-clean", help="remove job removable files as soon as all jobs using them as input files succeeded, instead of once the whole pipeline is done with --clean; removed files are recorded in job_output/early_clean_manifest.tsv so that the jobs creating them are not run again, unless a job to run needs them; the step range must include all steps from its first one to the last pipeline step (default: false)", action="store_true")
+            self._argparser.add_argument("--disk-forecast", help="log the forecast disk usage of jobs to run per step and per output directory, from their input file sizes and expansion ratios either set with 'disk_expansion_ratio' config parameters or learned from job resource records, and warn if the peak usage exceeds the free space of the output file system (default: false)", action="store_true")
+            self._argparser.add_argument("--job-cache", help="save created jobs of each step in job_output/job_cache and load them in next runs instead of creating them again, as long as pipeline code, config, readset and design files, and file system lookups made during job creation did not change; job up-to-date status is still checked (default: false)", action="store_true")
             self._argparser.add_argument("--report", help="create 'pandoc' command to merge all job markdown report files in the given step range into HTML, if they exist; if --report is set, --job-scheduler, --force, --clean options and job up-to-date status are ignored (default: false)", action="store_true")
             self._argparser.add_argument("--clean", help="create 'rm' commands for all job removable files in the given step range, if they exist; if --clean is set, --job-scheduler, --force options and job up-to-date status are ignored (default: false)", action="store_true")
+            self._argparser.add_argument("--skip-module-check", help="skip the check of config file modules availability; if --clean is set, modules are not checked either (default: false)", action="store_true")
+            self._argparser.add_argument("--profile", help="write to standard error a summary of the time spent in each phase and step, Config.param and file system call counts; if a file is given, write cProfile statistics in it too (default: false)", nargs="?", const="", metavar="CPROFILE_FILE")
             self._argparser.add_argument("-l", "--log", help="log level (default: info)", choices=["debug", "info", "warning", "error", "critical"], default="info")
 
         return self._argparser
@@ -193,54 +271,73 @@ Steps:
 
     @property
     def jobs(self):
-        jobs = []
-        for step in self.step_range:
-            jobs.extend(step.jobs)
-        return jobs
+        return self._jobs
+
+    # Critical path analysis of jobs if --critical-path is set, None otherwise
+    @property
+    def critical_path(self):
+        return self._critical_path
+
+    @property
+    def resource_sizing(self):
+        return self._resource_sizing
+
+    # Early removal of removable files if --early-clean is set, None otherwise
+    @property
+    def early_clean(self):
+        return self._early_clean if self.args.early_clean else None
+
+    # Add job to its step and register it in pipeline jobs, so that following jobs can find their dependencies by hash lookup
+    def add_job(self, step, job):
+        step.add_job(job)
+        self._job_ranks[job] = len(self._jobs)
+        self._jobs.append(job)
+        for output_file in job.output_files:
+            self._output_file_jobs.setdefault(output_file, []).append(job)
 
     # Given a list of lists of input files, return the first valid list of input files which can be found either in previous jobs output files or on file system.
     # Thus, a job with several candidate lists of input files can find out the first valid one.
     def select_input_files(self, candidate_input_files):
         log.debug("candidate_input_files: \n" + str(candidate_input_files))
 
-        selected_input_files = []
-
-        # Create a reversed copy to pop the candidates ordered by priority
-        remaining_candidate_input_files = list(candidate_input_files)
-        remaining_candidate_input_files.reverse()
-        previous_jobs_output_files = set([output_file for job in self.jobs for output_file in job.output_files])
-
-        while not selected_input_files and remaining_candidate_input_files:
-            input_files = filter(None, remaining_candidate_input_files.pop())
+        for input_files in candidate_input_files:
+            input_files = filter(None, input_files)
             # Skip empty candidate input files
             if input_files:
-                # dependency_jobs() checks if the current candidate input files is valid, otherwise raises an exception
-                try:
-                    job = Job(input_files=input_files)
-                    job.output_dir = self.output_dir
-                    self.dependency_jobs(job)
-                    selected_input_files = input_files
-                except Exception as e:
-                    log.debug("Caught Exception for candidate input file: " +  ", ".join(input_files))
-                    log.debug(e.message)
-
-        if selected_input_files:
-            log.debug("selected_input_files: " + ", ".join(input_files) + "\n")
-            return selected_input_files
-        else:
-            raise Exception("Error: missing candidate input files: " + str(candidate_input_files) +
-                " neither found in dependencies nor on file system!")
+                missing_input_files = self.missing_input_files(input_files)
+                if missing_input_files:
+                    log.debug("Missing candidate input files: " + ", ".join(missing_input_files))
+                else:
+                    log.debug("selected_input_files: " + ", ".join(input_files) + "\n")
+                    if self._input_file_selections is not None:
+                        self._input_file_selections.append(([list(candidate) for candidate in candidate_input_files], list(input_files)))
+                    return input_files
+
+        raise Exception("Error: missing candidate input files: " + str(candidate_input_files) +
+            " neither found in dependencies nor on file system!")
+
+    # Return input files which are neither output files of previous jobs nor found on file system.
+    # Previous jobs output files are looked up first, then only remaining files are checked on file system.
+    def missing_input_files(self, input_files):
+        remaining_input_files = [input_file for input_file in input_files if input_file not in self._output_file_jobs]
+        missing_input_files = []
+        for remaining_input_file in remaining_input_files:
+            # Use 'exists' instead of 'isfile' since input file can be a directory
+            if not stat_cache.exists(output_dir_abspath(self.output_dir, remaining_input_file)):
+                missing_input_files.append(remaining_input_file)
+        return missing_input_files
 
     def dependency_jobs(self, current_job):
-        dependency_jobs = []
+        dependency_jobs = set()
         dependency_input_files = set()
-        for step in self.step_range:
-            for step_job in step.jobs:
-                # If current job input files intersect with step job output files, step job is a dependency
-                shared_files = set(current_job.input_files).intersection(set(step_job.output_files))
-                if shared_files:
-                    dependency_jobs.append(step_job)
-                    dependency_input_files.update(shared_files)
+        for input_file in set(current_job.input_files):
+            # If current job input file is an output file of previous jobs, those jobs are dependencies
+            if input_file in self._output_file_jobs:
+                dependency_jobs.update(self._output_file_jobs[input_file])
+                dependency_input_files.add(input_file)
+
+        # Sort dependency jobs in step and job creation order
+        dependency_jobs = sorted(dependency_jobs, key=lambda dependency_job: self._job_ranks[dependency_job])
 
         # Check if job input files not found in dependencies are on file system
         missing_input_files = set()
@@ -248,7 +345,7 @@ Steps:
         # where first command output becomes second command input
         for remaining_input_file in set(current_job.input_files).difference(dependency_input_files).difference(set(current_job.output_files)):
             # Use 'exists' instead of 'isfile' since input file can be a directory
-            if not os.path.exists(current_job.abspath(remaining_input_file)):
+            if not stat_cache.exists(current_job.abspath(remaining_input_file)):
                 missing_input_files.add(remaining_input_file)
         if missing_input_files:
             raise Exception("Error: missing input files for job " + current_job.name + ": " +
@@ -257,29 +354,224 @@ Steps:
         return dependency_jobs
 
     def create_jobs(self):
+        # Job file contents are only checked in "checksum" up-to-date mode
+        if not self.force_jobs and self.args.up2date == "checksum":
+            manifest = Manifest(
+                os.path.join(self.output_dir, "job_output", "up2date_manifest.sqlite"),
+                parse_memory(config.param('DEFAULT', 'up2date_full_checksum_max_size', required=False) or str(FULL_CHECKSUM_MAX_SIZE))
+            )
+        else:
+            manifest = None
+
+        if self.args.job_cache:
+            job_cache = JobCache(os.path.join(self.output_dir, "job_output", "job_cache"), self.job_cache_key())
+        else:
+            job_cache = None
+
+        # Files removed by --early-clean which are needed again by jobs to run
+        restored_files = []
+
         for step in self.step_range:
             log.info("Create jobs for step " + step.name + "...")
-            jobs = step.create_jobs()
+            # Step timing is added first so that timings of lazy parsing during step job creation are listed below it
+            step_profile = profiler.add(step.name, 0.0, 1)
+            step_timing = [0.0] * 5
+            start_time = time.time()
+            jobs = job_cache.load(step, self) if job_cache else None
+            if jobs is None:
+                if job_cache:
+                    stat_cache.start_recording()
+                    self._input_file_selections = []
+                jobs = step.create_jobs()
+                if job_cache:
+                    job_cache.save(step, jobs, stat_cache.stop_recording(), self._input_file_selections)
+                    self._input_file_selections = None
             for job in jobs:
                 # Job name is mandatory to create job .done file name
                 if not job.name:
                     raise Exception("Error: job \"" + job.command + "\" has no name!")
 
+                self.set_job_done(step, job)
+                if self.early_clean:
+                    self.early_clean.add_job(job)
+            step_timing[0] = time.time() - start_time
+
+            start_time = time.time()
+            self.prefetch_file_stats(jobs)
+            step_timing[1] = time.time() - start_time
+
+            for job in jobs:
                 log.debug("Job name: " + job.name)
                 log.debug("Job input files:\n  " + "\n  ".join(job.input_files))
                 log.debug("Job output files:\n  " + "\n  ".join(job.output_files) + "\n")
 
-                # Job .done file name contains the command checksum.
-                # Thus, if the command is modified, the job is not up-to-date anymore.
-                job.done = os.path.join("job_output", step.name, job.name + "." + hashlib.md5(job.command_with_modules).hexdigest() + ".mugqic.done")
-                job.output_dir = self.output_dir
+                start_time = time.time()
                 job.dependency_jobs = self.dependency_jobs(job)
-                if not self.force_jobs and job.is_up2date():
+                dependency_time = time.time()
+                is_up2date = not self.force_jobs and job.is_up2date(manifest)
+                step_timing[2] += dependency_time - start_time
+                step_timing[3] += time.time() - dependency_time
+                if is_up2date:
                     log.info("Job " + job.name + " up to date... skipping")
                 else:
-                    step.add_job(job)
+                    restored_files.extend(self._early_clean.removed_files([job.abspath(input_file) for input_file in job.input_files if input_file not in self._output_file_jobs]))
+                    self.add_job(step, job)
+
+            start_time = time.time()
+            self.pack_jobs(step)
+            step_timing[4] = time.time() - start_time
+
+            if step_profile:
+                step_profile[1] = sum(step_timing)
+                step_profile[3] = str(len(jobs)) + " job" + ("s" if len(jobs) > 1 else "") + " created, " + str(len(step.jobs)) + " to run"
+            for name, seconds in zip(["create_jobs", "prefetch_file_stats", "dependency_jobs", "is_up2date", "pack_jobs"], step_timing):
+                profiler.add(name, seconds, 2)
             log.info("Step " + step.name + ": " + str(len(step.jobs)) + " job" + ("s" if len(step.jobs) > 1 else "") + " created" + ("" if step.jobs else "... skipping") + "\n")
         log.info("TOTAL: " + str(len(self.jobs)) + " job" + ("s" if len(self.jobs) > 1 else "") + " created" + ("" if self.jobs else "... skipping") + "\n")
+        stat_cache.close()
+        stat_cache.log_statistics()
+        if manifest:
+            manifest.close()
+        if job_cache:
+            job_cache.log_statistics()
+
+        # Create jobs again with removed files considered as missing, so that the jobs creating them are run again
+        if restored_files:
+            log.info(str(len(set(restored_files))) + " file" + ("s" if len(set(restored_files)) > 1 else "") + " removed by --early-clean needed again by jobs to run: create jobs again...\n")
+            self._early_clean.restore(restored_files)
+            self._jobs = []
+            self._job_ranks = {}
+            self._output_file_jobs = {}
+            for step in self.step_range:
+                del step.jobs[:]
+            self.create_jobs()
+
+    # Key of the job cache, given pipeline code and version, output directory, merged config values
+    # and contents of all input files given as arguments; step names are added by the job cache
+    def job_cache_key(self):
+        merged_config = StringIO.StringIO()
+        config.write(merged_config)
+        key = [code_fingerprint(), self.__class__.__name__, getattr(self, "version", ""), self.output_dir, merged_config.getvalue()]
+        for name, value in sorted(vars(self.args).items()):
+            if isinstance(value, file):
+                with open(value.name, 'rb') as argument_file:
+                    key.append(name + "\t" + os.path.abspath(value.name) + "\t" + hashlib.md5(argument_file.read()).hexdigest())
+        return hashlib.md5("\n".join(key)).hexdigest()
+
+    # Remove job dependencies which are also ancestors of other dependencies of the same job.
+    # Jobs are processed in creation order, so that dependencies of dependency jobs are already reduced,
+    # and dependencies are processed from latest to earliest, since a job can only depend on earlier ones.
+    def reduce_dependencies(self):
+        nb_edges = 0
+        nb_removed_edges = 0
+        for step in self.step_range:
+            nb_step_edges = 0
+            nb_step_removed_edges = 0
+            for job in step.jobs:
+                nb_step_edges += len(job.dependency_jobs)
+                # A single dependency can not be implied by another one
+                if len(job.dependency_jobs) < 2:
+                    continue
+                ancestor_jobs = set()
+                reduced_dependency_jobs = []
+                for dependency_job in sorted(job.dependency_jobs, key=lambda dependency_job: self._job_ranks[dependency_job], reverse=True):
+                    if dependency_job in ancestor_jobs:
+                        nb_step_removed_edges += 1
+                    else:
+                        reduced_dependency_jobs.append(dependency_job)
+                        remaining_jobs = list(dependency_job.dependency_jobs)
+                        while remaining_jobs:
+                            ancestor_job = remaining_jobs.pop()
+                            if ancestor_job not in ancestor_jobs:
+                                ancestor_jobs.add(ancestor_job)
+                                remaining_jobs.extend(ancestor_job.dependency_jobs)
+                job.dependency_jobs = reduced_dependency_jobs[::-1]
+            if step.jobs:
+                log.info("Step " + step.name + ": " + str(nb_step_removed_edges) + " of " + str(nb_step_edges) + " dependencies removed")
+            nb_edges += nb_step_edges
+            nb_removed_edges += nb_step_removed_edges
+        log.info("TOTAL: " + str(nb_removed_edges) + " of " + str(nb_edges) + " dependencies removed\n")
+
+    def set_job_done(self, step, job):
+        # Job .done file name contains the command checksum.
+        # Thus, if the command is modified, the job is not up-to-date anymore.
+        job.done = os.path.join("job_output", step.name, job.name + "." + hashlib.md5(job.command_with_modules).hexdigest() + ".mugqic.done")
+        job.output_dir = self.output_dir
+
+    # Pack step jobs to run into fewer jobs, for job name prefixes whose config section sets
+    # "job_packing_walltime" (total estimated runtime of packed jobs e.g. 1:00:00, see CriticalPath)
+    # and/or "job_packing_size" (maximum number of packed jobs).
+    # Jobs are packed in creation order; each packed job keeps its own .done file, hence up-to-date checks are unchanged.
+    # Packed jobs request the sum of the walltimes of their jobs, since they run one after the other (see job_walltime).
+    # Jobs depending on other jobs of the same step are not packed, so that packed jobs never depend on each other.
+    def pack_jobs(self, step):
+        step_job_set = set(step.jobs)
+        open_packs = {}
+        packs = []
+        for job in step.jobs:
+            job_name_prefix = job.name.split(".")[0]
+            max_runtime = config.param(job_name_prefix, 'job_packing_walltime', required=False)
+            max_size = config.param(job_name_prefix, 'job_packing_size', required=False, type='posint')
+            if (max_runtime or max_size) and not [dependency_job for dependency_job in job.dependency_jobs if dependency_job in step_job_set]:
+                max_runtime = parse_duration(max_runtime) if max_runtime else None
+                runtime = job_estimated_runtime(job)
+                pack = open_packs.get(job_name_prefix)
+                if pack is None or (max_runtime and pack['runtime'] + runtime > max_runtime) or (max_size and len(pack['jobs']) >= max_size):
+                    pack = {'jobs': [], 'runtime': 0}
+                    packs.append(pack)
+                    open_packs[job_name_prefix] = pack
+                pack['jobs'].append(job)
+                pack['runtime'] += runtime
+
+        # Original job -> packed job
+        packed_jobs = {}
+        pack_counter = collections.Counter()
+        for pack in packs:
+            if len(pack['jobs']) > 1:
+                job_name_prefix = pack['jobs'][0].name.split(".")[0]
+                pack_counter[job_name_prefix] += 1
+                packed_job = pack_jobs(pack['jobs'], job_name_prefix + ".pack" + str(pack_counter[job_name_prefix]))
+                self.set_job_done(step, packed_job)
+                for job in pack['jobs']:
+                    packed_jobs[job] = packed_job
+        if not packed_jobs:
+            return
+
+        # Unregister step jobs, which are the latest ones, then register them again with packed jobs instead of original ones
+        step_jobs = list(step.jobs)
+        del self._jobs[len(self._jobs) - len(step_jobs):]
+        for job in step_jobs:
+            del self._job_ranks[job]
+            for output_file in job.output_files:
+                self._output_file_jobs[output_file].remove(job)
+                if not self._output_file_jobs[output_file]:
+                    del self._output_file_jobs[output_file]
+        del step.jobs[:]
+
+        for job in step_jobs:
+            if job in packed_jobs:
+                packed_job = packed_jobs[job]
+                # Packed job takes the place of its first job
+                if job is packed_job.packed_jobs[0]:
+                    packed_job.dependency_jobs = sorted(set([dependency_job for packed_job_item in packed_job.packed_jobs for dependency_job in packed_job_item.dependency_jobs]), key=lambda dependency_job: self._job_ranks[dependency_job])
+                    self.add_job(step, packed_job)
+            else:
+                job.dependency_jobs = sorted(set([packed_jobs.get(dependency_job, dependency_job) for dependency_job in job.dependency_jobs]), key=lambda dependency_job: self._job_ranks[dependency_job])
+                self.add_job(step, job)
+        log.info("Step " + step.name + ": " + str(len(packed_jobs)) + " jobs packed into " + str(sum(pack_counter.values())) + " job" + ("s" if sum(pack_counter.values()) > 1 else ""))
+
+    # Stat concurrently all files that dependency and up-to-date checks of a step jobs may need,
+    # instead of one by one, to reduce metadata latency on network file systems.
+    # Input files produced by previous jobs are never checked on file system, hence skipped.
+    def prefetch_file_stats(self, jobs):
+        paths = []
+        for job in jobs:
+            paths.extend([job.abspath(input_file) for input_file in job.input_files if input_file not in self._output_file_jobs])
+            # .done and output files are only checked if jobs are not forced
+            if not self.force_jobs:
+                paths.append(job.abspath(job.done))
+                paths.extend([job.abspath(output_file) for output_file in job.output_files])
+        stat_cache.prefetch(paths, config.param('DEFAULT', 'stat_prefetch_threads', required=False, type='posint') or 16)
 
     def submit_jobs(self):
         self.scheduler.submit(self)
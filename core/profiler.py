@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+################################################################################
+# Copyright (C) 2014, 2015 GenAP, McGill University and Genome Quebec Innovation Centre
+#
+# This file is part of MUGQIC Pipelines.
+#
+# MUGQIC Pipelines is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUGQIC Pipelines is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with MUGQIC Pipelines.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+# Python Standard Modules
+import contextlib
+import cProfile
+import logging
+import sys
+import time
+
+# MUGQIC Modules
+from config import *
+from stat_cache import *
+
+log = logging.getLogger(__name__)
+
+# Timings of pipeline phases and steps, along with Config.param and file system call counts, enabled by --profile.
+# The summary table is written to standard error, so that the job submission script on standard output is unchanged.
+class Profiler(object):
+
+    def __init__(self):
+        self._enabled = False
+        # List of [name, seconds, level, details] in start order
+        self._timings = []
+        self._start_time = None
+        self._cprofile = None
+        self._cprofile_file = None
+        self._nb_param_calls = 0
+        self._nb_param_evaluations = 0
+
+    @property
+    def enabled(self):
+        return self._enabled
+
+    # Start profiling; if cprofile_file is set, run cProfile too and dump its statistics in this file when stopped
+    def start(self, cprofile_file=None):
+        self._enabled = True
+        self._start_time = time.time()
+
+        # Count calls by wrapping the global config object methods, so that there is no overhead when not profiling
+        param = config.param
+        evaluate_param = config.evaluate_param
+        check_modules = config.check_modules
+        def counted_param(*args, **kwargs):
+            self._nb_param_calls += 1
+            return param(*args, **kwargs)
+        def counted_evaluate_param(*args, **kwargs):
+            self._nb_param_evaluations += 1
+            return evaluate_param(*args, **kwargs)
+        def timed_check_modules(*args, **kwargs):
+            with self.timer("check_modules", 1):
+                return check_modules(*args, **kwargs)
+        config.param = counted_param
+        config.evaluate_param = counted_evaluate_param
+        config.check_modules = timed_check_modules
+
+        if cprofile_file:
+            self._cprofile_file = cprofile_file
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    # Time the enclosed block, with the given indentation level in the summary table
+    @contextlib.contextmanager
+    def timer(self, name, level=0, details=""):
+        if self.enabled:
+            timing = [name, 0.0, level, details]
+            self._timings.append(timing)
+            start_time = time.time()
+            try:
+                yield timing
+            finally:
+                timing[1] = time.time() - start_time
+        else:
+            yield None
+
+    # Add a timing measured by the caller, and return it so that it can be updated, e.g. for a parent of following timings
+    def add(self, name, seconds, level=0, details=""):
+        if self.enabled:
+            timing = [name, seconds, level, details]
+            self._timings.append(timing)
+            return timing
+
+    def stop(self):
+        if not self.enabled:
+            return
+
+        if self._cprofile:
+            self._cprofile.disable()
+            self._cprofile.dump_stats(self._cprofile_file)
+            log.info("cProfile statistics written in " + self._cprofile_file)
+
+        name_width = max([len(name) + 2 * level for name, seconds, level, details in self._timings] + [len("Phase")])
+        lines = ["Profile summary:", "%-*s  %10s  %s" % (name_width, "Phase", "Time (s)", "Details")]
+        for name, seconds, level, details in self._timings:
+            lines.append("%-*s  %10.3f  %s" % (name_width, "  " * level + name, seconds, details))
+        lines.append("%-*s  %10.3f" % (name_width, "TOTAL", time.time() - self._start_time))
+        lines.append("Config.param calls: " + str(self._nb_param_calls) + " (" + str(self._nb_param_evaluations) + " evaluated, " + str(self._nb_param_calls - self._nb_param_evaluations) + " cached)")
+        lines.append("File system: " + str(stat_cache.misses + stat_cache.prefetched) + " stat/glob calls (" + str(stat_cache.prefetched) + " prefetched concurrently), " + str(stat_cache.hits) + " cache hits, " + "%.3f" % stat_cache.stat_time + "s")
+        sys.stderr.write("\n".join(lines) + "\n")
+
+# Global profiler object used throughout the whole pipeline
+profiler = Profiler()
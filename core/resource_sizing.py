@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+################################################################################
+# Copyright (C) 2014, 2015 GenAP, McGill University and Genome Quebec Innovation Centre
+#
+# This file is part of MUGQIC Pipelines.
+#
+# MUGQIC Pipelines is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUGQIC Pipelines is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with MUGQIC Pipelines.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+# Python Standard Modules
+import glob
+import json
+import logging
+import os
+
+# MUGQIC Modules
+from config import *
+from scheduler import *
+from stat_cache import *
+
+log = logging.getLogger(__name__)
+
+# Job memory and walltime prediction from resource usage records of past job runs, written by utils/job_resources.py
+# when "[DEFAULT] resource_accounting=true" (see Scheduler.job_command), in this pipeline output directory and in
+# other pipeline output directories listed in "[DEFAULT] resource_sizing_history_dirs".
+#
+# Jobs are predicted from the successful records of their job name prefix, e.g. "trimmomatic" for job "trimmomatic.readset1".
+# If all job input files exist, peak memory and wall time are fitted by least squares as a linear function of
+# total input file size, and the prediction adds the given quantile of the fit residuals as a safety margin.
+# Otherwise, or if all records have the same input size, the prediction is the given quantile of past values.
+# Memory is rounded up to 256 MB and walltime to 5 minutes, so that similar jobs keep the same cluster settings.
+# Memory is only predicted from records with the sampled peak memory of the whole job process tree, since the peak
+# memory of the largest single process recorded before underestimates piped jobs, e.g. "bwa mem | java -jar SortSam.jar".
+# Job prefixes with fewer records than the minimum history keep their cluster_mem and cluster_walltime config values.
+class ResourceSizing(object):
+
+    def __init__(self, history_dirs, quantile=0.95, min_history=3):
+        self._quantile = quantile
+        self._min_history = min_history
+
+        # Job name prefix -> list of (input bytes, peak memory bytes or None if not sampled, wall time seconds) of successful past runs
+        self._history = {}
+        records = job_resource_records(history_dirs)
+        for record in records:
+            self._history.setdefault(record['job_name'].split(".")[0], []).append((record['input_bytes'] or 0, record['max_rss_bytes'] if 'max_tree_rss_bytes' in record else None, record['wall_time']))
+
+        log.info("Resource sizing: " + str(len(records)) + " successful job record" + ("s" if len(records) > 1 else "") + " of " + str(len(self._history)) + " job name prefix" + ("es" if len(self._history) > 1 else "") + " read from " + ", ".join(history_dirs))
+
+        # Job -> (memory bytes, walltime seconds), each None if not enough history
+        self._job_resources = {}
+
+    # Return the predicted (memory bytes, walltime seconds) of a job, each None if its job name prefix history is too short
+    # Packed jobs run their jobs one after the other: their memory is the largest one, their walltime the sum of all.
+    def job_resources(self, job):
+        if job not in self._job_resources and getattr(job, "packed_jobs", None):
+            memories, walltimes = zip(*[self.job_resources(job_item) for job_item in job.packed_jobs])
+            self._job_resources[job] = (None if None in memories else max(memories), None if None in walltimes else sum(walltimes))
+        elif job not in self._job_resources:
+            history = self._history.get(job.name.split(".")[0], [])
+            memory_samples = [(size, memory) for size, memory, wall_time in history if memory is not None]
+            walltime_samples = [(size, wall_time) for size, memory, wall_time in history]
+            input_bytes = job_input_bytes(job) if len(walltime_samples) >= self._min_history else None
+            self._job_resources[job] = (
+                round_up(self.predict(memory_samples, input_bytes), 256 * 1024 ** 2) if len(memory_samples) >= self._min_history else None,
+                int(round_up(self.predict(walltime_samples, input_bytes), 300)) if len(walltime_samples) >= self._min_history else None
+            )
+        return self._job_resources[job]
+
+    # Return predicted value given (input bytes, value) samples and job input bytes, None if unknown
+    def predict(self, samples, input_bytes):
+        sizes = [size for size, value in samples]
+        values = [value for size, value in samples]
+        if input_bytes is not None and min(sizes) != max(sizes):
+            # Least squares fit value = intercept + slope * size, with a non-negative slope
+            mean_size = float(sum(sizes)) / len(sizes)
+            mean_value = float(sum(values)) / len(values)
+            slope = max(0.0, sum([(size - mean_size) * (value - mean_value) for size, value in samples]) / sum([(size - mean_size) ** 2 for size in sizes]))
+            intercept = mean_value - slope * mean_size
+            margin = quantile([value - (intercept + slope * size) for size, value in samples], self._quantile)
+            return max(intercept + slope * input_bytes + margin, min(values))
+        else:
+            return quantile(values, self._quantile)
+
+    def log_summary(self, jobs):
+        nb_sized_jobs = len([job for job in jobs if self.job_resources(job) != (None, None)])
+        log.info("Resource sizing: " + str(nb_sized_jobs) + " of " + str(len(jobs)) + " job" + ("s" if len(jobs) > 1 else "") + " sized from history, others use cluster_mem and cluster_walltime config values\n")
+
+# Return the successful job resource records found in the job_output directories of the given pipeline output directories
+def job_resource_records(history_dirs):
+    records = []
+    for history_dir in history_dirs:
+        for record_file in glob.glob(os.path.join(history_dir, "job_output", "*", "*.mugqic.resources")):
+            try:
+                with open(record_file) as record_content:
+                    record = json.load(record_content)
+            except (IOError, ValueError):
+                log.debug("Invalid job resource record " + record_file + "... skipping")
+                continue
+            if record.get('exit_status') == 0:
+                records.append(record)
+    return records
+
+# Return total size in bytes of job input files, None if some input files do not exist yet
+def job_input_bytes(job):
+    input_bytes = 0
+    for input_file in [job.abspath(input_file) for input_file in job.input_files]:
+        stat_result = stat_cache.stat(input_file)
+        if stat_result is None:
+            return None
+        elif stat_cache.isfile(input_file):
+            input_bytes += stat_result.st_size
+    return input_bytes
+
+# Return the q-quantile of values, with linear interpolation between closest ranks
+def quantile(values, q):
+    sorted_values = sorted(values)
+    position = q * (len(sorted_values) - 1)
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+# Return value rounded up to a positive multiple of step
+def round_up(value, step):
+    return max(1, -(-int(value) // step)) * step
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+################################################################################
+# Copyright (C) 2014, 2015 GenAP, McGill University and Genome Quebec Innovation Centre
+#
+# This file is part of MUGQIC Pipelines.
+#
+# MUGQIC Pipelines is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUGQIC Pipelines is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with MUGQIC Pipelines.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+
+# Python Standard Modules
+import logging
+import math
+import os
+
+# MUGQIC Modules
+from job import *
+
+log = logging.getLogger(__name__)
+
+# Scatter/gather of a job over shards, e.g. genome intervals, so that shards run in parallel.
+#
+# scatter(shard_idx, shard) returns the job processing one shard, named <name>.<shard_idx>.
+# gather(shard_jobs) returns the job combining the outputs of all shard jobs, named gather_name.
+# Shard job outputs are intermediate files, hence made removable, only gathered outputs being kept.
+# Return shard jobs followed by the gather job.
+def scatter_gather_jobs(name, shards, scatter, gather, gather_name):
+    if not shards:
+        raise Exception("Error: no shards to scatter job " + name + " over!")
+
+    shard_jobs = []
+    for shard_idx, shard in enumerate(shards):
+        shard_job = scatter(shard_idx, shard)
+        shard_job.name = name + "." + str(shard_idx)
+        shard_job.removable_files.extend([output_file for output_file in shard_job.output_files if output_file not in shard_job.removable_files])
+        shard_jobs.append(shard_job)
+
+    gather_job = gather(shard_jobs)
+    gather_job.name = gather_name
+
+    log.debug("Job " + name + " scattered over " + str(len(shard_jobs)) + " shard" + ("s" if len(shard_jobs) > 1 else "") + " gathered by job " + gather_name)
+
+    return shard_jobs + [gather_job]
+
+# Return the path of a shard file, inserting the shard index before the file extension
+def shard_file(path, shard_idx):
+    root, extension = os.path.splitext(path)
+    return root + ".shard" + str(shard_idx) + extension
+
+# Return the group sizes of each level of a merge tree reducing nb_inputs files to one file,
+# merging at most max_fan_in files per job.
+# The number of levels is minimal and the fan-in is balanced across levels and groups,
+# e.g. 3000 files with max fan-in 100 are merged by 55 jobs of 54 or 55 files then by one job of 55 files,
+# instead of 30 jobs of 100 files then one job of 30 files.
+def merge_tree_levels(nb_inputs, max_fan_in):
+    if nb_inputs < 1:
+        raise Exception("Error: no files to merge!")
+    if max_fan_in < 2:
+        raise Exception("Error: merge tree maximum fan-in " + str(max_fan_in) + " is invalid (should be at least 2)!")
+
+    nb_levels = 1
+    while max_fan_in ** nb_levels < nb_inputs:
+        nb_levels += 1
+
+    # Smallest fan-in merging all files in nb_levels levels
+    fan_in = 2
+    while fan_in ** nb_levels < nb_inputs:
+        fan_in += 1
+
+    levels = []
+    nb_level_inputs = nb_inputs
+    for level in range(nb_levels):
+        nb_groups = int(math.ceil(nb_level_inputs / float(fan_in)))
+        levels.append([nb_level_inputs // nb_groups + (1 if group_idx < nb_level_inputs % nb_groups else 0) for group_idx in range(nb_groups)])
+        nb_level_inputs = nb_groups
+
+    return levels
+
+# Merge of input files into one output file by a tree of jobs merging at most max_fan_in files each.
+#
+# merge(inputs, output) returns the job merging inputs into output.
+# intermediate_file(level, group_idx) returns the output path of merge job group_idx at tree level,
+# these intermediate files being made removable.
+# Jobs merging intermediate files are named <name>.level<level>.<group_idx>, the final merge job being named name.
+# Return jobs level by level, the final merge job last.
+def merge_tree_jobs(name, inputs, output, merge, max_fan_in, intermediate_file):
+    levels = merge_tree_levels(len(inputs), max_fan_in)
+
+    jobs = []
+    level_inputs = inputs
+    for level, group_sizes in enumerate(levels):
+        level_outputs = []
+        for group_idx, group_size in enumerate(group_sizes):
+            group_start = sum(group_sizes[:group_idx])
+            if level < len(levels) - 1:
+                group_output = intermediate_file(level, group_idx)
+                job = merge(level_inputs[group_start:group_start + group_size], group_output)
+                job.name = name + ".level" + str(level) + "." + str(group_idx)
+                job.removable_files.extend([output_file for output_file in job.output_files if output_file not in job.removable_files])
+            else:
+                group_output = output
+                job = merge(level_inputs[group_start:group_start + group_size], group_output)
+                job.name = name
+            jobs.append(job)
+            level_outputs.append(group_output)
+        level_inputs = level_outputs
+
+    log.debug("Job " + name + " merges " + str(len(inputs)) + " file" + ("s" if len(inputs) > 1 else "") + " in " + str(len(levels)) + " level" + ("s" if len(levels) > 1 else "") + " of " + ", ".join([str(len(group_sizes)) for group_sizes in levels]) + " job(s)")
+
+    return jobs
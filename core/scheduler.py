@@ -20,11 +20,23 @@
 ################################################################################
 
 # Python Standard Modules
+import collections
+import datetime
 import json
+import logging
+import multiprocessing
 import os
+import Queue
+import re
+import subprocess
+import threading
 
 # MUGQIC Modules
 from config import *
+from early_clean import *
+from manifest import *
+
+log = logging.getLogger(__name__)
 
 # Output comment separator line
 separator_line = "#" + "-" * 79
@@ -36,6 +48,10 @@ def create_scheduler(type):
         return BatchScheduler()
     elif type == "daemon":
         return DaemonScheduler()
+    elif type == "local":
+        return LocalScheduler()
+    elif type == "slurm":
+        return SlurmScheduler()
     else:
         raise Exception("Error: scheduler type \"" + type + "\" is invalid!")
 
@@ -81,6 +97,57 @@ cd $OUTPUT_DIR
                 )
             )
 
+            # Jobs using removable files check the .done files of the other ones before removing them,
+            # hence .done files left by previous runs of jobs to run are removed first
+            if pipeline.early_clean and pipeline.early_clean.consumer_done_files:
+                print("rm -f \\\n  " + " \\\n  ".join(pipeline.early_clean.consumer_done_files) + "\n")
+
+    # Return JOB_DEPENDENCIES variable definition given dependency job ID variable names
+    def job_dependencies(self, dependency_ids):
+        if dependency_ids:
+            # Chunk JOB_DEPENDENCIES on multiple lines to avoid lines too long
+            max_dependencies_per_line = 50
+            dependency_chunks = [dependency_ids[i:i + max_dependencies_per_line] for i in range(0, len(dependency_ids), max_dependencies_per_line)]
+            job_dependencies = "JOB_DEPENDENCIES=" + ":".join(["$" + dependency_id for dependency_id in dependency_chunks[0]])
+            for dependency_chunk in dependency_chunks[1:]:
+                job_dependencies += "\nJOB_DEPENDENCIES=$JOB_DEPENDENCIES:" + ":".join(["$" + dependency_id for dependency_id in dependency_chunk])
+            return job_dependencies
+        else:
+            return "JOB_DEPENDENCIES="
+
+    # Return job command, wrapped by utils/job_resources.py to write a resource usage record next to the job .done file
+    # if "[DEFAULT] resource_accounting=true"; shell options are prepended to the command run by the wrapper.
+    # With --up2date=checksum, job command is followed by the writing of its file checksum record (see Manifest).
+    # With --early-clean, job command is followed by the removal of its early removable files.
+    def job_command(self, job, shell_options=""):
+        if config.param('DEFAULT', 'resource_accounting', required=False, type='boolean'):
+            command = """\
+{python} {script} run -r {record} -n {job.name}{input_files}{output_files} << '{limit_string}'
+{shell_options}{job.command_with_modules}
+{limit_string}""".format(
+                python=config.param('DEFAULT', 'resource_accounting_python', required=False) or "python",
+                script=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "utils", "job_resources.py"),
+                record=job_resources_record(job),
+                job=job,
+                input_files=" -i " + " ".join(job.input_files) if job.input_files else "",
+                output_files=" -o " + " ".join(job.output_files) if job.output_files else "",
+                shell_options=shell_options,
+                limit_string=os.path.basename(job_resources_record(job))
+            )
+        else:
+            command = shell_options + job.command_with_modules
+
+        if getattr(job, "up2date_checksum", False):
+            command = checksum_command(
+                job,
+                command,
+                config.param('DEFAULT', 'up2date_checksum_python', required=False) or "python",
+                parse_memory(config.param('DEFAULT', 'up2date_full_checksum_max_size', required=False) or str(FULL_CHECKSUM_MAX_SIZE))
+            )
+        if getattr(job, "early_removable_files", None):
+            command = early_clean_command(job, command)
+        return command
+
     def print_step(self, step):
         print("""
 {separator_line}
@@ -98,15 +165,7 @@ class PBSScheduler(Scheduler):
             if step.jobs:
                 self.print_step(step)
                 for job in step.jobs:
-                    if job.dependency_jobs:
-                        # Chunk JOB_DEPENDENCIES on multiple lines to avoid lines too long
-                        max_dependencies_per_line = 50
-                        dependency_chunks = [job.dependency_jobs[i:i + max_dependencies_per_line] for i in range(0, len(job.dependency_jobs), max_dependencies_per_line)]
-                        job_dependencies = "JOB_DEPENDENCIES=" + ":".join(["$" + dependency_job.id for dependency_job in dependency_chunks[0]])
-                        for dependency_chunk in dependency_chunks[1:]:
-                            job_dependencies += "\nJOB_DEPENDENCIES=$JOB_DEPENDENCIES:" + ":".join(["$" + dependency_job.id for dependency_job in dependency_chunk])
-                    else:
-                        job_dependencies = "JOB_DEPENDENCIES="
+                    job_dependencies = self.job_dependencies([dependency_job.id for dependency_job in job.dependency_jobs])
 
                     print("""
 {separator_line}
@@ -118,10 +177,11 @@ JOB_DONE={job.done}
 JOB_OUTPUT_RELATIVE_PATH=$STEP/${{JOB_NAME}}_$TIMESTAMP.o
 JOB_OUTPUT=$JOB_OUTPUT_DIR/$JOB_OUTPUT_RELATIVE_PATH
 COMMAND=$(cat << '{limit_string}'
-{job.command_with_modules}
+{command}
 {limit_string}
 )""".format(
                             job=job,
+                            command=self.job_command(job),
                             job_dependencies=job_dependencies,
                             separator_line=separator_line,
                             limit_string=os.path.basename(job.done)
@@ -139,17 +199,30 @@ exit \$MUGQIC_STATE" | \\
                     # Cluster settings section must match job name prefix before first "."
                     # e.g. "[trimmomatic] cluster_cpu=..." for job name "trimmomatic.readset1"
                     job_name_prefix = job.name.split(".")[0]
+                    cluster_walltime = config.param(job_name_prefix, 'cluster_walltime')
+                    cluster_mem = config.param(job_name_prefix, 'cluster_mem')
+                    if pipeline.resource_sizing:
+                        mem = pipeline.resource_sizing.job_resources(job)[0]
+                        if mem:
+                            cluster_mem = format_cluster_memory(cluster_mem, mem, job_cluster_resources(job)[0])
+                    walltime = job_walltime(pipeline, job)
+                    if walltime and walltime != parse_cluster_walltime(cluster_walltime):
+                        cluster_walltime = format_cluster_walltime(cluster_walltime, walltime)
                     cmd += \
                         config.param(job_name_prefix, 'cluster_submit_cmd') + " " + \
                         config.param(job_name_prefix, 'cluster_other_arg') + " " + \
                         config.param(job_name_prefix, 'cluster_work_dir_arg') + " $OUTPUT_DIR " + \
                         config.param(job_name_prefix, 'cluster_output_dir_arg') + " $JOB_OUTPUT " + \
                         config.param(job_name_prefix, 'cluster_job_name_arg') + " $JOB_NAME " + \
-                        config.param(job_name_prefix, 'cluster_walltime') + " " + \
+                        cluster_walltime + " " + \
                         config.param(job_name_prefix, 'cluster_queue', required=False) + " " + \
                         config.param(job_name_prefix, 'cluster_cpu') + " " + \
-                        config.param(job_name_prefix, 'cluster_mem')
+                        cluster_mem
                         
+                    # Priority option may be rejected or restricted on some sites, hence configurable
+                    if pipeline.critical_path and config.param(job_name_prefix, 'cluster_priority_arg', required=False):
+                        cmd += " " + config.param(job_name_prefix, 'cluster_priority_arg') + " " + str(pipeline.critical_path.priority(job))
+
                     if job.dependency_jobs:
                         cmd += " " + config.param(job_name_prefix, 'cluster_dependency_arg') + "$JOB_DEPENDENCIES"
                     cmd += " " + config.param(job_name_prefix, 'cluster_submit_cmd_suffix')
@@ -187,13 +260,14 @@ JOB_DONE={job.done}
 printf "\\n$SEPARATOR_LINE\\n"
 echo "Begin MUGQIC Job $JOB_NAME at `date +%FT%H:%M:%S`" && \\
 rm -f $JOB_DONE && \\
-{job.command_with_modules}
+{command}
 MUGQIC_STATE=$PIPESTATUS
 echo "End MUGQIC Job $JOB_NAME at `date +%FT%H:%M:%S`"
 echo MUGQICexitStatus:$MUGQIC_STATE
 if [ $MUGQIC_STATE -eq 0 ] ; then touch $JOB_DONE ; else exit $MUGQIC_STATE ; fi
 """.format(
                             job=job,
+                            command=self.job_command(job),
                             separator_line=separator_line
                         )
                     )
@@ -215,19 +289,494 @@ class DaemonScheduler(Scheduler):
                         "job_input_files": job.input_files,
                         "job_output_files": job.output_files,
                         "job_dependencies": [dependency_job.id for dependency_job in job.dependency_jobs],
-                        "job_cluster_options": {
-                            # Cluster settings section must match job name prefix before first "."
-                            # e.g. "[trimmomatic] cluster_cpu=..." for job name "trimmomatic.readset1"
-                            'cluster_submit_cmd': config.param(job.name.split(".")[0], 'cluster_submit_cmd'),
-                            'cluster_other_arg': config.param(job.name.split(".")[0], 'cluster_other_arg'),
-                            'cluster_work_dir_arg': config.param(job.name.split(".")[0], 'cluster_work_dir_arg') + " " + pipeline.output_dir,
-                            'cluster_output_dir_arg': config.param(job.name.split(".")[0], 'cluster_output_dir_arg') + " " + os.path.join(pipeline.output_dir, "job_output", step.name, job.name + ".o"),
-                            'cluster_job_name_arg': config.param(job.name.split(".")[0], 'cluster_job_name_arg') + " " + job.name,
-                            'cluster_walltime': config.param(job.name.split(".")[0], 'cluster_walltime'),
-                            'cluster_queue': config.param(job.name.split(".")[0], 'cluster_queue'),
-                            'cluster_cpu': config.param(job.name.split(".")[0], 'cluster_cpu')
-                        },
+                        "job_cluster_options": self.cluster_options(pipeline, step, job),
                         "job_done": job.done
                     } for job in step.jobs]
                 } for step in pipeline.step_range]
             }}, indent=4)
+
+    def cluster_options(self, pipeline, step, job):
+        # Cluster settings section must match job name prefix before first "."
+        # e.g. "[trimmomatic] cluster_cpu=..." for job name "trimmomatic.readset1"
+        job_name_prefix = job.name.split(".")[0]
+        cluster_walltime = config.param(job_name_prefix, 'cluster_walltime')
+        walltime = job_walltime(pipeline, job)
+        if walltime and walltime != parse_cluster_walltime(cluster_walltime):
+            cluster_walltime = format_cluster_walltime(cluster_walltime, walltime)
+        return {
+            'cluster_submit_cmd': config.param(job_name_prefix, 'cluster_submit_cmd'),
+            'cluster_other_arg': config.param(job_name_prefix, 'cluster_other_arg'),
+            'cluster_work_dir_arg': config.param(job_name_prefix, 'cluster_work_dir_arg') + " " + pipeline.output_dir,
+            'cluster_output_dir_arg': config.param(job_name_prefix, 'cluster_output_dir_arg') + " " + os.path.join(pipeline.output_dir, "job_output", step.name, job.name + ".o"),
+            'cluster_job_name_arg': config.param(job_name_prefix, 'cluster_job_name_arg') + " " + job.name,
+            'cluster_walltime': cluster_walltime,
+            'cluster_queue': config.param(job_name_prefix, 'cluster_queue'),
+            'cluster_cpu': config.param(job_name_prefix, 'cluster_cpu')
+        }
+
+# Run the job graph on the local host with a pool of workers, as long as job CPU and memory requests
+# from cluster_cpu/cluster_mem config parameters fit in the host budget ([DEFAULT] local_max_cpu and
+# local_max_mem, all cores and physical memory by default). Jobs are started in pipeline order, or critical jobs
+# first with --critical-path, as soon as their dependencies succeed; dependents of failed jobs are not run.
+# Job .done and output files are the same as the ones of PBS and batch schedulers.
+class LocalScheduler(Scheduler):
+    def submit(self, pipeline):
+        if not pipeline.jobs:
+            log.info("No job to run... skipping")
+            return
+
+        max_cpu = config.param('DEFAULT', 'local_max_cpu', required=False, type='posint') or multiprocessing.cpu_count()
+        if config.param('DEFAULT', 'local_max_mem', required=False):
+            max_mem = parse_memory(config.param('DEFAULT', 'local_max_mem'))
+        else:
+            max_mem = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+        log.info("Run " + str(len(pipeline.jobs)) + " job" + ("s" if len(pipeline.jobs) > 1 else "") + " locally with " + str(max_cpu) + " CPUs and " + format_memory(max_mem) + " of memory...")
+
+        # Same timestamp format as job output files of PBS and batch schedulers
+        timestamp = pipeline.timestamp.replace(":", ".")
+        job_output_dir = os.path.join(pipeline.output_dir, "job_output")
+        job_list = os.path.join(job_output_dir, pipeline.__class__.__name__ + "_job_list_" + timestamp)
+
+        # Jobs using removable files check the .done files of the other ones before removing them,
+        # hence .done files left by previous runs of jobs to run are removed first
+        if pipeline.early_clean:
+            for done_file in pipeline.early_clean.consumer_done_files:
+                if os.path.exists(os.path.join(pipeline.output_dir, done_file)):
+                    os.remove(os.path.join(pipeline.output_dir, done_file))
+
+        steps = {}
+        resources = {}
+        ranks = {}
+        remaining_dependencies = {}
+        dependents = {}
+        for step in pipeline.step_range:
+            if not os.path.isdir(os.path.join(job_output_dir, step.name)):
+                os.makedirs(os.path.join(job_output_dir, step.name))
+            for job in step.jobs:
+                steps[job] = step
+                ranks[job] = len(ranks)
+                cpu, mem = job_cluster_resources(job)
+                if pipeline.resource_sizing:
+                    mem = pipeline.resource_sizing.job_resources(job)[0] or mem
+                if cpu > max_cpu or mem > max_mem:
+                    log.warning("Job " + job.name + " requests " + str(cpu) + " CPUs and " + format_memory(mem) + " of memory, more than local budget: it will run alone")
+                resources[job] = (min(cpu, max_cpu), min(mem, max_mem))
+                remaining_dependencies[job] = set(job.dependency_jobs)
+                dependents[job] = []
+        for job in pipeline.jobs:
+            for dependency_job in job.dependency_jobs:
+                dependents[dependency_job].append(job)
+
+        # Start critical jobs first if --critical-path is set, otherwise jobs in pipeline order
+        if pipeline.critical_path:
+            priority = lambda job: (-pipeline.critical_path.bottom_level(job), ranks[job])
+        else:
+            priority = lambda job: ranks[job]
+        ready_jobs = sorted([job for job in pipeline.jobs if not remaining_dependencies[job]], key=priority)
+        running_jobs = {}
+        failed_jobs = []
+        skipped_jobs = set()
+        nb_succeeded_jobs = 0
+        free_cpu = max_cpu
+        free_mem = max_mem
+        results = Queue.Queue()
+
+        try:
+            while ready_jobs or running_jobs:
+                # Start ready jobs in priority order, as long as their resources are available
+                for job in list(ready_jobs):
+                    cpu, mem = resources[job]
+                    if cpu <= free_cpu and mem <= free_mem:
+                        ready_jobs.remove(job)
+                        free_cpu -= cpu
+                        free_mem -= mem
+                        job_output = os.path.join(job_output_dir, steps[job].name, job.name + "_" + timestamp + ".o")
+                        with open(job_list, 'a') as job_list_file:
+                            job_list_file.write("\t".join([job.id, job.name, ":".join([dependency_job.id for dependency_job in job.dependency_jobs]), os.path.relpath(job_output, job_output_dir)]) + "\n")
+                        running_jobs[job] = None
+                        thread = threading.Thread(target=self.run_job, args=(pipeline, steps[job], job, job_output, running_jobs, results))
+                        thread.daemon = True
+                        thread.start()
+                        log.info("Job " + job.name + " started (" + str(cpu) + " CPU" + ("s" if cpu > 1 else "") + ", " + format_memory(mem) + ")")
+
+                # Wait for next job to finish; use a timeout so that the wait can be interrupted
+                while True:
+                    try:
+                        job, returncode = results.get(True, 1)
+                        break
+                    except Queue.Empty:
+                        pass
+
+                del running_jobs[job]
+                cpu, mem = resources[job]
+                free_cpu += cpu
+                free_mem += mem
+
+                if returncode == 0:
+                    nb_succeeded_jobs += 1
+                    log.info("Job " + job.name + " succeeded")
+                    for dependent_job in dependents[job]:
+                        remaining_dependencies[dependent_job].discard(job)
+                        if not remaining_dependencies[dependent_job] and dependent_job not in skipped_jobs:
+                            ready_jobs.append(dependent_job)
+                    ready_jobs.sort(key=priority)
+                else:
+                    failed_jobs.append(job)
+                    log.error("Job " + job.name + " failed with exit status " + str(returncode) + ", see " + os.path.join(job_output_dir, steps[job].name, job.name + "_" + timestamp + ".o"))
+                    # Skip all jobs depending directly or indirectly on the failed job
+                    remaining_jobs = list(dependents[job])
+                    while remaining_jobs:
+                        dependent_job = remaining_jobs.pop()
+                        if dependent_job not in skipped_jobs:
+                            skipped_jobs.add(dependent_job)
+                            remaining_jobs.extend(dependents[dependent_job])
+        except KeyboardInterrupt:
+            for process in running_jobs.values():
+                if process:
+                    process.terminate()
+            raise
+
+        log.info(str(nb_succeeded_jobs) + " job" + ("s" if nb_succeeded_jobs > 1 else "") + " succeeded, " + str(len(failed_jobs)) + " failed, " + str(len(skipped_jobs)) + " skipped\n")
+        if failed_jobs:
+            raise Exception("Error: job" + ("s" if len(failed_jobs) > 1 else "") + " failed: " + ", ".join([job.name for job in failed_jobs]) + "!")
+
+    # Run job in a bash subprocess with the same semantics as batch scheduler jobs,
+    # then put the job and its exit status in the results queue
+    def run_job(self, pipeline, step, job, job_output, running_jobs, results):
+        returncode = 1
+        try:
+            with open(job_output, 'w') as output:
+                output.write("Begin MUGQIC Job " + job.name + " at " + datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S") + "\n")
+                output.flush()
+
+                done = os.path.join(pipeline.output_dir, job.done)
+                if os.path.exists(done):
+                    os.remove(done)
+
+                environment = dict(os.environ, OUTPUT_DIR=pipeline.output_dir, JOB_OUTPUT_DIR=os.path.join(pipeline.output_dir, "job_output"), STEP=step.name, JOB_NAME=job.name, JOB_DONE=job.done)
+                process = subprocess.Popen(["bash", "-c", self.job_command(job, "set -eu -o pipefail\n")], cwd=pipeline.output_dir, stdout=output, stderr=subprocess.STDOUT, env=environment)
+                running_jobs[job] = process
+                returncode = process.wait()
+
+                output.write("End MUGQIC Job " + job.name + " at " + datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S") + "\n")
+                output.write("MUGQICexitStatus:" + str(returncode) + "\n")
+
+            if returncode == 0:
+                open(done, 'a').close()
+                os.utime(done, None)
+        except Exception as e:
+            log.error("Job " + job.name + " could not be run: " + str(e))
+        finally:
+            results.put((job, returncode))
+
+# Submit jobs to SLURM with sbatch. Jobs of the same step, job name prefix and resource request are grouped
+# into array jobs with one task per job, which reduces the number of submissions by orders of magnitude for
+# steps with many similar jobs. Resource requests are translated from cluster_cpu, cluster_mem and
+# cluster_walltime config parameters; other sbatch options can be set with slurm_other_arg.
+# An array depends on each task of other arrays with "aftercorr" when its task N only depends on task N
+# of these arrays, otherwise on the array tasks its own tasks depend on, or whole arrays if all their tasks are needed.
+class SlurmScheduler(Scheduler):
+    def submit(self, pipeline):
+        self.print_header(pipeline)
+
+        # SLURM default MaxArraySize is 1001, i.e. task IDs from 0 to 1000
+        max_array_size = config.param('DEFAULT', 'slurm_max_array_size', required=False, type='posint') or 1000
+
+        # Job -> (array ID variable name or None if job is submitted alone, task ID)
+        job_tasks = {}
+        # Array ID variable name -> number of tasks
+        array_sizes = {}
+        nb_submissions = 0
+
+        for step in pipeline.step_range:
+            if step.jobs:
+                self.print_step(step)
+                for array_index, (submit_options, array) in enumerate(self.step_arrays(pipeline, step, max_array_size)):
+                    if len(array) == 1:
+                        self.print_job(array[0], self.priority_options(pipeline, array, submit_options), job_tasks, array_sizes)
+                        job_tasks[array[0]] = (None, 1)
+                    else:
+                        array_id = step.name + "_" + str(array_index + 1) + "_ARRAY_ID"
+                        self.print_array(array_id, array_index + 1, array, self.priority_options(pipeline, array, submit_options), job_tasks, array_sizes)
+                        array_sizes[array_id] = len(array)
+                        for task_id, job in enumerate(array, 1):
+                            job_tasks[job] = (array_id, task_id)
+                    nb_submissions += 1
+
+        if pipeline.jobs:
+            log.info(str(len(pipeline.jobs)) + " job" + ("s" if len(pipeline.jobs) > 1 else "") + " in " + str(nb_submissions) + " SLURM submission" + ("s" if nb_submissions > 1 else "") + "\n")
+
+    # Return sbatch options with a nice value for jobs submitted together if --critical-path is set, based on their highest priority
+    def priority_options(self, pipeline, jobs, submit_options):
+        if pipeline.critical_path:
+            return submit_options + " --nice=" + str(1023 - max([pipeline.critical_path.priority(job) for job in jobs]))
+        else:
+            return submit_options
+
+    # Return sbatch resource options of a job
+    def submit_options(self, pipeline, job):
+        # Cluster settings section must match job name prefix before first "."
+        # e.g. "[trimmomatic] cluster_cpu=..." for job name "trimmomatic.readset1"
+        job_name_prefix = job.name.split(".")[0]
+        cpu, mem = job_cluster_resources(job)
+        walltime = job_walltime(pipeline, job)
+        if pipeline.resource_sizing:
+            mem = pipeline.resource_sizing.job_resources(job)[0] or mem
+
+        submit_options = "--nodes=1 --cpus-per-task=" + str(cpu)
+        if mem:
+            submit_options += " --mem=" + str(-(-mem // 1024 ** 2)) + "M"
+        if walltime:
+            submit_options += " --time=" + format_duration(walltime)
+        if config.param(job_name_prefix, 'slurm_other_arg', required=False):
+            submit_options += " " + config.param(job_name_prefix, 'slurm_other_arg')
+        return submit_options
+
+    # Return the list of (sbatch options, jobs) arrays of a step, in job order.
+    # Jobs are grouped by job name prefix and sbatch options. Arrays are submitted in creation order, hence a job
+    # depending on a job of its group's array or of an array created after it starts a new array.
+    def step_arrays(self, pipeline, step, max_array_size):
+        arrays = []
+        # Key -> index in arrays of the array jobs of this key are added to
+        open_arrays = {}
+        # Job of the step -> index in arrays of its array
+        job_arrays = {}
+        for job in step.jobs:
+            submit_options = self.submit_options(pipeline, job)
+            key = (job.name.split(".")[0], submit_options)
+            array_index = open_arrays.get(key)
+            if array_index is None or len(arrays[array_index][1]) >= max_array_size or [dependency_job for dependency_job in job.dependency_jobs if job_arrays.get(dependency_job, -1) >= array_index]:
+                array_index = len(arrays)
+                arrays.append((submit_options, []))
+                open_arrays[key] = array_index
+            arrays[array_index][1].append(job)
+            job_arrays[job] = array_index
+        return arrays
+
+    # Return (dependency type, dependency ID variable names) of a group of jobs submitted together
+    def dependencies(self, jobs, job_tasks, array_sizes):
+        # Task-by-task dependencies if each task N depends exactly on tasks N of the same arrays
+        if len(jobs) > 1:
+            correlated_array_ids = None
+            for task_id, job in enumerate(jobs, 1):
+                dependency_tasks = [job_tasks[dependency_job] for dependency_job in job.dependency_jobs]
+                if not dependency_tasks or [array_id for array_id, dependency_task_id in dependency_tasks if array_id is None or dependency_task_id != task_id]:
+                    correlated_array_ids = None
+                    break
+                array_ids = sorted([array_id for array_id, dependency_task_id in dependency_tasks])
+                if correlated_array_ids is None:
+                    correlated_array_ids = array_ids
+                elif array_ids != correlated_array_ids:
+                    correlated_array_ids = None
+                    break
+            if correlated_array_ids:
+                return "aftercorr", correlated_array_ids
+
+        # Otherwise, all tasks depend on the union of their dependencies
+        dependency_jobs = []
+        dependency_job_set = set()
+        for job in jobs:
+            for dependency_job in job.dependency_jobs:
+                if dependency_job not in dependency_job_set:
+                    dependency_jobs.append(dependency_job)
+                    dependency_job_set.add(dependency_job)
+        array_dependency_counts = collections.Counter([job_tasks[dependency_job][0] for dependency_job in dependency_jobs])
+
+        dependency_ids = []
+        for dependency_job in dependency_jobs:
+            array_id = job_tasks[dependency_job][0]
+            if array_id and array_dependency_counts[array_id] == array_sizes[array_id]:
+                # Depend on the whole array once instead of on each of its tasks
+                if array_id not in dependency_ids:
+                    dependency_ids.append(array_id)
+            else:
+                dependency_ids.append(dependency_job.id)
+        return "afterok", dependency_ids
+
+    def print_job(self, job, submit_options, job_tasks, array_sizes):
+        dependency_type, dependency_ids = self.dependencies([job], job_tasks, array_sizes)
+
+        print("""
+{separator_line}
+# JOB: {job.id}: {job.name}
+{separator_line}
+JOB_NAME={job.name}
+{job_dependencies}
+JOB_DONE={job.done}
+JOB_OUTPUT_RELATIVE_PATH=$STEP/${{JOB_NAME}}_$TIMESTAMP.o
+JOB_OUTPUT=$JOB_OUTPUT_DIR/$JOB_OUTPUT_RELATIVE_PATH
+COMMAND=$(cat << '{limit_string}'
+{command}
+{limit_string}
+)
+{job.id}=$(echo "#!/bin/bash
+rm -f $JOB_DONE && $COMMAND
+MUGQIC_STATE=\$PIPESTATUS
+echo MUGQICexitStatus:\$MUGQIC_STATE
+if [ \$MUGQIC_STATE -eq 0 ] ; then touch $JOB_DONE ; fi
+exit \$MUGQIC_STATE" | \\
+sbatch --parsable -D $OUTPUT_DIR -o $JOB_OUTPUT -J $JOB_NAME {submit_options}{dependency_option} | cut -d ";" -f 1)
+echo "${job.id}\t$JOB_NAME\t$JOB_DEPENDENCIES\t$JOB_OUTPUT_RELATIVE_PATH" >> $JOB_LIST
+""".format(
+                job=job,
+                command=self.job_command(job),
+                job_dependencies=self.job_dependencies(dependency_ids),
+                separator_line=separator_line,
+                limit_string=os.path.basename(job.done),
+                submit_options=submit_options,
+                dependency_option=" --dependency=" + dependency_type + ":$JOB_DEPENDENCIES" if dependency_ids else ""
+            )
+        )
+
+    # Print array script with one case per task, its submission, and its task ID variables
+    def print_array(self, array_id, array_index, jobs, submit_options, job_tasks, array_sizes):
+        dependency_type, dependency_ids = self.dependencies(jobs, job_tasks, array_sizes)
+        array_name = jobs[0].name.split(".")[0]
+
+        print("""
+{separator_line}
+# ARRAY: {array_id}: {array_name}: {nb_tasks} jobs
+{separator_line}
+ARRAY_NAME={array_name}
+{job_dependencies}
+ARRAY_OUTPUT_RELATIVE_PATH=$STEP/${{ARRAY_NAME}}_{array_index}_$TIMESTAMP
+ARRAY_SCRIPT=$JOB_OUTPUT_DIR/$ARRAY_OUTPUT_RELATIVE_PATH.sh
+cat > $ARRAY_SCRIPT << '{limit_string}'
+#!/bin/bash
+case $SLURM_ARRAY_TASK_ID in""".format(
+                separator_line=separator_line,
+                array_id=array_id,
+                array_name=array_name,
+                array_index=array_index,
+                nb_tasks=len(jobs),
+                job_dependencies=self.job_dependencies(dependency_ids),
+                limit_string=array_id + "_SCRIPT"
+            )
+        )
+
+        for task_id, job in enumerate(jobs, 1):
+            print("""{task_id})
+# JOB: {job.id}: {job.name}
+JOB_NAME={job.name}
+JOB_DONE={job.done}
+rm -f $JOB_DONE && {command}
+MUGQIC_STATE=$PIPESTATUS
+;;""".format(task_id=task_id, job=job, command=self.job_command(job)))
+
+        print("""*)
+echo "Error: no job for array task ID $SLURM_ARRAY_TASK_ID!"
+exit 1
+;;
+esac
+echo MUGQICexitStatus:$MUGQIC_STATE
+if [ $MUGQIC_STATE -eq 0 ] ; then touch $JOB_DONE ; fi
+exit $MUGQIC_STATE
+{limit_string}
+{array_id}=$(sbatch --parsable --array=1-{nb_tasks} -D $OUTPUT_DIR -o $JOB_OUTPUT_DIR/$ARRAY_OUTPUT_RELATIVE_PATH.%a.o -J $ARRAY_NAME {submit_options}{dependency_option} $ARRAY_SCRIPT | cut -d ";" -f 1)""".format(
+                limit_string=array_id + "_SCRIPT",
+                array_id=array_id,
+                nb_tasks=len(jobs),
+                submit_options=submit_options,
+                dependency_option=" --dependency=" + dependency_type + ":$JOB_DEPENDENCIES" if dependency_ids else ""
+            )
+        )
+
+        # Task job ID variables are used by dependencies and the job list file
+        for task_id, job in enumerate(jobs, 1):
+            print(job.id + "=${" + array_id + "}_" + str(task_id) + "\n" + \
+                "echo \"$" + job.id + "\t" + job.name + "\t$JOB_DEPENDENCIES\t$ARRAY_OUTPUT_RELATIVE_PATH." + str(task_id) + ".o\" >> $JOB_LIST")
+        print("")
+
+# Return job resource usage record file written by utils/job_resources.py next to the job .done file
+def job_resources_record(job):
+    return re.sub("\.done$", ".resources", job.done)
+
+# Return the number of CPUs and the memory in bytes requested by a job in its cluster settings
+def job_cluster_resources(job):
+    # Cluster settings section must match job name prefix before first "."
+    # e.g. "[trimmomatic] cluster_cpu=..." for job name "trimmomatic.readset1"
+    job_name_prefix = job.name.split(".")[0]
+    cluster_settings = config.param(job_name_prefix, 'cluster_cpu', required=False) + " " + config.param(job_name_prefix, 'cluster_mem', required=False)
+    cpu = parse_cluster_cpu(cluster_settings)
+    return cpu, parse_cluster_memory(cluster_settings, cpu)
+
+# Return the walltime in seconds requested by a job: its prediction from history with --resource-sizing, else its
+# cluster_walltime config value; packed jobs run their jobs one after the other, hence request the sum of their walltimes.
+# Return None if unknown.
+def job_walltime(pipeline, job):
+    if getattr(job, "packed_jobs", None):
+        walltimes = [job_walltime(pipeline, job_item) for job_item in job.packed_jobs]
+        return None if None in walltimes else sum(walltimes)
+    elif pipeline.resource_sizing and pipeline.resource_sizing.job_resources(job)[1]:
+        return pipeline.resource_sizing.job_resources(job)[1]
+    else:
+        return parse_cluster_walltime(config.param(job.name.split(".")[0], 'cluster_walltime', required=False))
+
+# Return the number of CPUs in cluster settings e.g. "-l nodes=1:ppn=12" or "--cpus-per-task=12", 1 by default
+def parse_cluster_cpu(cluster_settings):
+    match = re.search("(?:ppn|cpus-per-task)[= ](\d+)", cluster_settings)
+    return int(match.group(1)) if match else 1
+
+# Return the memory in bytes in cluster settings e.g. "-l pmem=2700m" (per CPU) or "-l mem=12gb" (total), 0 by default
+def parse_cluster_memory(cluster_settings, cpu=1):
+    match = re.search("(?:pmem|mem-per-cpu)[= ](\S+)", cluster_settings)
+    if match:
+        return parse_memory(match.group(1)) * cpu
+    match = re.search("(?:^|[\s,:-])mem[= ](\S+)", cluster_settings)
+    if match:
+        return parse_memory(match.group(1))
+    return 0
+
+# Return the number of seconds in cluster walltime settings e.g. "-l walltime=24:00:0" or "--time=1-00:00:00", None if not set
+def parse_cluster_walltime(cluster_settings):
+    match = re.search("(?:walltime|time)[= ](\S+)", cluster_settings)
+    return parse_duration(match.group(1)) if match else None
+
+# Return cluster memory settings requesting the given memory in bytes, in the same form as the given cluster settings
+# e.g. "-l pmem=2700m" with 4 CPUs and 16 GB -> "-l pmem=4096m", "--mem=12G" -> "--mem=16384m"; "-l mem=..." if not set
+def format_cluster_memory(cluster_settings, mem, cpu=1):
+    if re.search("(?:pmem|mem-per-cpu)[= ]", cluster_settings):
+        return re.sub("((?:pmem|mem-per-cpu)[= ])\S+", lambda match: match.group(1) + str(-(-mem // (cpu * 1024 ** 2))) + "m", cluster_settings)
+    elif re.search("(?:^|[\s,:-])mem[= ]", cluster_settings):
+        return re.sub("((?:^|[\s,:-])mem[= ])\S+", lambda match: match.group(1) + str(-(-mem // 1024 ** 2)) + "m", cluster_settings)
+    else:
+        return (cluster_settings + " " if cluster_settings.strip() else "") + "-l mem=" + str(-(-mem // 1024 ** 2)) + "m"
+
+# Return cluster walltime settings requesting the given number of seconds, in the same form as the given cluster settings
+# e.g. "-l walltime=24:00:0" -> "-l walltime=36:00:00", "--time=1-00:00:00" -> "--time=1-12:00:00"; "-l walltime=..." if not set
+def format_cluster_walltime(cluster_settings, seconds):
+    if re.search("walltime[= ]", cluster_settings):
+        return re.sub("(walltime[= ])\S+", lambda match: match.group(1) + "%d:%02d:%02d" % (seconds // 3600, seconds % 3600 // 60, seconds % 60), cluster_settings)
+    elif re.search("time[= ]", cluster_settings):
+        return re.sub("(time[= ])\S+", lambda match: match.group(1) + format_duration(seconds), cluster_settings)
+    else:
+        return (cluster_settings + " " if cluster_settings.strip() else "") + "-l walltime=%d:%02d:%02d" % (seconds // 3600, seconds % 3600 // 60, seconds % 60)
+
+# Return the number of seconds of a duration e.g. "3600", "2:30:00", "24:00:0", "1-12:00:00" (days-hours:minutes:seconds)
+def parse_duration(value):
+    match = re.search("^(?:(\d+)-)?(\d+)(?::(\d+))?(?::(\d+))?$", value.strip())
+    if match:
+        days, first, second, third = [int(group) if group else None for group in match.groups()]
+        if second is None:
+            # Seconds only, or hours only after days
+            return days * 86400 + first * 3600 if days is not None else first
+        else:
+            # Hours:minutes or hours:minutes:seconds
+            return ((days or 0) * 24 + first) * 3600 + second * 60 + (third or 0)
+    else:
+        raise Exception("Error: duration \"" + value + "\" is invalid (should match e.g. 3600, 2:30:00, 1-12:00:00)!")
+
+# Return "days-hours:minutes:seconds" format of a number of seconds, as accepted by SLURM, without days if less than one
+def format_duration(seconds):
+    return ("%d-" % (seconds // 86400) if seconds >= 86400 else "") + "%02d:%02d:%02d" % (seconds % 86400 // 3600, seconds % 3600 // 60, seconds % 60)
+
+# Return the number of bytes of a memory value e.g. "2700m", "10gb", "12G"; values without unit are in bytes
+def parse_memory(value):
+    match = re.search("^(\d+(?:\.\d+)?)([kmgt]?)b?$", value.strip(), re.IGNORECASE)
+    if match:
+        return int(float(match.group(1)) * 1024 ** "bkmgt".index(match.group(2).lower() or "b"))
+    else:
+        raise Exception("Error: memory value \"" + value + "\" is invalid (should match e.g. 2700m, 10gb, 12G)!")
+
+def format_memory(bytes):
+    return "%.1fG" % (bytes / 1024.0 ** 3)
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+
+################################################################################
+# Copyright (C) 2014, 2015 GenAP, McGill University and Genome Quebec Innovation Centre
+#
+# This file is part of MUGQIC Pipelines.
+#
+# MUGQIC Pipelines is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUGQIC Pipelines is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with MUGQIC Pipelines.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+# Python Standard Modules
+import glob
+import logging
+import multiprocessing.pool
+import os
+import stat
+import time
+
+log = logging.getLogger(__name__)
+
+# Cache of file system metadata shared by config parameter validation, job dependencies and up-to-date checks.
+# Files are not expected to change while jobs are created, hence cached values are never invalidated.
+class StatCache(object):
+
+    def __init__(self):
+        # Path -> (lstat result, stat result), or (None, None) if path does not exist
+        self._stats = {}
+        # Pattern -> sorted list of matching paths
+        self._globs = {}
+
+        # Set of paths and ('glob', pattern) tuples looked up while recording, None when not recording
+        self._recorded_lookups = None
+
+        # Thread pool created on first prefetch and reused for following ones
+        self._pool = None
+        self._nb_threads = 0
+
+        self._hits = 0
+        self._misses = 0
+        self._prefetched = 0
+        self._stat_time = 0.0
+
+    @property
+    def hits(self):
+        return self._hits
+
+    @property
+    def misses(self):
+        return self._misses
+
+    @property
+    def prefetched(self):
+        return self._prefetched
+
+    @property
+    def stat_time(self):
+        return self._stat_time
+
+    # Return (lstat, stat) results of path, with only one system call if path is not a symbolic link
+    @staticmethod
+    def _stat(path):
+        try:
+            lstat_result = os.lstat(path)
+        except OSError:
+            return (None, None)
+        if stat.S_ISLNK(lstat_result.st_mode):
+            try:
+                return (lstat_result, os.stat(path))
+            except OSError:
+                # Broken symbolic link
+                return (lstat_result, None)
+        else:
+            return (lstat_result, lstat_result)
+
+    def _lookup(self, path):
+        if self._recorded_lookups is not None:
+            self._recorded_lookups.add(path)
+        if path in self._stats:
+            self._hits += 1
+        else:
+            self._misses += 1
+            start_time = time.time()
+            self._stats[path] = self._stat(path)
+            self._stat_time += time.time() - start_time
+        return self._stats[path]
+
+    # Same as os.lstat() but return None instead of raising OSError if path does not exist
+    def lstat(self, path):
+        return self._lookup(path)[0]
+
+    # Same as os.stat() but return None instead of raising OSError if path does not exist
+    def stat(self, path):
+        return self._lookup(path)[1]
+
+    # Set the cached stat result of path, or None if path must be considered missing, whatever the file system says
+    # e.g. for files removed early but still considered present (see EarlyClean)
+    def set(self, path, stat_result):
+        self._stats[path] = (stat_result, stat_result)
+
+    def exists(self, path):
+        return self.stat(path) is not None
+
+    def isfile(self, path):
+        stat_result = self.stat(path)
+        return stat_result is not None and stat.S_ISREG(stat_result.st_mode)
+
+    def isdir(self, path):
+        stat_result = self.stat(path)
+        return stat_result is not None and stat.S_ISDIR(stat_result.st_mode)
+
+    def glob(self, pattern):
+        if self._recorded_lookups is not None:
+            self._recorded_lookups.add(('glob', pattern))
+        if pattern in self._globs:
+            self._hits += 1
+        else:
+            self._misses += 1
+            start_time = time.time()
+            self._globs[pattern] = sorted(glob.glob(pattern))
+            self._stat_time += time.time() - start_time
+        return self._globs[pattern]
+
+    # Record paths and glob patterns looked up from now on, until stop_recording() is called
+    def start_recording(self):
+        self._recorded_lookups = set()
+
+    # Record that the content of a file is used, e.g. to plan jobs, so that recorded lookups also observe
+    # its size and modification time
+    def record_content(self, path):
+        if self._recorded_lookups is not None:
+            self._recorded_lookups.add(('content', path))
+
+    # Stop recording lookups and return the file system state they observed, as a dict:
+    # path -> file type ("file", "directory", "other" or None if path does not exist), ('glob', pattern) -> matching paths,
+    # ('content', path) -> (size, modification time) or None if path does not exist
+    def stop_recording(self):
+        recorded_lookups = self._recorded_lookups
+        self._recorded_lookups = None
+        return dict([(lookup, self.observe(lookup)) for lookup in recorded_lookups])
+
+    # Return the file system state of a recorded path or glob pattern lookup, from cached values
+    def observe(self, lookup):
+        if isinstance(lookup, tuple) and lookup[0] == 'content':
+            file_stat = self.stat(lookup[1])
+            return (file_stat.st_size, file_stat.st_mtime) if file_stat else None
+        elif isinstance(lookup, tuple):
+            return self.glob(lookup[1])
+        elif self.isfile(lookup):
+            return "file"
+        elif self.isdir(lookup):
+            return "directory"
+        elif self.exists(lookup):
+            return "other"
+        else:
+            return None
+
+    # Stat concurrently all paths not cached yet, since metadata round trips on network file systems
+    # are mostly latency and can be overlapped
+    def prefetch(self, paths, nb_threads=16):
+        remaining_paths = list(set([path for path in paths if path not in self._stats]))
+        if remaining_paths:
+            start_time = time.time()
+            if nb_threads > 1 and len(remaining_paths) > 1:
+                if nb_threads != self._nb_threads:
+                    self.close()
+                    self._pool = multiprocessing.pool.ThreadPool(nb_threads)
+                    self._nb_threads = nb_threads
+                stats = self._pool.map(self._stat, remaining_paths)
+            else:
+                stats = [self._stat(path) for path in remaining_paths]
+            self._stats.update(zip(remaining_paths, stats))
+            self._prefetched += len(remaining_paths)
+            self._stat_time += time.time() - start_time
+            log.debug("Prefetched " + str(len(remaining_paths)) + " file stat" + ("s" if len(remaining_paths) > 1 else "") + " in " + "%.3f" % (time.time() - start_time) + "s")
+
+    def close(self):
+        if self._pool:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+            self._nb_threads = 0
+
+    def log_statistics(self):
+        log.info("File stat cache: " + str(self.prefetched) + " prefetched, " + str(self.hits) + " hits, " + str(self.misses) + " misses, " + "%.3f" % self.stat_time + "s spent in stat calls\n")
+
+# Global stat cache object used throughout the whole pipeline
+stat_cache = StatCache()
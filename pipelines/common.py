@@ -61,7 +61,7 @@ class MUGQICPipeline(Pipeline):
     @property
     def samples(self):
         if not hasattr(self, "_samples"):
-            self._samples = list(collections.OrderedDict.fromkeys([readset.sample for readset in self.readsets]))
+            self._samples = SampleRegistry(collections.OrderedDict.fromkeys([readset.sample for readset in self.readsets]))
         return self._samples
 
     def mugqic_log(self):
@@ -83,7 +83,7 @@ wget "{server}?{request}" --quiet --output-document=/dev/null
 
     def submit_jobs(self):
         super(MUGQICPipeline, self).scheduler.submit(self)
-        if self.jobs and self.args.job_scheduler in ["pbs", "batch"]:
+        if self.jobs and self.args.job_scheduler in ["pbs", "batch", "slurm"]:
             self.mugqic_log()
 
 
@@ -99,7 +99,8 @@ class Illumina(MUGQICPipeline):
     def readsets(self):
         if not hasattr(self, "_readsets"):
             if self.args.readsets:
-                self._readsets = parse_illumina_readset_file(self.args.readsets.name)
+                with profiler.timer("parse_readsets", 2, "included in step create_jobs"):
+                    self._readsets = parse_illumina_readset_file(self.args.readsets.name)
             else:
                 self.argparser.error("argument -r/--readsets is required!")
         return self._readsets
@@ -117,7 +118,8 @@ class Illumina(MUGQICPipeline):
     def contrasts(self):
         if not hasattr(self, "_contrasts"):
             if self.args.design:
-                self._contrasts = parse_design_file(self.args.design.name, self.samples)
+                with profiler.timer("parse_design", 2, "included in step create_jobs"):
+                    self._contrasts = parse_design_file(self.args.design.name, self.samples)
             else:
                 self.argparser.error("argument -d/--design is required!")
         return self._contrasts
@@ -33,8 +33,10 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(
 from core.config import *
 from core.job import *
 from core.pipeline import *
+from core.scatter_gather import *
 from bfx.readset import *
 from bfx.sequence_dictionary import *
+from bfx.genome_partition import *
 
 from bfx import bvatools
 from bfx import bwa
@@ -86,11 +88,126 @@ class DnaSeq(common.Illumina):
             self._sequence_dictionary = parse_sequence_dictionary_file(config.param('DEFAULT', 'genome_dictionary', type='filepath'))
         return self._sequence_dictionary
 
+    # Gaps (e.g. runs of N) of the reference, where scatter steps can safely cut sequences
+    @property
+    def genome_gaps(self):
+        if not hasattr(self, "_genome_gaps"):
+            genome_gap_bed = config.param('DEFAULT', 'genome_gap_bed', required=False, type='filepath')
+            self._genome_gaps = parse_gap_bed_file(genome_gap_bed) if genome_gap_bed else {}
+        return self._genome_gaps
+
+    # Record the genome files partitions are planned from, on each use of partitions since memoized values
+    # are shared by steps whereas the job cache verifies the files each step depends on
+    def record_genome_partition_files(self):
+        stat_cache.record_content(config.param('DEFAULT', 'genome_dictionary', type='filepath'))
+        if config.param('DEFAULT', 'genome_gap_bed', required=False, type='filepath'):
+            stat_cache.record_content(config.param('DEFAULT', 'genome_gap_bed', type='filepath'))
+
+    # Balanced genome partitions shared by a scatter step and its gather step.
+    # Partitions must be ordered if their outputs are concatenated in genome order.
+    def genome_partitions(self, nb_partitions, ordered=False, split_anywhere=False):
+        if not hasattr(self, "_genome_partitions"):
+            self._genome_partitions = {}
+        key = (nb_partitions, ordered, split_anywhere)
+        self.record_genome_partition_files()
+        if key not in self._genome_partitions:
+            self._genome_partitions[key] = partition_genome(self.sequence_dictionary, nb_partitions, self.genome_gaps, ordered, split_anywhere)
+        return self._genome_partitions[key]
+
+    # Index files of BAM files, or None if some of them do not exist yet
+    def bam_index_files(self, bam_files):
+        bam_index_files = []
+        for bam_file in bam_files:
+            candidate_index_files = [bam_index_file for bam_index_file in [output_dir_abspath(self.output_dir, bam_index_file) for bam_index_file in [re.sub("\.bam$", ".bai", bam_file), bam_file + ".bai"]] if stat_cache.isfile(bam_index_file)]
+            if not candidate_index_files:
+                return None
+            bam_index_files.append(candidate_index_files[0])
+        return bam_index_files
+
+    # Read distribution estimated from BAM index files, or None if some of them can not be used
+    def coverage_profile(self, bam_index_files):
+        profile = CoverageProfile(self.sequence_dictionary)
+        for bam_index_file in bam_index_files:
+            try:
+                profile.add_bam_index_file(bam_index_file)
+            except Exception as e:
+                log.warning(str(e) + " Genome partitions are weighted by number of bases instead.")
+                return None
+        return profile
+
+    # Genome partitions of a scatter step over BAM files, planned by plan(profile) with the read distribution
+    # of the BAM files if their indexes exist, or with no profile, i.e. by number of bases, otherwise.
+    # Partitions planned from read counts are saved in job_output/genome_partitions so that next pipeline runs
+    # create the same jobs; they are planned again if BAM indexes are newer, or if the saved file is removed.
+    def coverage_partitions(self, step_name, bam_files, parameters, plan):
+        if not hasattr(self, "_coverage_partitions"):
+            self._coverage_partitions = {}
+        # Partitions also depend on BAM index files and on the read or saved partition file
+        self.record_genome_partition_files()
+        for bam_index_file in self.bam_index_files(bam_files) or []:
+            stat_cache.record_content(bam_index_file)
+        stat_cache.record_content(os.path.join(self.output_dir, "job_output", "genome_partitions", step_name + ".tsv"))
+        if step_name not in self._coverage_partitions:
+            parameters = "\t".join([
+                "genome_dictionary=" + config.param('DEFAULT', 'genome_dictionary', type='filepath'),
+                "genome_gap_bed=" + config.param('DEFAULT', 'genome_gap_bed', required=False, type='filepath'),
+                parameters
+            ])
+            partition_file = os.path.join(self.output_dir, "job_output", "genome_partitions", step_name + ".tsv")
+            bam_index_files = self.bam_index_files(bam_files)
+
+            partitions = None
+            # Check the real file since the saved partition file is not a job input or output
+            if os.path.isfile(partition_file):
+                bam_index_stats = [stat_cache.stat(bam_index_file) for bam_index_file in bam_index_files or []]
+                if [bam_index_stat for bam_index_stat in bam_index_stats if bam_index_stat and bam_index_stat.st_mtime > os.path.getmtime(partition_file)]:
+                    log.info(step_name + ": BAM indexes are newer than " + partition_file + ", genome partitions are planned again")
+                else:
+                    try:
+                        partitions = parse_partition_file(partition_file, parameters)
+                    except IOError as e:
+                        log.warning("Genome partition file " + partition_file + " can not be read (" + str(e) + "), genome partitions are planned again")
+
+            if partitions is None:
+                profile = self.coverage_profile(bam_index_files) if bam_index_files else None
+                partitions = plan(profile)
+                log_partition_balance(step_name, partitions, profile)
+                # Partitions by number of bases are planned again once BAM indexes exist, hence not saved
+                if profile and not (self.args.report or self.args.clean):
+                    write_partition_file(partition_file, parameters, partitions)
+                    stat_cache.set(partition_file, os.stat(partition_file))
+            else:
+                log.info(step_name + ": genome partitions loaded from " + partition_file + "\n")
+            self._coverage_partitions[step_name] = partitions
+        return self._coverage_partitions[step_name]
+
+    # Return the number of chunks a readset is aligned in, from its input file size and the configured chunk size.
+    # Readsets are sized from their original FASTQ or BAM files which already exist and are not changed by trimming,
+    # so that the number of chunks, hence job names, stay the same when the pipeline is run again.
+    def nb_alignment_chunks(self, readset, fastq_files):
+        chunk_size = config.param('bwa_mem_picard_sort_sam', 'chunk_size', required=False)
+        if not chunk_size:
+            return 1
+
+        for input_files in [[readset.fastq1, readset.fastq2], [readset.bam], fastq_files]:
+            input_files = [output_dir_abspath(self.output_dir, input_file) for input_file in input_files if input_file]
+            if input_files and all([stat_cache.isfile(input_file) for input_file in input_files]):
+                for input_file in input_files:
+                    stat_cache.record_content(input_file)
+                input_size = sum([stat_cache.stat(input_file).st_size for input_file in input_files])
+                nb_chunks = max(1, int(math.ceil(input_size / float(parse_memory(chunk_size)))))
+                log.debug("Readset " + readset.name + " aligned in " + str(nb_chunks) + " chunk" + ("s" if nb_chunks > 1 else ""))
+                return nb_chunks
+
+        log.warning("Readset " + readset.name + " input files not found: aligned in 1 chunk")
+        return 1
+
     def bwa_mem_picard_sort_sam(self):
         """
         The filtered reads are aligned to a reference genome. The alignment is done per sequencing readset.
         The alignment software used is [BWA](http://bio-bwa.sourceforge.net/) with algorithm: bwa mem.
         BWA output BAM files are then sorted by coordinate using [Picard](http://broadinstitute.github.io/picard/).
+        Large readsets can be split in chunks of reads aligned in parallel, sorted chunk BAM files being then merged.
 
         This step takes as input files:
 
@@ -125,30 +242,64 @@ class DnaSeq(common.Illumina):
                 raise Exception("Error: run type \"" + readset.run_type +
                 "\" is invalid for readset \"" + readset.name + "\" (should be PAIRED_END or SINGLE_END)!")
 
-            job = concat_jobs([
-                Job(command="mkdir -p " + os.path.dirname(readset_bam)),
-                pipe_jobs([
-                    bwa.mem(
-                        fastq1,
-                        fastq2,
-                        read_group="'@RG" + \
-                            "\tID:" + readset.name + \
-                            "\tSM:" + readset.sample.name + \
-                            "\tLB:" + (readset.library if readset.library else readset.sample.name) + \
-                            ("\tPU:run" + readset.run + "_" + readset.lane if readset.run and readset.lane else "") + \
-                            ("\tCN:" + config.param('bwa_mem', 'sequencing_center') if config.param('bwa_mem', 'sequencing_center', required=False) else "") + \
-                            "\tPL:Illumina" + \
-                            "'"
-                    ),
-                    picard.sort_sam(
-                        "/dev/stdin",
-                        readset_bam,
-                        "coordinate"
-                    )
-                ])
-            ], name="bwa_mem_picard_sort_sam." + readset.name)
+            read_group = "'@RG" + \
+                "\tID:" + readset.name + \
+                "\tSM:" + readset.sample.name + \
+                "\tLB:" + (readset.library if readset.library else readset.sample.name) + \
+                ("\tPU:run" + readset.run + "_" + readset.lane if readset.run and readset.lane else "") + \
+                ("\tCN:" + config.param('bwa_mem', 'sequencing_center') if config.param('bwa_mem', 'sequencing_center', required=False) else "") + \
+                "\tPL:Illumina" + \
+                "'"
+
+            nb_chunks = self.nb_alignment_chunks(readset, [fastq1, fastq2])
+            if nb_chunks > 1:
+                # Split input FASTQ files once into chunks of records, align and sort each chunk in parallel,
+                # then merge sorted chunk BAM files into the readset BAM
+                chunk_prefix = re.sub("\.sorted\.bam$", ".chunk", readset_bam)
+                fastq_chunks = []
+                for fastq_idx, fastq in enumerate(filter(None, [fastq1, fastq2])):
+                    fastq_chunks.append([chunk_prefix + str(chunk) + "." + str(fastq_idx + 1) + ".fastq.gz" for chunk in range(nb_chunks)])
+                    jobs.append(concat_jobs([
+                        Job(command="mkdir -p " + os.path.dirname(readset_bam), removable_files=fastq_chunks[-1]),
+                        tools.split_fastq(fastq, fastq_chunks[-1])
+                    ], name="bwa_mem_split_fastq." + readset.name + "." + str(fastq_idx + 1)))
+
+                jobs.extend(scatter_gather_jobs(
+                    "bwa_mem_picard_sort_sam." + readset.name,
+                    range(nb_chunks),
+                    lambda chunk_idx, chunk: pipe_jobs([
+                        bwa.mem(
+                            fastq_chunks[0][chunk],
+                            fastq_chunks[1][chunk] if fastq2 else None,
+                            read_group=read_group
+                        ),
+                        picard.sort_sam(
+                            "/dev/stdin",
+                            shard_file(readset_bam, chunk),
+                            "coordinate"
+                        )
+                    ]),
+                    lambda chunk_jobs: picard.merge_sam_files([shard_file(readset_bam, chunk) for chunk in range(nb_chunks)], readset_bam),
+                    "bwa_mem_picard_merge_sam_files." + readset.name
+                ))
+            else:
+                job = concat_jobs([
+                    Job(command="mkdir -p " + os.path.dirname(readset_bam)),
+                    pipe_jobs([
+                        bwa.mem(
+                            fastq1,
+                            fastq2,
+                            read_group=read_group
+                        ),
+                        picard.sort_sam(
+                            "/dev/stdin",
+                            readset_bam,
+                            "coordinate"
+                        )
+                    ])
+                ], name="bwa_mem_picard_sort_sam." + readset.name)
 
-            jobs.append(job)
+                jobs.append(job)
 
         report_file = os.path.join("report", "DnaSeq.bwa_mem_picard_sort_sam.md")
         jobs.append(
@@ -229,7 +380,8 @@ pandoc --to=markdown \\
         are preferred over indels by the aligner since it can appear to be less costly by the algorithm.
         Such regions will introduce false positive variant calls which may be filtered out by realigning
         those regions properly. Realignment is done using [GATK](https://www.broadinstitute.org/gatk/).
-        The reference genome is divided by a number regions given by the `nb_jobs` parameter.
+        The reference genome is divided by a number regions given by the `nb_jobs` parameter,
+        balanced by size and cut at gaps listed in the optional `genome_gap_bed` file.
         """
 
         jobs = []
@@ -238,6 +390,11 @@ pandoc --to=markdown \\
         if nb_jobs > 50:
             log.warning("Number of realign jobs is > 50. This is usually much. Anything beyond 20 can be problematic.")
 
+        # Realigned BAM files are merge sorted afterwards, hence partitions need not be contiguous
+        if nb_jobs > 1:
+            partitions = self.genome_partitions(nb_jobs)
+            log_partition_balance("gatk_indel_realigner", partitions)
+
         for sample in self.samples:
             alignment_directory = os.path.join("alignment", sample.name)
             realign_directory = os.path.join(alignment_directory, "realign")
@@ -257,35 +414,18 @@ pandoc --to=markdown \\
                 ], name="gatk_indel_realigner." + sample.name))
 
             else:
-                # The first sequences are the longest to process.
-                # Each of them must be processed in a separate job.
-                unique_sequences_per_job = [sequence['name'] for sequence in self.sequence_dictionary[0:min(nb_jobs - 1, len(self.sequence_dictionary))]]
-
-                # Create one separate job for each of the first sequences
-                for sequence in unique_sequences_per_job:
-                    realign_prefix = os.path.join(realign_directory, sequence)
+                # Create one separate job for each genome partition, unmapped reads going with the first one
+                for idx, partition in enumerate(partitions):
+                    realign_prefix = os.path.join(realign_directory, str(idx))
                     realign_intervals = realign_prefix + ".intervals"
-                    intervals=[sequence]
-                    if unique_sequences_per_job.index(sequence) == 0:
-                        intervals.append("unmapped")
+                    intervals = [interval_string(interval) for interval in partition['intervals']]
                     output_bam = realign_prefix + ".bam"
                     jobs.append(concat_jobs([
                         # Create output directory since it is not done by default by GATK tools
                         Job(command="mkdir -p " + realign_directory, removable_files=[realign_directory]),
-                        gatk.realigner_target_creator(input, realign_intervals, intervals=[sequence]),
-                        gatk.indel_realigner(input, output_bam, target_intervals=realign_intervals, intervals=intervals)
-                    ], name="gatk_indel_realigner." + sample.name + "." + sequence))
-
-                # Create one last job to process the last remaining sequences and 'others' sequences
-                realign_prefix = os.path.join(realign_directory, "others")
-                realign_intervals = realign_prefix + ".intervals"
-                output_bam = realign_prefix + ".bam"
-                jobs.append(concat_jobs([
-                    # Create output directory since it is not done by default by GATK tools
-                    Job(command="mkdir -p " + realign_directory, removable_files=[realign_directory]),
-                    gatk.realigner_target_creator(input, realign_intervals, exclude_intervals=unique_sequences_per_job),
-                    gatk.indel_realigner(input, output_bam, target_intervals=realign_intervals, exclude_intervals=unique_sequences_per_job)
-                ], name="gatk_indel_realigner." + sample.name + ".others"))
+                        gatk.realigner_target_creator(input, realign_intervals, intervals=intervals),
+                        gatk.indel_realigner(input, output_bam, target_intervals=realign_intervals, intervals=intervals + (["unmapped"] if idx == 0 else []))
+                    ], name="gatk_indel_realigner." + sample.name + "." + str(idx)))
 
         return jobs
 
@@ -305,8 +445,7 @@ pandoc --to=markdown \\
 
             # if nb_jobs == 1, symlink has been created in indel_realigner and merging is not necessary
             if nb_jobs > 1:
-                realigned_bams = [os.path.join(realign_directory, sequence['name'] + ".bam") for sequence in self.sequence_dictionary[0:min(nb_jobs - 1, len(self.sequence_dictionary))]]
-                realigned_bams.append(os.path.join(realign_directory, "others.bam"))
+                realigned_bams = [os.path.join(realign_directory, str(idx) + ".bam") for idx in xrange(len(self.genome_partitions(nb_jobs)))]
 
                 job = picard.merge_sam_files(realigned_bams, merged_realigned_bam)
                 job.name = "merge_realigned." + sample.name
@@ -415,20 +554,48 @@ cp \\
         Moreover, the recalibration tool attempts to correct for variation in quality with machine cycle
         and sequence context, and by doing so, provides not only more accurate quality scores but also
         more widely dispersed ones.
+        If the `nb_jobs` parameter is greater than 1, the genome is divided in contiguous regions processed in parallel:
+        per region recalibration reports are gathered into the sample one, and per region recalibrated BAM files
+        are concatenated, unmapped reads being processed with the last region.
         """
 
         jobs = []
+
+        nb_jobs = config.param('recalibration', 'nb_jobs', type='posint')
+        if nb_jobs > 1:
+            partitions = self.genome_partitions(nb_jobs, ordered=True)
+            log_partition_balance("recalibration", partitions)
+
         for sample in self.samples:
             duplicate_file_prefix = os.path.join("alignment", sample.name, sample.name + ".sorted.dup.")
             input = duplicate_file_prefix + "bam"
             print_reads_output = duplicate_file_prefix + "recal.bam"
             base_recalibrator_output = duplicate_file_prefix + "recalibration_report.grp"
+            md5_job = Job(input_files=[print_reads_output], output_files=[print_reads_output + ".md5"], command="md5sum " + print_reads_output + " > " + print_reads_output + ".md5")
 
-            jobs.append(concat_jobs([
-                gatk.base_recalibrator(input, base_recalibrator_output),
-                gatk.print_reads(input, print_reads_output, base_recalibrator_output),
-                Job(input_files=[print_reads_output], output_files=[print_reads_output + ".md5"], command="md5sum " + print_reads_output + " > " + print_reads_output + ".md5")
-            ], name="recalibration." + sample.name))
+            if nb_jobs == 1:
+                jobs.append(concat_jobs([
+                    gatk.base_recalibrator(input, base_recalibrator_output),
+                    gatk.print_reads(input, print_reads_output, base_recalibrator_output),
+                    md5_job
+                ], name="recalibration." + sample.name))
+
+            else:
+                jobs.extend(scatter_gather_jobs(
+                    "recalibration.base_recalibrator." + sample.name,
+                    partitions,
+                    lambda idx, partition: gatk.base_recalibrator(input, shard_file(base_recalibrator_output, idx), intervals=[interval_string(interval) for interval in partition['intervals']]),
+                    lambda shard_jobs: gatk.gather_bqsr_reports([shard_job.output_files[0] for shard_job in shard_jobs], base_recalibrator_output),
+                    "recalibration.gather_bqsr_reports." + sample.name
+                ))
+                # Unmapped reads are sorted last, hence go with the last region for BAM files to be concatenated in order
+                jobs.extend(scatter_gather_jobs(
+                    "recalibration.print_reads." + sample.name,
+                    partitions,
+                    lambda idx, partition: gatk.print_reads(input, shard_file(print_reads_output, idx), base_recalibrator_output, intervals=[interval_string(interval) for interval in partition['intervals']] + (["unmapped"] if idx == len(partitions) - 1 else [])),
+                    lambda shard_jobs: concat_jobs([picard.gather_bam_files([shard_job.output_files[0] for shard_job in shard_jobs], print_reads_output), md5_job]),
+                    "recalibration.gather_bam_files." + sample.name
+                ))
 
         report_file = os.path.join("report", "DnaSeq.recalibration.md")
         jobs.append(
@@ -585,6 +752,11 @@ cp \\
         if nb_haplotype_jobs > 50:
             log.warning("Number of haplotype jobs is > 50. This is usually much. Anything beyond 20 can be problematic.")
 
+        # gVCF files are concatenated in genome order afterwards, hence partitions must be contiguous
+        if nb_haplotype_jobs > 1:
+            partitions = self.genome_partitions(nb_haplotype_jobs, ordered=True)
+            log_partition_balance("gatk_haplotype_caller", partitions)
+
         for sample in self.samples:
             alignment_directory = os.path.join("alignment", sample.name)
             haplotype_directory = os.path.join(alignment_directory, "rawHaplotypeCaller")
@@ -598,23 +770,14 @@ cp \\
                 ], name="gatk_haplotype_caller." + sample.name))
 
             else:
-                unique_sequences_per_job,unique_sequences_per_job_others = split_by_size(self.sequence_dictionary, nb_haplotype_jobs - 1)
-
-                # Create one separate job for each of the first sequences
-                for idx,sequences in enumerate(unique_sequences_per_job):
+                # Create one separate job for each genome partition
+                for idx, partition in enumerate(partitions):
                     jobs.append(concat_jobs([
                         # Create output directory since it is not done by default by GATK tools
                         Job(command="mkdir -p " + haplotype_directory,removable_files=[haplotype_directory]),
-                        gatk.haplotype_caller(input, os.path.join(haplotype_directory, sample.name + "." + str(idx) + ".hc.g.vcf.bgz"), intervals=sequences)
+                        gatk.haplotype_caller(input, os.path.join(haplotype_directory, sample.name + "." + str(idx) + ".hc.g.vcf.bgz"), intervals=[interval_string(interval) for interval in partition['intervals']])
                     ], name="gatk_haplotype_caller." + sample.name + "." + str(idx)))
 
-                # Create one last job to process the last remaining sequences and 'others' sequences
-                jobs.append(concat_jobs([
-                    # Create output directory since it is not done by default by GATK tools
-                    Job(command="mkdir -p " + haplotype_directory,removable_files=[haplotype_directory]),
-                    gatk.haplotype_caller(input, os.path.join(haplotype_directory, sample.name + ".others.hc.g.vcf.bgz"), exclude_intervals=unique_sequences_per_job_others)
-                ], name="gatk_haplotype_caller." + sample.name + ".others"))
-
         return jobs
 
     def merge_and_call_individual_gvcf(self):
@@ -631,10 +794,7 @@ cp \\
             if nb_haplotype_jobs == 1:
                 gvcfs_to_merge = [haplotype_file_prefix + ".hc.g.vcf.bgz"]
             else:
-                unique_sequences_per_job,unique_sequences_per_job_others = split_by_size(self.sequence_dictionary, nb_haplotype_jobs - 1)
-
-                gvcfs_to_merge = [haplotype_file_prefix + "." + str(idx) + ".hc.g.vcf.bgz" for idx in xrange(len(unique_sequences_per_job))]
-                gvcfs_to_merge.append(haplotype_file_prefix + ".others.hc.g.vcf.bgz")
+                gvcfs_to_merge = [haplotype_file_prefix + "." + str(idx) + ".hc.g.vcf.bgz" for idx in xrange(len(self.genome_partitions(nb_haplotype_jobs, ordered=True)))]
 
             jobs.append(concat_jobs([
                 gatk.cat_variants(gvcfs_to_merge, output_haplotype_file_prefix + ".hc.g.vcf.bgz"),
@@ -646,83 +806,55 @@ cp \\
     def combine_gvcf(self):
         """
         Combine the per sample gvcfs of haplotype caller into one main file for all sample.
+        Many samples are combined by a tree of jobs, each combining at most a maximum number of gvcfs.
         """
         jobs = []
         nb_haplotype_jobs = config.param('gatk_combine_gvcf', 'nb_haplotype', type='posint')
-        nb_maxbatches_jobs = config.param('gatk_combine_gvcf', 'nb_batch', type='posint')
-
-        # merge all sample in one shot
-        if nb_maxbatches_jobs == 1 :
-            if nb_haplotype_jobs == 1:
-                jobs.append(concat_jobs([
-                    Job(command="mkdir -p variants"),
-                    gatk.combine_gvcf([ os.path.join("alignment", sample.name, sample.name)+".hc.g.vcf.bgz" for sample in self.samples ], os.path.join("variants", "allSamples.hc.g.vcf.bgz"))],
-                    name="gatk_combine_gvcf.AllSamples"))
-            else :
-                unique_sequences_per_job,unique_sequences_per_job_others = split_by_size(self.sequence_dictionary, nb_haplotype_jobs - 1)
-
-                # Create one separate job for each of the first sequences
-                for idx,sequences in enumerate(unique_sequences_per_job):
-                    obs.append(concat_jobs([
-                        Job(command="mkdir -p variants",removable_files=[os.path.join("variants", "allSamples") + "." + str(idx) + ".hc.g.vcf.bgz",os.path.join("variants", "allSamples") + "." + str(idx) + ".hc.g.vcf.bgz.tbi"]),
-                        gatk.combine_gvcf([ os.path.join("alignment", sample.name, sample.name)+".hc.g.vcf.bgz" for sample in self.samples ], os.path.join("variants", "allSamples") + "." + str(idx) + ".hc.g.vcf.bgz", intervals=sequences)
-                    ], name="gatk_combine_gvcf.AllSample" + "." + str(idx)))
-
-                # Create one last job to process the last remaining sequences and 'others' sequences
-                job=gatk.combine_gvcf([ os.path.join("alignment", sample.name, sample.name)+".hc.g.vcf.bgz" for sample in self.samples ], os.path.join("alignment", "allSamples.others.hc.g.vcf.bgz"), exclude_intervals=unique_sequences_per_job_others)
-                job.name="gatk_combine_gvcf.AllSample" + ".others"
-                job.removable_files=[os.path.join("variants", "allSamples.others.hc.g.vcf.bgz"),os.path.join("variants", "allSamples.others.hc.g.vcf.bgz.tbi") ]
-                jobs.append(job)
+        gvcfs = [os.path.join("alignment", sample.name, sample.name) + ".hc.g.vcf.bgz" for sample in self.samples]
+
+        # Samples are merged by a tree of jobs, each merging at most max_fan_in gVCF files,
+        # further limited by the CombineGVCFs memory if the memory needed per input file is set
+        max_fan_in = config.param('gatk_combine_gvcf', 'max_fan_in', required=False, type='posint')
+        if not max_fan_in:
+            # Default fan-in from nb_batch, high enough to merge samples in at most 2 levels,
+            # like nb_batch batches of samples merged altogether afterwards
+            nb_batches = config.param('gatk_combine_gvcf', 'nb_batch', type='posint')
+            max_fan_in = max(nb_batches, int(math.ceil(len(gvcfs) / float(nb_batches))))
+        ram_per_input = config.param('gatk_combine_gvcf', 'ram_per_input', required=False)
+        if ram_per_input:
+            max_fan_in = min(max_fan_in, parse_memory(config.param('gatk_combine_gvcf', 'ram')) // parse_memory(ram_per_input))
+        max_fan_in = max(2, max_fan_in)
+
+        # Combined gVCF files are concatenated in genome order afterwards, hence partitions must be contiguous
+        if nb_haplotype_jobs > 1:
+            partitions = self.genome_partitions(nb_haplotype_jobs, ordered=True)
+            log_partition_balance("gatk_combine_gvcf", partitions)
         else:
-            #Combine samples by batch (pre-defined batches number in ini)
-            sample_per_batch = int(math.ceil(len(self.samples)/float(nb_maxbatches_jobs)))
-            batch_of_sample = [ self.samples[i:(i+sample_per_batch)] for i in range(0,len(self.samples),sample_per_batch) ]
-            cpt = 0
-            batches = []
-            for batch in batch_of_sample :
-                if nb_haplotype_jobs == 1:
-                    jobs.append(concat_jobs([
-                        Job(command="mkdir -p variants",removable_files=[os.path.join("variants", "allSamples.batch" + str(cpt) + ".hc.g.vcf.bgz"),os.path.join("variants", "allSamples.batch" + str(cpt) + ".hc.g.vcf.bgz.tbi")]),
-                        gatk.combine_gvcf([ os.path.join("alignment", sample.name, sample.name)+".hc.g.vcf.bgz" for sample in batch ], os.path.join("variants", "allSamples.batch" + str(cpt) + ".hc.g.vcf.bgz"))
-                    ], name="gatk_combine_gvcf.AllSamples.batch" + str(cpt)))
-                else :
-                    unique_sequences_per_job,unique_sequences_per_job_others = split_by_size(self.sequence_dictionary, nb_haplotype_jobs - 1)
-
-                    # Create one separate job for each of the first sequences
-                    for idx,sequences in enumerate(unique_sequences_per_job):
-                        jobs.append(concat_jobs([
-                            Job(command="mkdir -p variants",removable_files=[os.path.join("variants", "allSamples") + ".batch" + str(cpt) + "." + str(idx) + ".hc.g.vcf.bgz",os.path.join("variants", "allSamples") + ".batch" + str(cpt) + "." + str(idx) + ".hc.g.vcf.bgz.tbi"]),
-                            gatk.combine_gvcf([ os.path.join("alignment", sample.name, sample.name)+".hc.g.vcf.bgz" for sample in batch ], os.path.join("variants", "allSamples") + ".batch" + str(cpt) + "." + str(idx) + ".hc.g.vcf.bgz", intervals=sequences)
-                        ], name="gatk_combine_gvcf.AllSample" + ".batch" + str(cpt) + "." + str(idx)))
-
-                    # Create one last job to process the last remaining sequences and 'others' sequences
-                    job=gatk.combine_gvcf([ os.path.join("alignment", sample.name, sample.name)+".hc.g.vcf.bgz" for sample in batch ], os.path.join("variants", "allSamples" + ".batch" + str(cpt) + ".others.hc.g.vcf.bgz"), exclude_intervals=unique_sequences_per_job_others)
-                    job.name="gatk_combine_gvcf.AllSample" + ".batch" + str(cpt) + ".others"
-                    job.removable_files=[os.path.join("variants", "allSamples" + ".batch" + str(cpt) + ".others.hc.g.vcf.bgz"),os.path.join("variants", "allSamples" + ".batch" + str(cpt) + ".others.hc.g.vcf.bgz.tbi")]
-                    jobs.append(job)
-                batches.append("batch" + str(cpt))
-                cpt = cpt + 1
+            partitions = [None]
+
+        # Build one merge tree per genome partition, so that each tree level runs in parallel across partitions
+        for idx, partition in enumerate(partitions):
+            partition_suffix = "." + str(idx) if partition else ""
+            intervals = [interval_string(interval) for interval in partition['intervals']] if partition else []
+            output = os.path.join("variants", "allSamples" + partition_suffix + ".hc.g.vcf.bgz")
+
+            tree_jobs = merge_tree_jobs(
+                "gatk_combine_gvcf.AllSample" + partition_suffix if partition else "gatk_combine_gvcf.AllSamples",
+                gvcfs,
+                output,
+                lambda inputs, merge_output: concat_jobs([
+                    Job(command="mkdir -p variants", removable_files=[merge_output + ".tbi"] if merge_output != output else []),
+                    gatk.combine_gvcf(inputs, merge_output, intervals=intervals)
+                ]),
+                max_fan_in,
+                lambda level, group_idx: os.path.join("variants", "allSamples.level" + str(level) + ".batch" + str(group_idx) + partition_suffix + ".hc.g.vcf.bgz")
+            )
 
-            #Combine batches altogether
-            if nb_haplotype_jobs == 1:
-                job=gatk.combine_gvcf([ os.path.join("variants", "allSamples." + batch_idx + ".hc.g.vcf.bgz") for batch_idx in batches ], os.path.join("variants", "allSamples.hc.g.vcf.bgz"))
-                job.name="gatk_combine_gvcf.AllSamples.batches"
-                jobs.append(job)
-            else :
-                unique_sequences_per_job,unique_sequences_per_job_others = split_by_size(self.sequence_dictionary, nb_haplotype_jobs - 1)
-
-                # Create one separate job for each of the first sequences
-                for idx,sequences in enumerate(unique_sequences_per_job):
-                    job=gatk.combine_gvcf([ os.path.join("variants", "allSamples." + batch_idx + "." + str(idx) + ".hc.g.vcf.bgz") for batch_idx in batches ], os.path.join("variants", "allSamples") + "." + str(idx) + ".hc.g.vcf.bgz", intervals=sequences)
-                    job.name="gatk_combine_gvcf.AllSample" + "." + str(idx)
-                    job.removable_files=[os.path.join("variants", "allSamples") + "." + str(idx) + ".hc.g.vcf.bgz",os.path.join("variants", "allSamples") + "." + str(idx) + ".hc.g.vcf.bgz.tbi"]
-                    jobs.append(job)
+            # Partition gVCF files are intermediate, only their concatenation by merge_and_call_combined_gvcf being kept
+            if partition:
+                tree_jobs[-1].removable_files.extend([output, output + ".tbi"])
 
-                # Create one last job to process the last remaining sequences and 'others' sequences
-                job=gatk.combine_gvcf([ os.path.join("variants", "allSamples." + batch_idx + ".others.hc.g.vcf.bgz") for batch_idx in batches ], os.path.join("variants", "allSamples" + ".others.hc.g.vcf.bgz"), exclude_intervals=unique_sequences_per_job_others)
-                job.name="gatk_combine_gvcf.AllSample" + ".others"
-                job.removable_files=[os.path.join("variants", "allSamples" + ".others.hc.g.vcf.bgz"),os.path.join("variants", "allSamples" + ".others.hc.g.vcf.bgz.tbi")]
-                jobs.append(job)
+            jobs.extend(tree_jobs)
 
         return jobs
 
@@ -739,10 +871,7 @@ cp \\
         output_haplotype = os.path.join("variants", "allSamples.hc.g.vcf.bgz")
         output_haplotype_genotyped = os.path.join("variants", "allSamples.hc.vcf.bgz")
         if nb_haplotype_jobs > 1:
-            unique_sequences_per_job,unique_sequences_per_job_others = split_by_size(self.sequence_dictionary, nb_haplotype_jobs - 1)
-
-            gvcfs_to_merge = [haplotype_file_prefix + "." + str(idx) + ".hc.g.vcf.bgz" for idx in xrange(len(unique_sequences_per_job))]
-            gvcfs_to_merge.append(haplotype_file_prefix + ".others.hc.g.vcf.bgz")
+            gvcfs_to_merge = [haplotype_file_prefix + "." + str(idx) + ".hc.g.vcf.bgz" for idx in xrange(len(self.genome_partitions(nb_haplotype_jobs, ordered=True)))]
 
             job = gatk.cat_variants(gvcfs_to_merge, output_haplotype)
             job.name = "merge_and_call_combined_gvcf.merge.AllSample"
@@ -861,18 +990,19 @@ pandoc \\
             job.input_files += [os.path.join("alignment", sample.name, sample.name + ".sorted.dup.recal.all.metrics.insert_size_metrics") for sample in self.samples]
         return [job]
 
+    # Return windows of similar number of reads, or bases if BAM files do not exist yet, for about nb_jobs mpileup jobs.
+    # Each window is within one sequence and cut at gaps if any.
     def generate_approximate_windows(self, nb_jobs):
-        if nb_jobs <= len(self.sequence_dictionary):
-            return [sequence['name'] + ":1-" + str(sequence['length']) for sequence in self.sequence_dictionary]
-        else:
-            total_length = sum([sequence['length'] for sequence in self.sequence_dictionary])
-            approximate_window_size = int(math.floor(total_length / (nb_jobs - len(self.sequence_dictionary))))
-            windows = []
+        def plan(profile):
+            if nb_jobs <= len(self.sequence_dictionary):
+                approximate_window_size = genome_weight(self.sequence_dictionary, self.genome_gaps, profile)
+            else:
+                approximate_window_size = int(math.floor(genome_weight(self.sequence_dictionary, self.genome_gaps, profile) / (nb_jobs - len(self.sequence_dictionary))))
+            return [{'intervals': [window], 'weight': window['weight']} for window in genome_chunks(self.sequence_dictionary, approximate_window_size, self.genome_gaps, True, profile)]
 
-            for sequence in self.sequence_dictionary:
-                for start, end in [[pos, min(pos + approximate_window_size - 1, sequence['length'])] for pos in range(1, sequence['length'] + 1, approximate_window_size)]:
-                    windows.append(sequence['name'] + ":" + str(start) + "-" + str(end))
-            return windows
+        input_bams = [os.path.join("alignment", sample.name, sample.name + ".sorted.dup.recal.bam") for sample in self.samples]
+        windows = [partition['intervals'][0] for partition in self.coverage_partitions("snp_and_indel_bcf", input_bams, "approximate_nb_jobs=" + str(nb_jobs), plan)]
+        return [window['name'] + ":" + str(window['start']) + "-" + str(window['end']) for window in windows]
 
     def rawmpileup(self):
         """
@@ -916,6 +1046,8 @@ pandoc \\
         """
         Mpileup and Variant calling. Variants (SNPs and INDELs) are called using
         [SAMtools](http://samtools.sourceforge.net/) mpileup. bcftools view is used to produce binary bcf files.
+        The genome is divided in about `approximate_nb_jobs` windows of similar number of reads, estimated from
+        the BAM indexes if they exist when jobs are created, or of similar size otherwise.
         """
 
         jobs = []
@@ -34,6 +34,7 @@ from core.config import *
 from core.job import *
 from core.pipeline import *
 from bfx.sequence_dictionary import *
+from bfx.genome_partition import *
 
 from bfx import bvatools
 from bfx import gq_seq_utils
@@ -182,10 +183,16 @@ class DnaSeqHighCoverage(dnaseq.DnaSeq):
             beds.append(os.path.join(varscan_directory, 'chrs.' + str(idx) + '.bed'))
 
         genome_dictionary = config.param('DEFAULT', 'genome_dictionary', type='filepath')
-        
+
+        # VarScan VCF files are concatenated in genome order afterwards, hence partitions must be contiguous
         if nb_jobs > 1:
-            bedJob = tools.dict2beds(genome_dictionary, beds)
-            jobs.append(concat_jobs([mkdir_job,bedJob], name="varscan.genome.beds"))
+            partitions = self.coverage_partitions("call_variants", [os.path.join("alignment", sample.name, sample.name + ".matefixed.sorted.bam") for sample in self.samples], "nb_jobs=" + str(nb_jobs), lambda profile: partition_genome(self.sequence_dictionary, nb_jobs, self.genome_gaps, ordered=True, split_anywhere=True, profile=profile))
+            beds = beds[0:len(partitions)]
+            jobs.append(concat_jobs([Job(command="mkdir -p " + varscan_directory)] + [Job(
+                [genome_dictionary],
+                [bed],
+                command="printf '%s\\t%s\\t%s\\n' \\\n  " + " \\\n  ".join([interval['name'] + " " + str(interval['start'] - 1) + " " + str(interval['end']) for interval in partition['intervals']]) + " \\\n  > " + bed
+            ) for bed, partition in zip(beds, partitions)], name="varscan.genome.beds"))
 
         bams=[]
         sampleNamesFile = 'varscan_samples.tsv'
@@ -213,7 +220,7 @@ class DnaSeqHighCoverage(dnaseq.DnaSeq):
 
         else:
             output_vcfs=[]
-            for idx in range(nb_jobs):
+            for idx in range(len(beds)):
                 output_vcf = os.path.join(varscan_directory, "allSamples."+str(idx)+".vcf.gz")
                 varScanJob = pipe_jobs([
                     samtools.mpileup(bams, None, config.param('varscan', 'mpileup_other_options'), regionFile=beds[idx]),
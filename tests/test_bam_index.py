@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+################################################################################
+# Copyright (C) 2014, 2015 GenAP, McGill University and Genome Quebec Innovation Centre
+#
+# This file is part of MUGQIC Pipelines.
+#
+# MUGQIC Pipelines is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUGQIC Pipelines is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with MUGQIC Pipelines.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+# Python Standard Modules
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import unittest
+
+# Append mugqic_pipelines directory to Python library path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# MUGQIC Modules
+from bfx.genome_partition import *
+
+# Compressed size of the header and of each read of synthetic BAM files
+HEADER_SIZE = 1000
+READ_SIZE = 30
+
+class TestBamIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    # Write a BAM index file with, for each reference, the number of reads of each 16 kb tile,
+    # or None for a reference without any bin (no reads), and return its path.
+    # References have a pseudo-bin of read counts unless pseudo_bin is False.
+    def write_bam_index_file(self, references, pseudo_bin=True, magic="BAI\1"):
+        bam_index_file = os.path.join(self.tmp_dir, str(len(os.listdir(self.tmp_dir))) + ".bam.bai")
+        with open(bam_index_file, 'wb') as bif:
+            bif.write(magic + struct.pack("<i", len(references)))
+            offset = HEADER_SIZE
+            for tile_reads in references:
+                if tile_reads is None:
+                    bif.write(struct.pack("<ii", 0, 0))
+                    continue
+                start_offset = offset
+                tile_offsets = []
+                for nb_reads in tile_reads:
+                    tile_offsets.append(offset << 16)
+                    offset += nb_reads * READ_SIZE
+                bif.write(struct.pack("<i", 2 if pseudo_bin else 1))
+                bif.write(struct.pack("<IiQQ", 4681, 1, start_offset << 16, offset << 16))
+                if pseudo_bin:
+                    bif.write(struct.pack("<IiQQQQ", 37450, 2, start_offset << 16, offset << 16, sum(tile_reads), 0))
+                bif.write(struct.pack("<i", len(tile_offsets)))
+                bif.write(struct.pack("<" + str(len(tile_offsets)) + "Q", *tile_offsets))
+            bif.write(struct.pack("<Q", 0))
+        return bam_index_file
+
+    def test_parse_bam_index_file(self):
+        bam_index_file = self.write_bam_index_file([[10, 20, 30], [5]])
+        self.assertEqual(parse_bam_index_file(bam_index_file), [
+            (60, [HEADER_SIZE, HEADER_SIZE + 10 * READ_SIZE, HEADER_SIZE + 30 * READ_SIZE], HEADER_SIZE + 60 * READ_SIZE),
+            (5, [HEADER_SIZE + 60 * READ_SIZE], HEADER_SIZE + 65 * READ_SIZE)
+        ])
+
+    def test_zero_read_references(self):
+        # References without reads have no bin at all, before, between and after references with reads
+        bam_index_file = self.write_bam_index_file([None, [10, 20], None, None, [5], None])
+        references = parse_bam_index_file(bam_index_file)
+        self.assertEqual([nb_mapped_reads for nb_mapped_reads, tile_offsets, end_offset in references], [0, 30, 0, 0, 5, 0])
+        self.assertEqual(references[0], (0, [], 0))
+
+    def test_missing_read_counts(self):
+        self.assertEqual(parse_bam_index_file(self.write_bam_index_file([[10, 20], None], pseudo_bin=False)), None)
+
+    def test_not_a_bam_index_file(self):
+        self.assertRaises(Exception, parse_bam_index_file, self.write_bam_index_file([[10]], magic="CSI\1"))
+
+    def test_coverage_profile(self):
+        sequence_dictionary = [{'name': 'chr1', 'length': 3 * CoverageProfile.tile_size}, {'name': 'chr2', 'length': 1000}, {'name': 'chrM', 'length': 100}]
+        profile = CoverageProfile(sequence_dictionary)
+        profile.add_bam_index_file(self.write_bam_index_file([[10, 0, 30], None, [4]]))
+        profile.add_bam_index_file(self.write_bam_index_file([[10, 20, 0], None, [6]]))
+
+        self.assertAlmostEqual(profile.weight('chr1', 1, sequence_dictionary[0]['length']), 70)
+        self.assertAlmostEqual(profile.weight('chr1', 1, CoverageProfile.tile_size), 20)
+        self.assertAlmostEqual(profile.weight('chr1', CoverageProfile.tile_size + 1, 2 * CoverageProfile.tile_size), 20)
+        self.assertAlmostEqual(profile.weight('chr2', 1, 1000), 0)
+        self.assertAlmostEqual(profile.weight('chrM', 1, 100), 10)
+        self.assertAlmostEqual(genome_weight(sequence_dictionary, profile=profile), 80)
+
+        # Position reaching half the reads of the second tile of chr1
+        self.assertEqual(profile.position('chr1', 30), CoverageProfile.tile_size + CoverageProfile.tile_size // 2)
+
+    def test_coverage_profile_reference_mismatch(self):
+        profile = CoverageProfile([{'name': 'chr1', 'length': 1000}])
+        self.assertRaises(Exception, profile.add_bam_index_file, self.write_bam_index_file([[10], [10]]))
+        self.assertRaises(Exception, profile.add_bam_index_file, self.write_bam_index_file([[10]], pseudo_bin=False))
+
+    def test_partition_by_reads(self):
+        # Reads concentrated on the first tile of chr2: partitions split chr2 and lump chr1 together
+        tile_size = CoverageProfile.tile_size
+        sequence_dictionary = [{'name': 'chr1', 'length': 100 * tile_size}, {'name': 'chr2', 'length': 100 * tile_size}]
+        profile = CoverageProfile(sequence_dictionary)
+        profile.add_bam_index_file(self.write_bam_index_file([[1] * 100, [4000] + [1] * 99]))
+
+        nb_partitions = 4
+        partitions = partition_genome(sequence_dictionary, nb_partitions, ordered=True, split_anywhere=True, profile=profile)
+        self.assertEqual(len(partitions), nb_partitions)
+        self.assertTrue(max([partition['weight'] for partition in partitions]) <= 1.25 * 4199 / nb_partitions)
+        self.assertEqual([interval['name'] for interval in partitions[0]['intervals']], ['chr1', 'chr2'])
+        self.assertTrue(all([interval['end'] <= tile_size for partition in partitions[:-1] for interval in partition['intervals'] if interval['name'] == 'chr2']))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+################################################################################
+# Copyright (C) 2014, 2015 GenAP, McGill University and Genome Quebec Innovation Centre
+#
+# This file is part of MUGQIC Pipelines.
+#
+# MUGQIC Pipelines is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUGQIC Pipelines is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with MUGQIC Pipelines.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+# Python Standard Modules
+import os
+import sys
+import unittest
+
+# Append mugqic_pipelines directory to Python library path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# MUGQIC Modules
+from core.early_clean import *
+from core.job import *
+
+OUTPUT_DIR = "/out"
+
+class TestEarlyClean(unittest.TestCase):
+
+    def setUp(self):
+        self.early_clean = EarlyClean(os.path.join(OUTPUT_DIR, "job_output", "early_clean_manifest.tsv"))
+
+    # Create a job as done by Pipeline.create_jobs()
+    def job(self, name, input_files=[], output_files=[], command="", removable_files=[]):
+        job = Job(input_files, output_files, name=name, command=command or name, removable_files=removable_files)
+        job.done = os.path.join("job_output", name + ".mugqic.done")
+        job.output_dir = OUTPUT_DIR
+        self.early_clean.add_job(job)
+        return job
+
+    def test_removable_directory(self):
+        # Realigned BAMs of a removable directory are used by a later merge job
+        realign_jobs = [self.job("realign." + str(idx), ["alignment/a/a.sorted.bam"], ["alignment/a/realign/" + str(idx) + ".bam"], removable_files=["alignment/a/realign"]) for idx in range(2)]
+        merge_job = self.job("merge_realigned", ["alignment/a/realign/0.bam", "alignment/a/realign/1.bam"], ["alignment/a/a.realigned.bam"])
+        self.early_clean.plan(realign_jobs + [merge_job])
+
+        # Realign jobs must not remove the directory as soon as they finish
+        self.assertEqual([job.early_removable_files for job in realign_jobs], [[], []])
+        self.assertEqual(merge_job.early_removable_files, [("/out/alignment/a/realign", ["job_output/realign.0.mugqic.done", "job_output/realign.1.mugqic.done"])])
+        self.assertTrue("if [ -e job_output/realign.0.mugqic.done ] && [ -e job_output/realign.1.mugqic.done ] && [ -e /out/alignment/a/realign ] ; then" in early_clean_command(merge_job, "merge_realigned"))
+
+    def test_removable_file_inside_input_directory(self):
+        producer_job = self.job("haplotype_caller", ["a.bam"], ["rawHaplotypeCaller/a.hc.g.vcf.bgz"], removable_files=["rawHaplotypeCaller/a.hc.g.vcf.bgz"])
+        consumer_job = self.job("combine", ["rawHaplotypeCaller"], ["a.g.vcf.bgz"])
+        self.early_clean.plan([producer_job, consumer_job])
+        self.assertEqual(consumer_job.early_removable_files, [("/out/rawHaplotypeCaller/a.hc.g.vcf.bgz", ["job_output/haplotype_caller.mugqic.done"])])
+
+    def test_removable_file_without_consumer(self):
+        job = self.job("sort", ["a.bam"], ["a.sorted.bam"], removable_files=["tmp"])
+        self.early_clean.plan([job])
+        self.assertEqual(job.early_removable_files, [])
+        self.assertEqual(self.early_clean.consumer_done_files, [])
+
+    def test_bam_index(self):
+        sort_job = self.job("sort", ["a.bam"], ["a.sorted.bam"], removable_files=["a.sorted.bam", "a.sorted.bai"])
+        recal_job = self.job("recalibration", ["a.sorted.bam"], ["a.recal.bam"])
+        self.early_clean.plan([sort_job, recal_job])
+        self.assertEqual(sort_job.early_removable_files, [])
+        self.assertEqual(recal_job.early_removable_files, [("/out/a.sorted.bai", ["job_output/sort.mugqic.done"]), ("/out/a.sorted.bam", ["job_output/sort.mugqic.done"])])
+
+    def test_symbolic_link(self):
+        # Jobs using a sample BAM symbolic link also use the readset BAM it points to
+        link_job = self.job("symlink", ["alignment/a/r/r.sorted.bam"], ["alignment/a/a.sorted.bam"], command="ln -s -f r/r.sorted.bam alignment/a/a.sorted.bam", removable_files=["alignment/a/a.sorted.bam"])
+        sort_job = self.job("sort", ["r.bam"], ["alignment/a/r/r.sorted.bam"], removable_files=["alignment/a/r/r.sorted.bam"])
+        realign_job = self.job("realign", ["alignment/a/a.sorted.bam"], ["alignment/a/a.realigned.bam"])
+        self.early_clean.plan([sort_job, link_job, realign_job])
+        self.assertEqual(dict(link_job.early_removable_files)["/out/alignment/a/r/r.sorted.bam"], ["job_output/realign.mugqic.done", "job_output/sort.mugqic.done"])
+        self.assertEqual(dict(realign_job.early_removable_files)["/out/alignment/a/r/r.sorted.bam"], ["job_output/sort.mugqic.done", "job_output/symlink.mugqic.done"])
+
+    def test_implicit_input_files(self):
+        self.assertEqual(implicit_input_files("a.sorted.bam"), ["a.sorted.bai", "a.sorted.bam.bai"])
+        self.assertEqual(implicit_input_files("a.g.vcf.bgz"), ["a.g.vcf.bgz.tbi"])
+        self.assertEqual(implicit_input_files("a.txt"), [])
+
+if __name__ == '__main__':
+    unittest.main()
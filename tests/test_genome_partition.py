@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+################################################################################
+# Copyright (C) 2014, 2015 GenAP, McGill University and Genome Quebec Innovation Centre
+#
+# This file is part of MUGQIC Pipelines.
+#
+# MUGQIC Pipelines is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUGQIC Pipelines is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with MUGQIC Pipelines.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+# Python Standard Modules
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# Append mugqic_pipelines directory to Python library path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# MUGQIC Modules
+from bfx.genome_partition import *
+
+# Human-like sequence lengths, with a few small unplaced contigs
+SEQUENCE_DICTIONARY = [{'name': str(idx + 1), 'length': length} for idx, length in enumerate([249250621, 243199373, 198022430, 191154276, 180915260, 171115067, 159138663, 146364022, 141213431, 135534747, 135006516, 133851895, 115169878, 107349540, 102531392, 90354753, 81195210, 78077248, 59128983, 63025520, 48129895, 51304566])] + \
+    [{'name': 'X', 'length': 155270560}, {'name': 'Y', 'length': 59373566}, {'name': 'MT', 'length': 16569}] + \
+    [{'name': 'GL00' + str(idx), 'length': 20000 + 1000 * idx} for idx in range(10)]
+
+GAPS = dict([(sequence['name'], [(start, start + 50000) for start in range(10000000, sequence['length'] - 10000000, 10000000)]) for sequence in SEQUENCE_DICTIONARY])
+
+class TestPartitionGenome(unittest.TestCase):
+
+    # Check that partition intervals cover every base of every sequence exactly once
+    def assertCoversGenome(self, partitions, sequence_dictionary=SEQUENCE_DICTIONARY):
+        sequence_order = dict([(sequence['name'], idx) for idx, sequence in enumerate(sequence_dictionary)])
+        intervals = sorted([interval for partition in partitions for interval in partition['intervals']], key=lambda interval: (sequence_order[interval['name']], interval['start']))
+        ends = {}
+        for interval in intervals:
+            self.assertEqual(interval['start'], ends.get(interval['name'], 0) + 1)
+            self.assertTrue(interval['start'] <= interval['end'])
+            ends[interval['name']] = interval['end']
+        self.assertEqual(ends, dict([(sequence['name'], sequence['length']) for sequence in sequence_dictionary]))
+
+    # Largest over mean partition weight
+    def imbalance(self, partitions, nb_partitions, gaps={}):
+        return max([partition['weight'] for partition in partitions]) / (genome_weight(SEQUENCE_DICTIONARY, gaps) / float(nb_partitions))
+
+    def test_non_gap_length(self):
+        self.assertEqual(non_gap_length(1, 100, []), 100)
+        # BED gap 10-20 covers bases 11 to 20
+        self.assertEqual(non_gap_length(1, 100, [(10, 20)]), 90)
+        self.assertEqual(non_gap_length(15, 100, [(10, 20)]), 80)
+        self.assertEqual(non_gap_length(30, 100, [(10, 20)]), 71)
+
+    def test_interval_string(self):
+        self.assertEqual(interval_string({'name': 'MT', 'start': 1, 'end': 16569, 'length': 16569}), "MT")
+        self.assertEqual(interval_string({'name': '1', 'start': 1, 'end': 1000, 'length': 249250621}), "1:1-1000")
+
+    def test_longest_processing_time_balance(self):
+        for nb_partitions in [1, 2, 7, 24, 50]:
+            partitions = partition_genome(SEQUENCE_DICTIONARY, nb_partitions, split_anywhere=True)
+            self.assertCoversGenome(partitions)
+            self.assertTrue(len(partitions) <= nb_partitions)
+            # Chunks are at most a quarter of the mean partition weight
+            self.assertTrue(self.imbalance(partitions, nb_partitions) <= 1.25 + 1e-6)
+
+    def test_contiguous_balance(self):
+        sequence_order = dict([(sequence['name'], idx) for idx, sequence in enumerate(SEQUENCE_DICTIONARY)])
+        for nb_partitions in [1, 2, 7, 24, 50]:
+            partitions = partition_genome(SEQUENCE_DICTIONARY, nb_partitions, ordered=True, split_anywhere=True)
+            self.assertCoversGenome(partitions)
+            self.assertTrue(len(partitions) <= nb_partitions)
+            self.assertTrue(self.imbalance(partitions, nb_partitions) <= 1.25 + 1e-6)
+
+            # Each partition follows the previous one in genome order
+            intervals = [(sequence_order[interval['name']], interval['start']) for partition in partitions for interval in partition['intervals']]
+            self.assertEqual(intervals, sorted(intervals))
+
+    def test_cuts_in_gaps(self):
+        nb_partitions = 24
+        partitions = partition_genome(SEQUENCE_DICTIONARY, nb_partitions, gaps=GAPS)
+        self.assertCoversGenome(partitions)
+        self.assertTrue(len(partitions) <= nb_partitions)
+        # Largest atoms between gaps are 10 Mb, i.e. about a tenth of the mean partition weight
+        self.assertTrue(self.imbalance(partitions, nb_partitions, GAPS) <= 1.25)
+
+        sequence_lengths = dict([(sequence['name'], sequence['length']) for sequence in SEQUENCE_DICTIONARY])
+        for partition in partitions:
+            for interval in partition['intervals']:
+                if interval['end'] != sequence_lengths[interval['name']]:
+                    self.assertTrue([gap for gap in GAPS[interval['name']] if gap[0] < interval['end'] <= gap[1]], interval_string(interval) + " does not end in a gap")
+
+    def test_more_partitions_than_sequences(self):
+        sequence_dictionary = [{'name': 'chr1', 'length': 1000}, {'name': 'chr2', 'length': 10}]
+        partitions = partition_genome(sequence_dictionary, 100)
+        # Without gaps, sequences are not split
+        self.assertEqual(len(partitions), 2)
+        self.assertCoversGenome(partitions, sequence_dictionary)
+
+    def test_partition_file(self):
+        partitions = partition_genome(SEQUENCE_DICTIONARY, 7, gaps=GAPS)
+        partition_file = os.path.join(tempfile.mkdtemp(), "partitions", "partitions.txt")
+        try:
+            write_partition_file(partition_file, "nb_partitions=7", partitions)
+            self.assertEqual(parse_partition_file(partition_file, "nb_partitions=7"), partitions)
+            # Partitions planned with other parameters are not reused
+            self.assertEqual(parse_partition_file(partition_file, "nb_partitions=8"), None)
+        finally:
+            shutil.rmtree(os.path.dirname(os.path.dirname(partition_file)))
+
+if __name__ == '__main__':
+    unittest.main()
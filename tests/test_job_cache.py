@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+################################################################################
+# Copyright (C) 2014, 2015 GenAP, McGill University and Genome Quebec Innovation Centre
+#
+# This file is part of MUGQIC Pipelines.
+#
+# MUGQIC Pipelines is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUGQIC Pipelines is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with MUGQIC Pipelines.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+# Python Standard Modules
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# Append mugqic_pipelines directory to Python library path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# MUGQIC Modules
+from core.job import *
+from core.job_cache import *
+from core.stat_cache import *
+
+# Step attributes used by the job cache
+class TestStep(object):
+
+    def __init__(self, name):
+        self.name = name
+
+class TestJobCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.job_cache = JobCache(os.path.join(self.tmp_dir, "job_output", "job_cache"), "key")
+        self.step = TestStep("bwa_mem_picard_sort_sam")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_file(self, name, content):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'w') as file:
+            file.write(content)
+        # Refresh cached stats as a new pipeline run would see them
+        stat_cache.set(path, os.lstat(path))
+        return path
+
+    # Create and cache step jobs planned from the content of a file, as the number of chunks of a readset
+    def create_jobs(self, path):
+        stat_cache.start_recording()
+        stat_cache.isfile(path)
+        stat_cache.record_content(path)
+        nb_chunks = stat_cache.stat(path).st_size // 10
+        jobs = [Job(name="bwa_mem_picard_sort_sam.readset.chunk" + str(chunk_idx), command="bwa mem") for chunk_idx in range(nb_chunks)]
+        self.job_cache.save(self.step, jobs, stat_cache.stop_recording(), [])
+        return jobs
+
+    def test_planning_file_unchanged(self):
+        fastq = self.write_file("readset.fastq", "A" * 30)
+        self.create_jobs(fastq)
+        self.assertEqual([job.name for job in self.job_cache.load(self.step, None)], ["bwa_mem_picard_sort_sam.readset.chunk" + str(chunk_idx) for chunk_idx in range(3)])
+
+    def test_planning_file_size_changed(self):
+        fastq = self.write_file("readset.fastq", "A" * 30)
+        self.create_jobs(fastq)
+        # Still a file, but larger
+        self.write_file("readset.fastq", "A" * 50)
+        self.assertEqual(self.job_cache.load(self.step, None), None)
+
+    def test_planning_file_mtime_changed(self):
+        partition_file = self.write_file("partitions.tsv", "0\tchr1")
+        self.create_jobs(partition_file)
+        os.utime(partition_file, (0, 0))
+        stat_cache.set(partition_file, os.lstat(partition_file))
+        self.assertEqual(self.job_cache.load(self.step, None), None)
+
+    def test_planning_file_removed(self):
+        bam_index = self.write_file("readset.bam.bai", "BAI\1" + "\0" * 40)
+        self.create_jobs(bam_index)
+        os.remove(bam_index)
+        stat_cache.set(bam_index, None)
+        self.assertEqual(self.job_cache.load(self.step, None), None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+################################################################################
+# Copyright (C) 2014, 2015 GenAP, McGill University and Genome Quebec Innovation Centre
+#
+# This file is part of MUGQIC Pipelines.
+#
+# MUGQIC Pipelines is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUGQIC Pipelines is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with MUGQIC Pipelines.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+# Python Standard Modules
+import os
+import StringIO
+import sys
+import unittest
+
+# Append mugqic_pipelines directory to Python library path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# MUGQIC Modules
+from core.config import *
+from core.critical_path import *
+from core.job import *
+from core.resource_sizing import *
+from core.scheduler import *
+
+CONFIG = """\
+[DEFAULT]
+cluster_walltime=-l walltime=24:00:0
+cluster_cpu=-l nodes=1:ppn=1
+
+[trimmomatic]
+cluster_walltime=-l walltime=2:00:0
+estimated_runtime=0:30:00
+
+[slurm_job]
+cluster_walltime=--time=2:00:00
+"""
+
+# Pipeline attributes used by schedulers
+class TestPipeline(object):
+
+    def __init__(self, resource_sizing=None):
+        self.resource_sizing = resource_sizing
+        self.output_dir = "/out"
+
+# Resource sizing with fixed (memory bytes, walltime seconds) of each job name
+class TestResourceSizing(ResourceSizing):
+
+    def __init__(self, job_resources):
+        self._job_resources = {}
+        self._sized_jobs = job_resources
+
+    def job_resources(self, job):
+        if job.name in self._sized_jobs:
+            return self._sized_jobs[job.name]
+        return ResourceSizing.job_resources(self, job)
+
+class TestJobPacking(unittest.TestCase):
+
+    def setUp(self):
+        for section in config.sections():
+            config.remove_section(section)
+        config.defaults().clear()
+        config.parse_files([StringIO.StringIO(CONFIG)], check_modules=False)
+
+    # Return a packed job of jobs with the given name prefix
+    def packed_job(self, job_name_prefix, nb_jobs):
+        jobs = [Job(name=job_name_prefix + "." + str(idx), command="command" + str(idx)) for idx in range(nb_jobs)]
+        for job in jobs:
+            job.done = os.path.join("job_output", job.name + ".mugqic.done")
+        return pack_jobs(jobs, job_name_prefix + ".pack1")
+
+    def test_packed_job_walltime(self):
+        packed_job = self.packed_job("trimmomatic", 3)
+        # Packed jobs run one after the other, hence need the sum of their walltimes
+        self.assertEqual(job_walltime(TestPipeline(), packed_job), 3 * 7200)
+        self.assertEqual(job_walltime(TestPipeline(), packed_job.packed_jobs[0]), 7200)
+        self.assertEqual(job_estimated_runtime(packed_job), 3 * 1800)
+
+    def test_packed_job_sized_walltime(self):
+        packed_job = self.packed_job("trimmomatic", 3)
+        resource_sizing = TestResourceSizing({
+            "trimmomatic.0": (2 * 1024 ** 3, 600),
+            "trimmomatic.1": (4 * 1024 ** 3, 900),
+            "trimmomatic.2": (1024 ** 3, 300)
+        })
+        self.assertEqual(resource_sizing.job_resources(packed_job), (4 * 1024 ** 3, 1800))
+        self.assertEqual(job_walltime(TestPipeline(resource_sizing), packed_job), 1800)
+
+        # Jobs without history keep their cluster_walltime
+        resource_sizing = TestResourceSizing({"trimmomatic.0": (None, 600), "trimmomatic.1": (None, None), "trimmomatic.2": (None, 300)})
+        self.assertEqual(resource_sizing.job_resources(packed_job), (None, None))
+        self.assertEqual(job_walltime(TestPipeline(resource_sizing), packed_job), 600 + 7200 + 300)
+
+    def test_slurm_submit_options(self):
+        self.assertTrue("--time=06:00:00" in SlurmScheduler().submit_options(TestPipeline(), self.packed_job("slurm_job", 3)))
+        self.assertTrue("--time=02:00:00" in SlurmScheduler().submit_options(TestPipeline(), self.packed_job("slurm_job", 1).packed_jobs[0]))
+
+    def test_format_cluster_walltime(self):
+        self.assertEqual(format_cluster_walltime("-l walltime=2:00:0", 3 * 7200), "-l walltime=6:00:00")
+        self.assertEqual(format_cluster_walltime("--time=2:00:00", 3 * 86400), "--time=3-00:00:00")
+
+if __name__ == '__main__':
+    unittest.main()
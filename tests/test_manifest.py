@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+################################################################################
+# Copyright (C) 2014, 2015 GenAP, McGill University and Genome Quebec Innovation Centre
+#
+# This file is part of MUGQIC Pipelines.
+#
+# MUGQIC Pipelines is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUGQIC Pipelines is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with MUGQIC Pipelines.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+# Python Standard Modules
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+# Append mugqic_pipelines directory to Python library path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# MUGQIC Modules
+from core.manifest import *
+from core.stat_cache import *
+from utils.up2date_checksums import write_record
+
+class TestManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_file(self, name, content):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'wb') as file:
+            file.write(content)
+        return path
+
+    # Set file modification times, as a copy or a restore without preserving them would, and refresh cached stats
+    # as a new pipeline run would see them
+    def touch(self, paths, mtime):
+        for path in paths:
+            os.utime(path, (mtime, mtime))
+            stat_cache.set(path, os.lstat(path))
+
+    def test_content_checksum(self):
+        path = self.write_file("small.txt", "ACGT" * 1000)
+        self.assertEqual(content_checksum(path), hashlib.md5("ACGT" * 1000).hexdigest())
+
+    def test_sampled_content_checksum(self):
+        content = bytearray(NB_SAMPLE_BLOCKS * SAMPLE_BLOCK_SIZE + SAMPLE_BLOCK_SIZE // 2)
+        path = self.write_file("large.bam", str(content))
+        checksum = content_checksum(path, full_checksum_max_size=0)
+        self.assertNotEqual(checksum, content_checksum(path))
+
+        # First and last blocks are always sampled
+        content[0] = 1
+        self.assertNotEqual(content_checksum(self.write_file("large.bam", str(content)), full_checksum_max_size=0), checksum)
+        content[0] = 0
+        content[-1] = 1
+        self.assertNotEqual(content_checksum(self.write_file("large.bam", str(content)), full_checksum_max_size=0), checksum)
+        content[-1] = 0
+        # So is the file size
+        self.assertNotEqual(content_checksum(self.write_file("large.bam", str(content + "\0")), full_checksum_max_size=0), checksum)
+
+    def test_checksum_record(self):
+        input_file = self.write_file("input.txt", "input")
+        output_file = self.write_file("output.txt", "output")
+        done_file = os.path.join(self.tmp_dir, "job.mugqic.done")
+
+        # Job writes its checksum record when it succeeds, then its .done file
+        write_record(checksum_record(done_file), [input_file, output_file, os.path.join(self.tmp_dir, "missing.txt")])
+        self.write_file("job.mugqic.done", "")
+        self.touch([input_file, output_file, checksum_record(done_file)], time.time() - 100)
+        self.touch([done_file], time.time() - 50)
+
+        # Files are copied without their modification times before any new pipeline run: outputs are older than inputs
+        self.touch([input_file], time.time())
+        self.touch([output_file], time.time() - 200)
+        manifest = Manifest(os.path.join(self.tmp_dir, "job_output", "up2date_manifest.sqlite"))
+        is_up2date_by_mtime = lambda: False
+        self.assertTrue(manifest.is_up2date(done_file, [input_file, output_file], is_up2date_by_mtime))
+        self.assertTrue(manifest.is_up2date(done_file, [input_file, output_file], is_up2date_by_mtime))
+
+        # Content change
+        self.write_file("input.txt", "changed")
+        self.touch([input_file], time.time())
+        self.assertFalse(manifest.is_up2date(done_file, [input_file, output_file], is_up2date_by_mtime))
+        manifest.close()
+
+    def test_incomplete_checksum_record(self):
+        input_file = self.write_file("input.txt", "input")
+        output_file = self.write_file("output.txt", "output")
+        done_file = self.write_file("job.mugqic.done", "")
+        write_record(checksum_record(done_file), [input_file])
+        self.touch([input_file, output_file, checksum_record(done_file), done_file], time.time())
+
+        # Without a record of all job files, the modification time check is used
+        manifest = Manifest(os.path.join(self.tmp_dir, "job_output", "up2date_manifest.sqlite"))
+        self.assertFalse(manifest.is_up2date(done_file, [input_file, output_file], lambda: False))
+        self.assertTrue(manifest.is_up2date(done_file, [input_file, output_file], lambda: True))
+        manifest.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+################################################################################
+# Copyright (C) 2014, 2015 GenAP, McGill University and Genome Quebec Innovation Centre
+#
+# This file is part of MUGQIC Pipelines.
+#
+# MUGQIC Pipelines is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUGQIC Pipelines is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with MUGQIC Pipelines.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+# Python Standard Modules
+import os
+import sys
+import unittest
+
+# Append mugqic_pipelines directory to Python library path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# MUGQIC Modules
+from core.scatter_gather import *
+
+class TestScatterGather(unittest.TestCase):
+
+    def test_shard_file(self):
+        self.assertEqual(shard_file("alignment/sample/sample.sorted.bam", 3), "alignment/sample/sample.sorted.shard3.bam")
+        self.assertEqual(shard_file("variants/allSamples", 0), "variants/allSamples.shard0")
+
+    def test_scatter_gather_jobs(self):
+        shards = ["chr1", "chr2", "chr3"]
+        scatter = lambda shard_idx, shard: Job(["input.bam"], [shard_file("output.bam", shard_idx)], command="process " + shard)
+        gather = lambda shard_jobs: Job([output_file for shard_job in shard_jobs for output_file in shard_job.output_files], ["output.bam"], command="gather")
+
+        jobs = scatter_gather_jobs("process", shards, scatter, gather, "gather")
+        self.assertEqual([job.name for job in jobs], ["process.0", "process.1", "process.2", "gather"])
+        self.assertEqual(jobs[-1].input_files, ["output.shard0.bam", "output.shard1.bam", "output.shard2.bam"])
+        # Only the gathered output is kept
+        self.assertEqual([job.removable_files for job in jobs], [["output.shard0.bam"], ["output.shard1.bam"], ["output.shard2.bam"], []])
+
+    def test_scatter_gather_no_shards(self):
+        self.assertRaises(Exception, scatter_gather_jobs, "process", [], None, None, "gather")
+
+    def test_merge_tree_levels(self):
+        self.assertEqual(merge_tree_levels(1, 100), [[1]])
+        self.assertEqual(merge_tree_levels(100, 100), [[100]])
+        self.assertEqual(merge_tree_levels(3000, 100), [[55] * 30 + [54] * 25, [55]])
+
+        for max_fan_in in [2, 3, 10, 100]:
+            for nb_inputs in range(1, 1000, 7):
+                levels = merge_tree_levels(nb_inputs, max_fan_in)
+                # Each level merges all outputs of the previous level down to one file
+                nb_level_inputs = nb_inputs
+                for group_sizes in levels:
+                    self.assertEqual(sum(group_sizes), nb_level_inputs)
+                    self.assertTrue(max(group_sizes) <= max_fan_in)
+                    self.assertTrue(max(group_sizes) - min(group_sizes) <= 1)
+                    nb_level_inputs = len(group_sizes)
+                self.assertEqual(nb_level_inputs, 1)
+                # Minimal number of levels
+                self.assertTrue(max_fan_in ** (len(levels) - 1) < nb_inputs or len(levels) == 1)
+
+    def test_merge_tree_levels_invalid(self):
+        self.assertRaises(Exception, merge_tree_levels, 0, 100)
+        self.assertRaises(Exception, merge_tree_levels, 10, 1)
+
+    def test_merge_tree_jobs(self):
+        inputs = ["input" + str(idx) + ".g.vcf.gz" for idx in range(10)]
+        merge = lambda merge_inputs, merge_output: Job(merge_inputs, [merge_output], command="merge")
+        intermediate_file = lambda level, group_idx: "merged.level" + str(level) + "." + str(group_idx) + ".g.vcf.gz"
+
+        jobs = merge_tree_jobs("merge", inputs, "merged.g.vcf.gz", merge, 3, intermediate_file)
+        self.assertEqual([job.name for job in jobs], ["merge.level0." + str(idx) for idx in range(4)] + ["merge.level1." + str(idx) for idx in range(2)] + ["merge"])
+        self.assertEqual(jobs[-1].output_files, ["merged.g.vcf.gz"])
+        self.assertEqual(jobs[-1].removable_files, [])
+
+        # Each input and intermediate file is merged exactly once, and intermediate files are removable
+        merged_files = sorted([input_file for job in jobs for input_file in job.input_files])
+        intermediate_files = [output_file for job in jobs[:-1] for output_file in job.output_files]
+        self.assertEqual(merged_files, sorted(inputs + intermediate_files))
+        self.assertEqual([removable_file for job in jobs[:-1] for removable_file in job.removable_files], intermediate_files)
+
+if __name__ == '__main__':
+    unittest.main()
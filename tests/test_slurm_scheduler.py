@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+################################################################################
+# Copyright (C) 2014, 2015 GenAP, McGill University and Genome Quebec Innovation Centre
+#
+# This file is part of MUGQIC Pipelines.
+#
+# MUGQIC Pipelines is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUGQIC Pipelines is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with MUGQIC Pipelines.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+# Python Standard Modules
+import os
+import StringIO
+import sys
+import unittest
+
+# Append mugqic_pipelines directory to Python library path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# MUGQIC Modules
+from core.config import *
+from core.job import *
+from core.scheduler import *
+
+CONFIG = """\
+[DEFAULT]
+cluster_walltime=--time=2:00:00
+cluster_cpu=--cpus-per-task=1
+"""
+
+# Pipeline and step attributes used by SlurmScheduler.step_arrays()
+class TestPipeline(object):
+
+    def __init__(self):
+        self.resource_sizing = None
+
+class TestStep(object):
+
+    def __init__(self, jobs):
+        self.jobs = jobs
+
+class TestSlurmScheduler(unittest.TestCase):
+
+    def setUp(self):
+        for section in config.sections():
+            config.remove_section(section)
+        config.defaults().clear()
+        config.parse_files([StringIO.StringIO(CONFIG)], check_modules=False)
+
+    # Return a job depending on the given jobs
+    def job(self, name, dependency_jobs=[]):
+        job = Job(name=name, command=name)
+        job.dependency_jobs = dependency_jobs
+        return job
+
+    # Return step arrays as lists of job names, checking that each array only depends on arrays submitted before it
+    def step_arrays(self, jobs, max_array_size=1000):
+        arrays = [array for submit_options, array in SlurmScheduler().step_arrays(TestPipeline(), TestStep(jobs), max_array_size)]
+        for array_index, array in enumerate(arrays):
+            for job in array:
+                for dependency_job in job.dependency_jobs:
+                    self.assertTrue([previous_array for previous_array in arrays[:array_index] if dependency_job in previous_array], job.name + " depends on " + dependency_job.name + " submitted later")
+        return [[job.name for job in array] for array in arrays]
+
+    def test_independent_jobs(self):
+        jobs = [self.job("a." + str(idx)) for idx in range(3)] + [self.job("b." + str(idx)) for idx in range(2)]
+        self.assertEqual(self.step_arrays(jobs), [["a.0", "a.1", "a.2"], ["b.0", "b.1"]])
+        self.assertEqual(self.step_arrays(jobs, max_array_size=2), [["a.0", "a.1"], ["a.2"], ["b.0", "b.1"]])
+
+    def test_dependency_in_same_array(self):
+        a0 = self.job("a.0")
+        a1 = self.job("a.1", [a0])
+        self.assertEqual(self.step_arrays([a0, a1]), [["a.0"], ["a.1"]])
+
+    def test_chain_across_arrays(self):
+        # a.1 depends on b.0, whose array is created after the array of a.0
+        a0 = self.job("a.0")
+        b0 = self.job("b.0", [a0])
+        a1 = self.job("a.1", [b0])
+        b1 = self.job("b.1", [a1])
+        a2 = self.job("a.2")
+        self.assertEqual(self.step_arrays([a0, b0, a1, b1, a2]), [["a.0"], ["b.0"], ["a.1", "a.2"], ["b.1"]])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+
+################################################################################
+# Copyright (C) 2014, 2015 GenAP, McGill University and Genome Quebec Innovation Centre
+#
+# This file is part of MUGQIC Pipelines.
+#
+# MUGQIC Pipelines is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUGQIC Pipelines is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with MUGQIC Pipelines.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+
+# Benchmark job graph construction (config parsing, job creation and job submission script output) of pipelines
+# on synthetic projects of increasing sizes, with file system checks stubbed out and all jobs forced.
+# Each pipeline and project size is run in a separate Python process so that peak memory is measured per run.
+#
+# Results are written as one JSON object per run, and compared with a previous results file if given.
+#
+# With --config-param-jobs, Config.param() per-call cost is measured instead, with the lookups made for each job
+# of a job graph of the given size: "original" is the lookup path before memoization (section fallback checked
+# and file paths stat'ed on each call), "evaluated" the current unmemoized lookup (precomputed section fallback
+# and stat cache), "memoized" the current Config.param().
+#
+# Usage example:
+# $ python utils/benchmark_pipelines.py -p dnaseq rnaseq -n 10 100 -o benchmark.json
+# $ python utils/benchmark_pipelines.py -p dnaseq rnaseq -n 10 100 -b benchmark.json
+# $ python utils/benchmark_pipelines.py --config-param-jobs 100000
+
+import argparse
+import imp
+import json
+import logging
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+log = logging.getLogger(__name__)
+
+mugqic_pipelines_home = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Pipeline name -> (pipeline script, pipeline class name, config files relative to pipeline directory, use design file)
+pipelines = {
+    'dnaseq': ("dnaseq/dnaseq.py", "DnaSeq", ["dnaseq.base.ini"], False),
+    'rnaseq': ("rnaseq/rnaseq.py", "RnaSeq", ["rnaseq.base.ini"], True),
+    'chipseq': ("chipseq/chipseq.py", "ChipSeq", ["chipseq.base.ini"], True),
+    'episeq': ("episeq/episeq.py", "EpiSeq", ["example/episeq.ini"], True)
+}
+
+# Human-like sequence dictionary: 25 main chromosomes plus unplaced contigs, which matter for steps scattered by chromosome
+chromosomes = [(str(i), 250000000 - i * 8000000) for i in range(1, 23)] + [("X", 155270560), ("Y", 59373566), ("MT", 16569)] + \
+    [("GL0002%02d.1" % i, 40000 + i * 1000) for i in range(59)]
+
+def create_project(pipeline_name, nb_samples, project_dir):
+    nb_readsets_per_sample = 2
+
+    with open(os.path.join(project_dir, "readsets.tsv"), 'w') as readset_file:
+        readset_file.write("\t".join(["Sample", "Readset", "Library", "RunType", "Run", "Lane", "Adapter1", "Adapter2", "QualityOffset", "BED", "FASTQ1", "FASTQ2", "BAM"]) + "\n")
+        for sample_index in range(nb_samples):
+            for lane in range(1, nb_readsets_per_sample + 1):
+                readset_name = "S" + str(sample_index) + "_L" + str(lane)
+                readset_file.write("\t".join(["S" + str(sample_index), readset_name, "lib" + str(sample_index), "PAIRED_END", "1000", str(lane), "AGATCGGAAGAGCACACGTCTGAACTCCAGTCA", "AGATCGGAAGAGCGTCGTGTAGGGAAAGAGTGT", "33", "", "raw_reads/" + readset_name + ".R1.fastq.gz", "raw_reads/" + readset_name + ".R2.fastq.gz", ""]) + "\n")
+
+    # Two contrasts: half of the samples as controls and the other half as treatments, then the reverse
+    contrast_names = ["c1,N", "c2,B"] if pipeline_name == "chipseq" else ["c1", "c2"]
+    with open(os.path.join(project_dir, "design.tsv"), 'w') as design_file:
+        design_file.write("\t".join(["Sample"] + contrast_names) + "\n")
+        for sample_index in range(nb_samples):
+            design_file.write("\t".join(["S" + str(sample_index), str(1 + sample_index % 2), str(2 - sample_index % 2)]) + "\n")
+
+    with open(os.path.join(project_dir, "genome.dict"), 'w') as dictionary_file:
+        dictionary_file.write("@HD\tVN:1.0\tSO:unsorted\n")
+        for name, length in chromosomes:
+            dictionary_file.write("@SQ\tSN:" + name + "\tLN:" + str(length) + "\n")
+
+    with open(os.path.join(project_dir, "genome.fa.fai"), 'w') as index_file:
+        offset = 0
+        for name, length in chromosomes:
+            index_file.write("\t".join([name, str(length), str(offset), "60", "61"]) + "\n")
+            offset += length + length / 60 + 1
+
+    with open(os.path.join(project_dir, "benchmark.ini"), 'w') as config_file:
+        config_file.write("[DEFAULT]\n")
+        config_file.write("genome_dictionary=" + os.path.join(project_dir, "genome.dict") + "\n")
+        config_file.write("genome_fasta=" + os.path.join(project_dir, "genome.fa") + "\n")
+        # Required by PBS scheduler but not defined in base config files
+        config_file.write("cluster_mem=\n")
+
+# Run the given pipeline on a project created in project_dir, and return its benchmark results
+def run_pipeline(pipeline_name, nb_samples, project_dir):
+    create_project(pipeline_name, nb_samples, project_dir)
+    pipeline_script, pipeline_class_name, config_files, use_design = pipelines[pipeline_name]
+    pipeline_dir = os.path.join(mugqic_pipelines_home, "pipelines", os.path.dirname(pipeline_script))
+
+    sys.path.insert(0, mugqic_pipelines_home)
+    import core.config
+    import core.pipeline
+    import core.scheduler
+    from core.stat_cache import stat_cache
+
+    # Stub out file system checks: all files exist, and prefix paths match themselves
+    stat_cache.exists = stat_cache.isfile = stat_cache.isdir = lambda path: True
+    stat_cache.glob = lambda pattern: [pattern]
+    stat_cache.prefetch = lambda paths, nb_threads=16: None
+
+    phases = {}
+    script = open(os.path.join(project_dir, "script.sh"), 'w')
+
+    # Time the given method of the given class as a phase
+    def time_phase(phase, cls, method_name):
+        method = getattr(cls, method_name)
+        def timed_method(self, *args, **kwargs):
+            start_time = time.time()
+            start_size = script.tell()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                script.flush()
+                phases[phase] = {
+                    'wall_time': round(time.time() - start_time, 3),
+                    'peak_memory_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                    'script_bytes': script.tell() - start_size
+                }
+        setattr(cls, method_name, timed_method)
+
+    time_phase('parse_config', core.config.Config, 'parse_files')
+    time_phase('create_jobs', core.pipeline.Pipeline, 'create_jobs')
+    time_phase('submit_jobs', core.scheduler.PBSScheduler, 'submit')
+
+    pipeline_module = imp.load_source("benchmark_" + pipeline_name, os.path.join(mugqic_pipelines_home, "pipelines", pipeline_script))
+    pipeline_class = getattr(pipeline_module, pipeline_class_name)
+
+    # Step list does not depend on instance initialization
+    nb_steps = len(pipeline_class.__new__(pipeline_class).steps)
+    sys.argv = [pipeline_script,
+        "-c"] + [os.path.join(pipeline_dir, config_file) for config_file in config_files] + [os.path.join(project_dir, "benchmark.ini"),
+        "-r", os.path.join(project_dir, "readsets.tsv"),
+        "-s", "1-" + str(nb_steps),
+        "-o", os.path.join(project_dir, "output"),
+        "-j", "pbs",
+        "-l", "warning",
+        "--force",
+        "--skip-module-check"
+    ] + (["-d", os.path.join(project_dir, "design.tsv")] if use_design else [])
+
+    start_time = time.time()
+    stdout = sys.stdout
+    sys.stdout = script
+    try:
+        pipeline = pipeline_class()
+    finally:
+        sys.stdout = stdout
+        script.close()
+
+    return {
+        'pipeline': pipeline_name,
+        'samples': nb_samples,
+        'readsets': len(pipeline.readsets),
+        'steps': nb_steps,
+        'jobs': len(pipeline.jobs),
+        'wall_time': round(time.time() - start_time, 3),
+        'peak_memory_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'script_bytes': os.path.getsize(os.path.join(project_dir, "script.sh")),
+        'phases': phases
+    }
+
+# Run a benchmark in a child Python process, then return its results
+def benchmark(pipeline_name, nb_samples, work_dir):
+    project_dir = tempfile.mkdtemp(prefix=pipeline_name + "_" + str(nb_samples) + "_", dir=work_dir)
+    result_file = os.path.join(project_dir, "result.json")
+    try:
+        subprocess.check_call([sys.executable, os.path.abspath(__file__), "--run", pipeline_name, str(nb_samples), project_dir, result_file])
+        with open(result_file) as result:
+            return json.load(result)
+    finally:
+        shutil.rmtree(project_dir)
+
+# Measure Config.param() per-call cost with the lookups made for each job by PBSScheduler.submit(), i.e. 9 cluster settings
+# of the job name prefix section, plus one file path lookup as made by bfx wrappers, on nb_jobs jobs cycling over
+# dnaseq config sections. Values are either memoized by param() or evaluated on each call by evaluate_param(),
+# which interpolates and converts values like param() did before memoization.
+# Config.param() lookup path before memoization, for the 'string' and 'filepath' types used by the benchmark
+# (the type checks of other types, a few string comparisons per call, are left out)
+def original_config_param(config, section, option, required=True, type='string'):
+    if not config.has_section(section):
+        section = 'DEFAULT'
+    if config.has_option(section, option):
+        value = config.get(section, option)
+        if type == 'filepath':
+            value = os.path.expandvars(value)
+            if not os.path.isfile(value):
+                raise Exception("File path \"" + value + "\" does not exist or is not a valid regular file!")
+        return value
+    elif required:
+        raise Exception("Error: parameter \"[" + section + "] " + option + "\" is not defined in config file(s)!")
+    else:
+        return ""
+
+def benchmark_config_param(nb_jobs, work_dir):
+    project_dir = tempfile.mkdtemp(prefix="config_param_", dir=work_dir)
+    try:
+        create_project("dnaseq", 1, project_dir)
+
+        sys.path.insert(0, mugqic_pipelines_home)
+        from core.config import config
+        config.parse_files([open(os.path.join(mugqic_pipelines_home, "pipelines", "dnaseq", "dnaseq.base.ini")), open(os.path.join(project_dir, "benchmark.ini"))], check_modules=False)
+
+        job_name_prefixes = config.sections()
+        cluster_options = ['cluster_walltime', 'cluster_mem', 'cluster_submit_cmd', 'cluster_other_arg', 'cluster_work_dir_arg', 'cluster_output_dir_arg', 'cluster_job_name_arg', 'cluster_queue', 'cluster_cpu']
+
+        result = {'benchmark': 'config_param', 'jobs': nb_jobs, 'calls': nb_jobs * (len(cluster_options) + 1)}
+        for mode, lookup in [('original', lambda *args, **kwargs: original_config_param(config, *args, **kwargs)), ('evaluated', config.evaluate_param), ('memoized', config.param)]:
+            start_time = time.time()
+            for job_idx in xrange(nb_jobs):
+                job_name_prefix = job_name_prefixes[job_idx % len(job_name_prefixes)]
+                for cluster_option in cluster_options:
+                    lookup(job_name_prefix, cluster_option)
+                lookup('DEFAULT', 'genome_dictionary', type='filepath')
+            wall_time = time.time() - start_time
+            result[mode + '_wall_time'] = round(wall_time, 3)
+            result[mode + '_us_per_call'] = round(wall_time * 1000000 / result['calls'], 3)
+        return result
+    finally:
+        shutil.rmtree(project_dir)
+
+# Compare results with baseline ones; return the list of regression messages for wall time or peak memory
+def regressions(results, baseline_results, tolerance):
+    baseline = dict([((result['pipeline'], result['samples']), result) for result in baseline_results])
+    messages = []
+    for result in results:
+        baseline_result = baseline.get((result['pipeline'], result['samples']))
+        if baseline_result:
+            for metric in ['wall_time', 'peak_memory_kb', 'script_bytes']:
+                if result[metric] > baseline_result[metric] * (1 + tolerance):
+                    messages.append(result['pipeline'] + " " + str(result['samples']) + " samples: " + metric + " " + str(result[metric]) + " > baseline " + str(baseline_result[metric]))
+    return messages
+
+if __name__ == '__main__':
+    # Child process mode
+    if len(sys.argv) == 6 and sys.argv[1] == "--run":
+        logging.basicConfig(level=logging.WARNING)
+        pipeline_name, nb_samples, project_dir, result_path = sys.argv[2:]
+        result = run_pipeline(pipeline_name, int(nb_samples), project_dir)
+        with open(result_path, 'w') as result_file:
+            json.dump(result, result_file)
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="Benchmark pipeline job creation and submission script generation on synthetic projects")
+    parser.add_argument("-p", "--pipelines", help="pipelines to benchmark (default: all)", nargs="+", choices=sorted(pipelines.keys()), default=["dnaseq", "rnaseq", "chipseq", "episeq"])
+    parser.add_argument("-n", "--samples", help="numbers of samples of synthetic projects (default: 10 100 1000 10000)", nargs="+", type=int, default=[10, 100, 1000, 10000])
+    parser.add_argument("-w", "--work-dir", help="directory where synthetic projects are created then removed (default: system temporary directory)")
+    parser.add_argument("-o", "--output", help="results file, one JSON object per line (default: standard output)", type=argparse.FileType('w'), default=sys.stdout)
+    parser.add_argument("-b", "--baseline", help="previous results file to compare with; exit with status 1 if any wall time, peak memory or script size regresses", type=file)
+    parser.add_argument("-t", "--tolerance", help="relative increase over baseline values reported as a regression (default: 0.2)", type=float, default=0.2)
+    parser.add_argument("-l", "--log", help="log level (default: info)", choices=["debug", "info", "warning", "error", "critical"], default="info")
+    parser.add_argument("--config-param-jobs", help="benchmark Config.param() per-call cost on a job graph of this number of jobs instead of pipelines", type=int)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=getattr(logging, args.log.upper()))
+
+    if args.config_param_jobs:
+        log.info("Benchmark Config.param() with " + str(args.config_param_jobs) + " jobs...")
+        result = benchmark_config_param(args.config_param_jobs, args.work_dir)
+        log.info("  " + str(result['calls']) + " calls: " + "%.3f" % result['original_us_per_call'] + " us/call original, " + "%.3f" % result['evaluated_us_per_call'] + " us/call evaluated, " + "%.3f" % result['memoized_us_per_call'] + " us/call memoized")
+        args.output.write(json.dumps(result, sort_keys=True) + "\n")
+        sys.exit(0)
+
+    results = []
+    for pipeline_name in args.pipelines:
+        for nb_samples in args.samples:
+            log.info("Benchmark " + pipeline_name + " with " + str(nb_samples) + " sample" + ("s" if nb_samples > 1 else "") + "...")
+            result = benchmark(pipeline_name, nb_samples, args.work_dir)
+            log.info("  " + str(result['jobs']) + " jobs, " + "%.3f" % result['wall_time'] + "s, " + "%.1f" % (result['peak_memory_kb'] / 1024.0) + "M peak memory, " + str(result['script_bytes']) + " script bytes (" + ", ".join([phase + ": " + "%.3f" % result['phases'][phase]['wall_time'] + "s" for phase in ['parse_config', 'create_jobs', 'submit_jobs'] if phase in result['phases']]) + ")")
+            args.output.write(json.dumps(result, sort_keys=True) + "\n")
+            args.output.flush()
+            results.append(result)
+
+    if args.baseline:
+        messages = regressions(results, [json.loads(line) for line in args.baseline if line.strip()], args.tolerance)
+        for message in messages:
+            log.error("Regression: " + message)
+        if messages:
+            sys.exit(1)
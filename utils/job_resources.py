@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+
+################################################################################
+# Copyright (C) 2014, 2015 GenAP, McGill University and Genome Quebec Innovation Centre
+#
+# This file is part of MUGQIC Pipelines.
+#
+# MUGQIC Pipelines is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUGQIC Pipelines is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with MUGQIC Pipelines.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+# Job resource accounting.
+#
+# "run" mode runs a job command read from standard input in a bash subprocess, then writes a JSON record of
+# its resource usage: start and end times, exit status, user and system CPU times, peak memory, bytes read and
+# written, total size of job input files before the job and size of each job output file after the job,
+# including directory contents, along with their total.
+#
+# Peak memory of the job, max_rss_bytes, is the larger of:
+# - max_tree_rss_bytes: the peak total RSS of the job process tree, sampled from /proc while the job runs,
+#   e.g. bwa and Picard processes of "bwa mem | java -jar SortSam.jar" together; memory peaks shorter than the
+#   sampling interval may be missed, and shared pages are counted once per process
+# - max_process_rss_bytes: the peak RSS of the largest single job process, from wait4() resource usage
+# Bytes read and written are storage I/O from the read_bytes and write_bytes counters of /proc/self/io, which include
+# waited children on Linux. Unlike rchar and wchar, they do not count data piped between job commands,
+# but they do not count reads served from the page cache either.
+# Schedulers wrap job commands in this mode when "[DEFAULT] resource_accounting=true" is set; the record
+# is written next to the job .done file with a ".resources" extension instead of ".done".
+#
+# "collect" mode aggregates all records of a pipeline output directory into a TSV file, one line per step,
+# or one line per job record with --jobs.
+#
+# Usage example:
+# $ python utils/job_resources.py collect /path/to/output_dir > resources.tsv
+
+import argparse
+import datetime
+import errno
+import glob
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+# Return I/O counters of this process and its waited children as a dict, empty if /proc/self/io is unavailable
+def read_io():
+    io = {}
+    try:
+        with open("/proc/self/io") as io_file:
+            for line in io_file:
+                key, value = line.split(":")
+                io[key.strip()] = int(value)
+    except (IOError, ValueError):
+        pass
+    return io
+
+# Return the total RSS in bytes of a process and all its descendants, 0 if /proc is unavailable
+def process_tree_rss(root_pid):
+    children = {}
+    rss_pages = {}
+    for pid in os.listdir("/proc"):
+        if pid.isdigit():
+            try:
+                with open(os.path.join("/proc", pid, "stat")) as stat_file:
+                    # Fields after the command name, which is in parentheses and may contain spaces
+                    fields = stat_file.read().rsplit(")", 1)[1].split()
+            except (IOError, IndexError):
+                # Process exited meanwhile
+                continue
+            children.setdefault(int(fields[1]), []).append(int(pid))
+            rss_pages[int(pid)] = int(fields[21])
+
+    rss = 0
+    pids = [root_pid]
+    while pids:
+        pid = pids.pop()
+        rss += rss_pages.get(pid, 0) * os.sysconf("SC_PAGE_SIZE")
+        pids.extend(children.get(pid, []))
+    return rss
+
+# Return total size in bytes of existing files, with directory contents if recursive is set
+def files_size(files, recursive=False):
+    size = 0
+    for file in files:
+        try:
+            if os.path.isfile(file):
+                size += os.path.getsize(file)
+            elif recursive and os.path.isdir(file):
+                for dir_path, dir_names, file_names in os.walk(file):
+                    size += sum([os.path.getsize(os.path.join(dir_path, file_name)) for file_name in file_names if os.path.isfile(os.path.join(dir_path, file_name))])
+        except OSError:
+            pass
+    return size
+
+def run(record_file, job_name, input_files, output_files, sampling_interval=1.0):
+    command = sys.stdin.read()
+
+    input_bytes = files_size(input_files)
+
+    # Wrapper own I/O is subtracted from the job I/O
+    start_io = read_io()
+    start_time = time.time()
+    # Exit with the status of the first command of the last pipeline, like job scheduler templates using $PIPESTATUS
+    process = subprocess.Popen(["bash", "-c", command + "\nexit ${PIPESTATUS[0]}"], stdin=open(os.devnull))
+    # Sample job process tree memory until the job exits
+    max_tree_rss = 0
+    while True:
+        try:
+            pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+        except OSError as e:
+            if e.errno != errno.EINTR:
+                raise
+            continue
+        if pid == process.pid:
+            break
+        max_tree_rss = max(max_tree_rss, process_tree_rss(process.pid))
+        time.sleep(sampling_interval)
+    # Prevent Popen from waiting for a process already waited for
+    process.returncode = status
+    end_time = time.time()
+
+    end_io = read_io()
+    output_files_bytes = [files_size([output_file], recursive=True) for output_file in output_files]
+
+    exit_status = os.WEXITSTATUS(status) if os.WIFEXITED(status) else 128 + os.WTERMSIG(status)
+
+    record = {
+        'job_name': job_name,
+        'hostname': socket.gethostname(),
+        'start': datetime.datetime.fromtimestamp(start_time).strftime("%Y-%m-%dT%H:%M:%S"),
+        'end': datetime.datetime.fromtimestamp(end_time).strftime("%Y-%m-%dT%H:%M:%S"),
+        'exit_status': exit_status,
+        'wall_time': round(end_time - start_time, 3),
+        'user_time': round(rusage.ru_utime, 3),
+        'system_time': round(rusage.ru_stime, 3),
+        'max_rss_bytes': max(max_tree_rss, rusage.ru_maxrss * 1024),
+        'max_tree_rss_bytes': max_tree_rss,
+        # ru_maxrss is in kilobytes on Linux and includes the wrapper memory inherited by the job process at fork
+        'max_process_rss_bytes': rusage.ru_maxrss * 1024,
+        'bytes_read': end_io['read_bytes'] - start_io['read_bytes'] if 'read_bytes' in end_io else None,
+        'bytes_written': end_io['write_bytes'] - start_io['write_bytes'] if 'write_bytes' in end_io else None,
+        'input_bytes': input_bytes,
+        'output_bytes': sum(output_files_bytes),
+        'output_files_bytes': output_files_bytes
+    }
+
+    try:
+        tmp_record_file = record_file + "." + str(os.getpid()) + ".tmp"
+        with open(tmp_record_file, 'w') as tmp_record:
+            json.dump(record, tmp_record, sort_keys=True)
+        os.rename(tmp_record_file, record_file)
+    except (IOError, OSError) as e:
+        sys.stderr.write("Warning: job resource record " + record_file + " could not be written: " + str(e) + "\n")
+
+    return exit_status
+
+# Return all job resource records of an output directory, with their step name, sorted by step then job start time
+def parse_records(output_dir):
+    records = []
+    for record_file in glob.glob(os.path.join(output_dir, "job_output", "*", "*.mugqic.resources")):
+        try:
+            with open(record_file) as record_content:
+                record = json.load(record_content)
+        except (IOError, ValueError):
+            continue
+        record['step'] = os.path.basename(os.path.dirname(record_file))
+        records.append(record)
+    return sorted(records, key=lambda record: (record['step'], record['start']))
+
+job_columns = ['step', 'job_name', 'hostname', 'start', 'end', 'exit_status', 'wall_time', 'user_time', 'system_time', 'max_rss_bytes', 'max_tree_rss_bytes', 'max_process_rss_bytes', 'bytes_read', 'bytes_written', 'input_bytes', 'output_bytes']
+step_columns = ['step', 'jobs', 'failed_jobs', 'total_wall_time', 'max_wall_time', 'total_cpu_time', 'max_rss_bytes', 'total_bytes_read', 'total_bytes_written', 'total_input_bytes', 'total_output_bytes']
+
+def collect(output_dir, output, jobs=False):
+    records = parse_records(output_dir)
+    if jobs:
+        output.write("\t".join(job_columns) + "\n")
+        for record in records:
+            output.write("\t".join([str(record.get(column, "")) for column in job_columns]) + "\n")
+    else:
+        steps = []
+        step_records = {}
+        for record in records:
+            if record['step'] not in step_records:
+                steps.append(record['step'])
+                step_records[record['step']] = []
+            step_records[record['step']].append(record)
+
+        output.write("\t".join(step_columns) + "\n")
+        for step in steps:
+            output.write("\t".join([str(value) for value in [
+                step,
+                len(step_records[step]),
+                len([record for record in step_records[step] if record['exit_status'] != 0]),
+                round(sum([record['wall_time'] for record in step_records[step]]), 3),
+                max([record['wall_time'] for record in step_records[step]]),
+                round(sum([record['user_time'] + record['system_time'] for record in step_records[step]]), 3),
+                max([record['max_rss_bytes'] for record in step_records[step]]),
+                sum([record['bytes_read'] or 0 for record in step_records[step]]),
+                sum([record['bytes_written'] or 0 for record in step_records[step]]),
+                sum([record['input_bytes'] or 0 for record in step_records[step]]),
+                sum([record.get('output_bytes') or 0 for record in step_records[step]])
+            ]]) + "\n")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Job resource accounting")
+    subparsers = parser.add_subparsers(dest="mode")
+
+    run_parser = subparsers.add_parser("run", help="run a job command read from standard input and write its resource usage record")
+    run_parser.add_argument("-r", "--record", help="resource record file", required=True)
+    run_parser.add_argument("-n", "--name", help="job name", required=True)
+    run_parser.add_argument("-i", "--input-files", help="job input files, whose total size is recorded", nargs="*", default=[])
+    run_parser.add_argument("-o", "--output-files", help="job output files, whose total size is recorded", nargs="*", default=[])
+    run_parser.add_argument("-s", "--sampling-interval", help="job process tree memory sampling interval in seconds (default: 1)", type=float, default=1.0)
+
+    collect_parser = subparsers.add_parser("collect", help="aggregate job resource records of a pipeline output directory into a TSV file")
+    collect_parser.add_argument("output_dir", help="pipeline output directory")
+    collect_parser.add_argument("-j", "--jobs", help="write one line per job record instead of one line per step", action="store_true")
+    collect_parser.add_argument("-o", "--output", help="output TSV file (default: standard output)", type=argparse.FileType('w'), default=sys.stdout)
+
+    args = parser.parse_args()
+
+    if args.mode == "run":
+        sys.exit(run(args.record, args.name, args.input_files, args.output_files, args.sampling_interval))
+    else:
+        collect(args.output_dir, args.output, args.jobs)
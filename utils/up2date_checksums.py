@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+################################################################################
+# Copyright (C) 2014, 2015 GenAP, McGill University and Genome Quebec Innovation Centre
+#
+# This file is part of MUGQIC Pipelines.
+#
+# MUGQIC Pipelines is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUGQIC Pipelines is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with MUGQIC Pipelines.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+# Job file checksum record for the "checksum" up-to-date mode (see core/manifest.py).
+#
+# Once a job succeeded, schedulers run this script when --up2date=checksum is set to write the size, modification time
+# and content checksum of each job input and output file in a TSV file next to the job .done file, with a ".checksums"
+# extension instead of ".done". Records are imported in the up-to-date manifest the next time jobs are created,
+# so that jobs stay up to date if their files are touched, restored or copied before any other pipeline run.
+# Missing files are not recorded; directory contents are not checksummed.
+#
+# Usage example:
+# $ python utils/up2date_checksums.py -r job_output/step/job.checksums input.bam output.vcf
+
+import argparse
+import os
+import sys
+
+# Append mugqic_pipelines directory to Python library path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# MUGQIC Modules
+from core.manifest import *
+
+def write_record(record_file, files, full_checksum_max_size=FULL_CHECKSUM_MAX_SIZE):
+    lines = []
+    for file in sorted(set(files)):
+        # Use lstat to be consistent with the up-to-date checks
+        try:
+            file_stat = os.lstat(file)
+            checksum = "directory" if os.path.isdir(file) else content_checksum(file, full_checksum_max_size)
+        except (IOError, OSError):
+            continue
+        lines.append("\t".join([file, str(file_stat.st_size), repr(file_stat.st_mtime), checksum]) + "\n")
+
+    # Write record atomically so that a partial record is never imported
+    with open(record_file + ".tmp", 'w') as record:
+        record.writelines(lines)
+    os.rename(record_file + ".tmp", record_file)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Write a checksum record of job files")
+    parser.add_argument("-r", "--record", help="checksum record file", required=True)
+    parser.add_argument("-m", "--full-checksum-max-size", help="size in bytes up to which files are fully checksummed, larger ones being checksummed from sampled blocks (default: " + str(FULL_CHECKSUM_MAX_SIZE) + ")", type=int, default=FULL_CHECKSUM_MAX_SIZE)
+    parser.add_argument("files", help="job input and output files", nargs="*")
+    args = parser.parse_args()
+
+    write_record(args.record, args.files, args.full_checksum_max_size)